@@ -0,0 +1,1031 @@
+"""
+Performance benchmarks for the Treasure Hunt DQN.
+
+Measures environment, replay, inference and training throughput with fixed
+seeds and writes the results to a JSON file, so runs can be compared and
+regressions caught.
+
+Run from this directory:
+    python benchmarks.py                          # fast suite -> benchmark_results.json
+    python benchmarks.py --only env_steps replay  # selected benchmarks
+    python benchmarks.py --slow                   # add training runs and large datasets
+    python benchmarks.py --compare baseline.json  # flag regressions, exit 1 if any
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from main import MAZE
+from treasure_maze import TreasureMaze
+from maze_solver import clear_solutions, solve
+from maze_generator import generate_maze
+from maze_render import MazeRenderer, to_rgb, write_png
+from game_experience import GameExperience, REPLAY_BACKENDS, make_experience
+from treasure_trainer import TreasureHuntTrainer
+from numpy_inference import NumpyQNetwork
+from distributed_trainer import DistributedTrainer
+from pipelined_trainer import PipelinedTrainer
+from policy_table import PolicyTable
+from inference_server import InferenceClient, InferenceServer, run_load
+from trajectory_dataset import TrajectoryDataset, TrajectoryRecorder
+from maze_corpus import MazeCorpus, generate_corpus
+from corpus_trainer import CorpusTrainer
+from profiling import PROFILERS, Profiler
+
+
+def seed_everything(seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        import tensorflow as tf
+        tf.random.set_seed(seed)
+    except ImportError:
+        pass
+
+
+def fill_experience(exp, qmaze, n_transitions, seed=0):
+    """
+    Populate a replay buffer with random-walk transitions from qmaze.
+    """
+    rng = random.Random(seed)
+    qmaze.reset()
+    envstate = qmaze.observe()
+
+    for _ in range(n_transitions):
+        prev_row, prev_col = qmaze.state
+        action = rng.choice(qmaze.valid_actions())
+        next_state, reward, status = qmaze.act(action, prev_row, prev_col)
+        done = status == "win"
+        exp.remember((envstate, action, reward, next_state, done))
+        envstate = next_state
+
+        if done:
+            qmaze.reset()
+            envstate = qmaze.observe()
+
+    return exp
+
+
+def random_grid(size, wall_fraction=0.3, seed=0):
+    """
+    Random size x size grid with free start and target corners.
+
+    Not guaranteed solvable; only used to measure per-step cost.
+    """
+    rng = np.random.default_rng(seed)
+    grid = (rng.random((size, size)) >= wall_fraction).astype(float)
+    grid[0, 0] = grid[-1, -1] = 1.0
+    return grid
+
+
+def random_walk_rate(qmaze, n_steps, seed=0):
+    """
+    Steps/sec of a random walk over valid actions in qmaze.
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        prev_row, prev_col = qmaze.state
+        action = rng.choice(qmaze.valid_actions())
+        _, _, status = qmaze.act(action, prev_row, prev_col)
+        if status == "win":
+            qmaze.reset()
+    return n_steps / (time.perf_counter() - start)
+
+
+def time_calls(fn, repeats):
+    """
+    Call fn() once to warm up, then return the mean seconds per call.
+    """
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_get_data(batch_size=32, repeats=20, seed=0):
+    """
+    Compare the batched get_data path against the per-sample predict loop.
+    """
+    seed_everything(seed)
+    trainer = TreasureHuntTrainer(MAZE)
+    model = trainer.build_model()
+    target_model = trainer.build_model()
+
+    exp = fill_experience(GameExperience(max_memory=5000, discount=0.95),
+                          TreasureMaze(MAZE), n_transitions=5000, seed=seed)
+
+    per_sample = time_calls(
+        lambda: exp.get_data_per_sample(model, target_model, batch_size), max(1, repeats // 5))
+    batched = time_calls(
+        lambda: exp.get_data(model, target_model, batch_size), repeats)
+
+    return {
+        "batch_size": batch_size,
+        "per_sample_ms": per_sample * 1e3,
+        "batched_ms": batched * 1e3,
+        "speedup": per_sample / batched,
+    }
+
+
+def bench_replay(max_memory=5000, batch_size=32, n_samples=2000, seed=0):
+    """
+    Measure insert and sample throughput for each replay backend.
+    """
+    results = {}
+    for backend in REPLAY_BACKENDS:
+        seed_everything(seed)
+        exp = make_experience(backend, max_memory=max_memory, discount=0.95)
+
+        start = time.perf_counter()
+        fill_experience(exp, TreasureMaze(MAZE), n_transitions=max_memory, seed=seed)
+        insert_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(n_samples):
+            exp.sample(batch_size)
+        sample_time = time.perf_counter() - start
+
+        results[backend] = {
+            "inserts_per_sec": max_memory / insert_time,
+            "samples_per_sec": n_samples / sample_time,
+        }
+    return results
+
+
+def bench_env_steps(sizes=(7, 100, 1000), n_steps=50000, seed=0):
+    """
+    Random-walk steps/sec of TreasureMaze.act in interpreted and compiled
+    mode. Size 7 uses the main.py maze; larger sizes use random grids.
+    """
+    results = {}
+    for size in sizes:
+        maze = MAZE if size == 7 else random_grid(size, seed=seed)
+        row = {}
+        for compiled in (False, True):
+            start = time.perf_counter()
+            qmaze = TreasureMaze(maze, compiled=compiled)
+            build_time = time.perf_counter() - start
+
+            row["compiled" if compiled else "interpreted"] = {
+                "steps_per_sec": random_walk_rate(qmaze, n_steps, seed),
+                "build_sec": build_time,
+            }
+        row["speedup"] = (row["compiled"]["steps_per_sec"]
+                          / row["interpreted"]["steps_per_sec"])
+        results[size] = row
+    return results
+
+
+def bench_scaling(sizes=(10, 100, 500, 1000), n_steps=20000, n_epoch=5, seed=0):
+    """
+    How generation, environment build time and memory, step cost and
+    training time grow with the size of a generated maze.
+
+    Memory is the tracemalloc peak while building the environment. Training
+    runs n_epoch epochs (300 steps max each) with geodesic shaping; its
+    per-epoch time includes the per-episode reset of the visit counts.
+    """
+    results = {}
+    for size in sizes:
+        start = time.perf_counter()
+        maze = generate_maze(size, seed=seed)
+        row = {"generate_sec": time.perf_counter() - start}
+
+        for compiled in (False, True):
+            # Memory in a separate build: tracemalloc slows allocation down
+            tracemalloc.start()
+            TreasureMaze(maze, compiled=compiled)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            qmaze = TreasureMaze(maze, compiled=compiled)
+            build_time = time.perf_counter() - start
+
+            row["compiled" if compiled else "interpreted"] = {
+                "build_sec": build_time,
+                "build_peak_mb": peak / 2**20,
+                "step_us": 1e6 / random_walk_rate(qmaze, n_steps, seed),
+            }
+            del qmaze
+
+        seed_everything(seed)
+        trainer = TreasureHuntTrainer(maze, distance="geodesic", verbose=False)
+        summary = trainer.train(n_epoch=n_epoch, save_model=False)
+        row["train_epoch_sec"] = summary["seconds"] / summary["epochs"]
+        results[size] = row
+    return results
+
+
+def bench_inference(repeats=200, batch_size=32, seed=0):
+    """
+    Parity and per-call latency of NumpyQNetwork against Keras.
+
+    Raises AssertionError if the NumPy outputs drift from Keras by more
+    than float32 round-off.
+    """
+    seed_everything(seed)
+    model = TreasureHuntTrainer(MAZE).build_model()
+    engine = NumpyQNetwork(model)
+
+    rng = np.random.default_rng(seed)
+    states = rng.uniform(-1, 1, size=(256, 7)).astype(np.float32)
+    error = engine.max_abs_error(model, states)
+    assert error < 1e-4, f"NumPy forward pass differs from Keras by {error}"
+
+    single = states[:1]
+    batch = states[:batch_size]
+    return {
+        "max_abs_error": error,
+        "keras_predict_us": time_calls(lambda: model.predict(single, verbose=0), repeats // 10) * 1e6,
+        "keras_predict_on_batch_us": time_calls(lambda: model.predict_on_batch(single), repeats) * 1e6,
+        "numpy_single_us": time_calls(lambda: engine.predict_one(single[0]), repeats) * 1e6,
+        "numpy_batch_us": time_calls(lambda: engine.predict_on_batch(batch), repeats) * 1e6,
+        "sync_us": time_calls(lambda: engine.sync(model), repeats) * 1e6,
+    }
+
+
+def bench_convergence(backends=("deque", "prioritized"), n_epoch=500, seed=0):
+    """
+    Train one model per replay backend and record epochs and wall-clock
+    seconds until the 95% early-stop win rate (or n_epoch if not reached).
+    """
+    results = {}
+    for backend in backends:
+        seed_everything(seed)
+        trainer = TreasureHuntTrainer(MAZE, replay_backend=backend)
+        results[backend] = trainer.train(n_epoch=n_epoch, model_name=f"bench_{backend}",
+                                         save_model=False)
+    return results
+
+
+def bench_shaping(distances=("manhattan", "geodesic"), n_epoch=500, seed=0):
+    """
+    Epochs and wall-clock seconds to the 95% early-stop win rate with
+    Manhattan and geodesic (shortest-path) reward shaping.
+    """
+    results = {}
+    for distance in distances:
+        seed_everything(seed)
+        trainer = TreasureHuntTrainer(MAZE, distance=distance, verbose=False)
+        results[distance] = trainer.train(n_epoch=n_epoch, model_name=f"bench_{distance}",
+                                          save_model=False)
+        results[distance]["optimal_rate"] = trainer.evaluate()["optimal_rate"]
+    return results
+
+
+def bench_n_step(n_steps=(1, 3, 5), seeds=(0, 1, 2), n_epoch=500, seed=0):
+    """
+    Epochs and seconds to the 95% win rate with n-step replay targets, per
+    seed and as medians over the seeds (runs that never converge count as
+    n_epoch epochs and their full duration).
+    """
+    results = {}
+    for n in n_steps:
+        summaries = []
+        for s in seeds:
+            seed_everything(s)
+            trainer = TreasureHuntTrainer(MAZE, n_step=n, verbose=False)
+            summaries.append(trainer.train(n_epoch=n_epoch, save_model=False))
+
+        results[f"n_{n}"] = {
+            "converged_runs": sum(bool(run["converged"]) for run in summaries),
+            "median_epochs": float(np.median([run["epochs"] for run in summaries])),
+            "median_seconds": float(np.median([run["seconds"] for run in summaries])),
+        }
+        for s, run in zip(seeds, summaries):
+            results[f"n_{n}"][f"seed_{s}"] = {"epochs": run["epochs"], "seconds": run["seconds"],
+                                             "converged": bool(run["converged"])}
+    return results
+
+
+def bench_pipelined(ratios=(0.05, 0.1), seeds=(0, 1, 2), n_epoch=500, time_limit=120, seed=0):
+    """
+    Sequential act-then-learn training against PipelinedTrainer at each
+    update-to-data ratio: environment steps/sec, gradient steps/sec and
+    seconds to the 95% win rate, per seed and as medians over the seeds
+    (runs that never converge count as their full duration).
+    """
+    results = {}
+    runs = {"sequential": []}
+    for s in seeds:
+        seed_everything(s)
+        trainer = TreasureHuntTrainer(MAZE, verbose=False)
+        summary = trainer.train(n_epoch=n_epoch, save_model=False)
+        summary["grad_steps_per_sec"] = summary["epochs"] * trainer.train_repeats / summary["seconds"]
+        runs["sequential"].append(summary)
+
+        for ratio in ratios:
+            seed_everything(s)
+            pipelined = PipelinedTrainer(MAZE, updates_per_step=ratio, seed=s)
+            runs.setdefault(f"pipelined_{ratio}", []).append(
+                pipelined.train(max_episodes=5 * n_epoch, save_model=False, verbose=False,
+                                time_limit=time_limit))
+
+    for mode, summaries in runs.items():
+        results[mode] = {
+            "converged_runs": sum(bool(run["converged"]) for run in summaries),
+            "median_seconds": float(np.median([run["seconds"] for run in summaries])),
+            "steps_per_sec": float(np.median([run["steps_per_sec"] for run in summaries])),
+            "grad_steps_per_sec": float(np.median([run["grad_steps_per_sec"] for run in summaries])),
+        }
+        for s, run in zip(seeds, summaries):
+            results[mode][f"seed_{s}"] = {"epochs": run["epochs"], "seconds": run["seconds"],
+                                          "converged": bool(run["converged"])}
+    return results
+
+
+def bench_solver(sizes=(7, 100, 1000), seed=0):
+    """
+    Seconds to solve a random maze of each size, uncached and cached.
+    """
+    results = {}
+    for size in sizes:
+        maze = MAZE if size == 7 else random_grid(size, seed=seed)
+        clear_solutions()
+        start = time.perf_counter()
+        solution = solve(maze)
+        solve_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        solve(maze)
+        results[size] = {
+            "solve_sec": solve_sec,
+            "cached_sec": time.perf_counter() - start,
+            "reachable_cells": int((solution.distance >= 0).sum()),
+        }
+    return results
+
+
+def bench_actor_scaling(actor_counts=None, max_episodes=5000, time_limit=600, seed=0):
+    """
+    Actor–learner transitions/sec and time-to-95% as actors scale from 1
+    to the core count (doubling).
+    """
+    if actor_counts is None:
+        cores = os.cpu_count() or 1
+        actor_counts = [1]
+        while actor_counts[-1] * 2 <= cores:
+            actor_counts.append(actor_counts[-1] * 2)
+        if actor_counts[-1] != cores:
+            actor_counts.append(cores)
+
+    results = {}
+    for n_actors in actor_counts:
+        seed_everything(seed)
+        trainer = DistributedTrainer(MAZE, n_actors=n_actors, seed=seed)
+        results[n_actors] = trainer.train(max_episodes=max_episodes, time_limit=time_limit,
+                                          save_model=False)
+    return results
+
+
+def bench_observe(n_calls=100000, seed=0):
+    """
+    TreasureMaze.observe() calls/sec, interpreted and compiled.
+
+    seed is unused; observe() is deterministic.
+    """
+    results = {}
+    for compiled in (False, True):
+        qmaze = TreasureMaze(MAZE, compiled=compiled)
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            qmaze.observe()
+        results["compiled" if compiled else "interpreted"] = {
+            "calls_per_sec": n_calls / (time.perf_counter() - start),
+        }
+    return results
+
+
+def bench_train_step(batch_size=32, repeats=50, seed=0):
+    """
+    Per-call latency of train_on_batch on one replay minibatch.
+    """
+    seed_everything(seed)
+    trainer = TreasureHuntTrainer(MAZE, replay_backend="array")
+    model = trainer.build_model()
+    exp = fill_experience(trainer.exp, TreasureMaze(MAZE), n_transitions=2000, seed=seed)
+    X, y = exp.get_data(model, model, batch_size)
+    return {
+        "batch_size": batch_size,
+        "train_on_batch_ms": time_calls(lambda: model.train_on_batch(X, y), repeats) * 1e3,
+    }
+
+
+def bench_update_step(batch_sizes=(32, 256), n_steps=300, seed=0):
+    """
+    Gradient steps/sec of the host-built train_on_batch path against the
+    compiled in-graph update, and the cost of a target network sync.
+
+    Both paths include sampling from array replay and, for the host path,
+    the NumPy policy refresh training does after every step.
+    """
+    seed_everything(seed)
+    from dqn_update import CompiledDQNUpdate
+
+    trainer = TreasureHuntTrainer(MAZE, replay_backend="array")
+    trainer.model = trainer.build_model()
+    trainer.target_model = trainer.build_model()
+    trainer._attach_inference()
+    exp = fill_experience(trainer.exp, TreasureMaze(MAZE), n_transitions=5000, seed=seed)
+
+    update = CompiledDQNUpdate(trainer.model, trainer.target_model, discount=exp.bootstrap_discount)
+    results = {}
+
+    for batch_size in batch_sizes:
+        def host_step():
+            X, y, weights = exp.get_batch(trainer.policy, trainer.target_policy, batch_size)
+            trainer.model.train_on_batch(X, y, sample_weight=weights)
+            trainer._sync_policy()
+
+        def compiled_step():
+            exp.train_step(update, batch_size)
+
+        keras = 1.0 / time_calls(host_step, n_steps)
+        compiled = 1.0 / time_calls(compiled_step, n_steps)
+        results[f"batch_{batch_size}"] = {
+            "keras_steps_per_sec": keras,
+            "compiled_steps_per_sec": compiled,
+            "speedup": compiled / keras,
+        }
+
+    trainer._update = None
+    results["target_sync"] = {
+        "host_hard_us": time_calls(trainer.update_target_model, n_steps) * 1e6,
+        "host_soft_us": time_calls(lambda: trainer.update_target_model(0.005), n_steps) * 1e6,
+        "graph_hard_us": time_calls(update.sync_target, n_steps) * 1e6,
+        "graph_soft_us": time_calls(lambda: update.sync_target(0.005), n_steps) * 1e6,
+    }
+    return results
+
+
+def bench_registry(n_models=50, repeats=20, seed=0):
+    """
+    Model switching and listing: loading a model and its target network
+    from disk twice (the previous load path) against the registry's cold
+    load plus in-memory clone, a cached model and target pair, and listing
+    n_models indexed models.
+    """
+    import tempfile
+    from tensorflow.keras.models import load_model
+    from model_registry import ModelRegistry
+
+    seed_everything(seed)
+    model = TreasureHuntTrainer(MAZE).build_model()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(tmp, cache_size=2)
+        for i in range(n_models):
+            registry.save(f"m{i}", model, epochs=i, win_rate=0.5)
+        path = registry.path("m0")
+
+        def cold():
+            registry.evict()
+            registry.load("m0")
+            registry.load_target("m0")
+
+        return {
+            "two_disk_loads_ms": time_calls(lambda: (load_model(path), load_model(path)),
+                                            max(1, repeats // 4)) * 1e3,
+            "registry_cold_ms": time_calls(cold, max(1, repeats // 4)) * 1e3,
+            "clone_ms": time_calls(lambda: registry.clone(model), repeats) * 1e3,
+            "registry_cached_us": time_calls(
+                lambda: (registry.load("m0"), registry.load_target("m0")), repeats) * 1e6,
+            "list_ms": time_calls(registry.entries, repeats) * 1e3,
+        }
+
+
+def bench_action_selection(repeats=200, seed=0):
+    """
+    Greedy action-selection latency per step for each inference engine.
+    """
+    results = {}
+    qmaze = TreasureMaze(MAZE)
+    state = qmaze.observe()
+    valid_actions = qmaze.valid_actions()
+
+    for inference in ("keras", "numpy"):
+        seed_everything(seed)
+        trainer = TreasureHuntTrainer(MAZE, inference=inference)
+        trainer.model = trainer.build_model()
+        trainer.target_model = trainer.model
+        trainer._attach_inference()
+        results[inference] = {
+            "select_action_us": time_calls(
+                lambda: trainer.select_action(state, valid_actions, epsilon=0.0), repeats) * 1e6,
+        }
+    return results
+
+
+def bench_evaluate(sizes=(7, 100), max_steps=100, seed=0):
+    """
+    Seconds for one greedy evaluation from every solvable free cell, batched,
+    against one rollout at a time with per-step select_action on the 7x7
+    maze. An untrained network rarely wins, so rollouts run to max_steps
+    (the worst case).
+    """
+    results = {}
+    for size in sizes:
+        maze = MAZE if size == 7 else random_grid(size, seed=seed)
+        seed_everything(seed)
+        trainer = TreasureHuntTrainer(maze, verbose=False)
+        trainer.model = trainer.build_model()
+        trainer.target_model = trainer.model
+        trainer._attach_inference()
+
+        start = time.perf_counter()
+        result = trainer.evaluate(max_steps=max_steps)
+        results[size] = {
+            "cells": result["episodes"],
+            "batched_sec": time.perf_counter() - start,
+        }
+
+        if size == 7:
+            qmaze = trainer.qmaze
+            start = time.perf_counter()
+            for cell in result["cells"]:
+                qmaze.reset(cell)
+                envstate = qmaze.observe()
+                for _ in range(max_steps):
+                    row, col = qmaze.state
+                    action = trainer.select_action(envstate, qmaze.valid_actions(), epsilon=0.0)
+                    envstate, _, status = qmaze.act(action, row, col)
+                    if status == "win":
+                        break
+            results[size]["sequential_sec"] = time.perf_counter() - start
+    return results
+
+
+def bench_policy_table(sizes=(7, 100), max_steps=100, repeats=5, seed=0):
+    """
+    Exported policy tables per maze size: export time, file size, load time,
+    single-episode rollouts/sec and a full evaluation from the table against
+    the batched network evaluation, plus the cold start of a fresh
+    interpreter that loads a table and plays one episode. The network is
+    untrained, so most rollouts run to max_steps (the worst case).
+    """
+    import tempfile
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            maze = MAZE if size == 7 else random_grid(size, seed=seed)
+            seed_everything(seed)
+            trainer = TreasureHuntTrainer(maze, verbose=False)
+            trainer.model = trainer.build_model()
+            trainer.target_model = trainer.model
+            trainer._attach_inference()
+
+            filename = os.path.join(tmp, f"{size}.qpol")
+            start = time.perf_counter()
+            table = PolicyTable.from_model(trainer.model, trainer.qmaze)
+            export_sec = time.perf_counter() - start
+            table.save(filename)
+
+            starts = [cell for cell in trainer.qmaze.free_cells if cell != trainer.qmaze.target]
+            start = time.perf_counter()
+            for cell in starts:
+                table.play(cell, max_steps=max_steps)
+            rollouts_per_sec = len(starts) / (time.perf_counter() - start)
+
+            result = {
+                "cells": len(starts),
+                "export_sec": export_sec,
+                "file_bytes": os.path.getsize(filename),
+                "load_ms": time_calls(lambda: PolicyTable.load(filename), repeats) * 1e3,
+                "rollouts_per_sec": rollouts_per_sec,
+                "evaluate_sec": time_calls(lambda: table.evaluate(max_steps=max_steps), repeats),
+                "network_evaluate_sec": time_calls(lambda: trainer.evaluate(max_steps=max_steps), 1),
+            }
+
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c",
+                            "import sys\n"
+                            "from policy_table import PolicyTable\n"
+                            "PolicyTable.load(sys.argv[1]).play()\n"
+                            "assert 'tensorflow' not in sys.modules", filename],
+                           cwd=here, capture_output=True, check=True)
+            result["cold_play_sec"] = time.perf_counter() - start
+
+            results[f"{size}x{size}"] = result
+    return results
+
+
+class _DirectClient:
+    """
+    run_load client that calls a predict function itself, one state per call.
+    """
+
+    def __init__(self, predict):
+        self.predict = predict
+
+    def q_values(self, state):
+        return np.asarray(self.predict(state.reshape(1, -1)))[0]
+
+    def close(self):
+        pass
+
+
+def bench_inference_server(agent_counts=(1, 8, 32), duration=2.0, max_batch=64,
+                           max_wait_ms=1.0, seed=0):
+    """
+    Requests/sec and p50/p99 latency of simulated agents asking for Q-values
+    each step: every agent calling Keras predict_on_batch or a NumPy copy of
+    the network itself, against the micro-batching InferenceServer with each
+    engine over localhost TCP.
+    """
+    seed_everything(seed)
+    trainer = TreasureHuntTrainer(MAZE, verbose=False)
+    model = trainer.build_model()
+    network = NumpyQNetwork(model)
+
+    results = {}
+    for n in agent_counts:
+        runs = {
+            "direct_keras": lambda: _DirectClient(model.predict_on_batch),
+            "direct_numpy": lambda: _DirectClient(network.predict_on_batch),
+        }
+        for name, connect in runs.items():
+            results[f"{name}_{n}"] = run_load(connect, MAZE, n_agents=n, duration=duration,
+                                              max_steps=100, seed=seed)
+
+        for engine in ("keras", "numpy"):
+            with InferenceServer(model, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                                 engine=engine) as server:
+                result = run_load(lambda: InferenceClient(server.address), MAZE, n_agents=n,
+                                  duration=duration, max_steps=100, seed=seed)
+                result["mean_batch"] = server.stats()["mean_batch"]
+            results[f"server_{engine}_{n}"] = result
+
+    # Keep the throughput and latency figures only
+    return {name: {k: r[k] for k in ("requests_per_sec", "p50_ms", "p99_ms", "mean_batch") if k in r}
+            for name, r in results.items()}
+
+
+def bench_offline(n_transitions=1_000_000, chunk_size=65536, batch_size=32,
+                  n_samples=2000, grad_steps=5000, seed=0):
+    """
+    Trajectory datasets: recording rate, streaming and random-access read
+    rates on a synthetic dataset of n_transitions, and offline compiled
+    gradient steps/sec on a dataset recorded from the real maze.
+    """
+    import tempfile
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(seed)
+        states = rng.random((1024, 7), dtype=np.float32)
+        actions = rng.integers(4, size=1024).tolist()
+        rewards = rng.random(1024).tolist()
+
+        directory = os.path.join(tmp, "synthetic")
+        start = time.perf_counter()
+        with TrajectoryRecorder(directory, chunk_size=chunk_size) as recorder:
+            for i in range(n_transitions):
+                j = i % 1024
+                recorder.record((states[j], actions[j], rewards[j], states[j - 1], j == 1023))
+        results["record_per_sec"] = n_transitions / (time.perf_counter() - start)
+        results["bytes_per_transition"] = sum(
+            f.stat().st_size for f in os.scandir(directory)) / n_transitions
+
+        dataset = TrajectoryDataset(directory)
+        start = time.perf_counter()
+        n_batches = sum(1 for _ in dataset.batches(batch_size))
+        results["stream_transitions_per_sec"] = n_batches * batch_size / (time.perf_counter() - start)
+        results["sample_batches_per_sec"] = 1.0 / time_calls(lambda: dataset.sample(batch_size),
+                                                             n_samples)
+
+        seed_everything(seed)
+        recorded = os.path.join(tmp, "maze")
+        trainer = TreasureHuntTrainer(MAZE, verbose=False)
+        trainer.train(n_epoch=100, save_model=False, record=recorded)
+        results["maze_transitions"] = len(TrajectoryDataset(recorded))
+
+        # Includes the one-time XLA compile of the update step
+        offline = TreasureHuntTrainer(MAZE, update_step="compiled", verbose=False)
+        summary = offline.train_offline(recorded, passes=100, max_grad_steps=grad_steps,
+                                        save_model=False, eval_interval=None)
+        results["offline_grad_steps_per_sec"] = summary["grad_steps_per_sec"]
+        results["offline_eval_win_rate"] = summary["eval_win_rate"]
+    return results
+
+
+def bench_corpus(count=40, sizes=(7, 11), held_out=8, baseline_mazes=4, max_episodes=3000,
+                 baseline_epochs=1000, orders=(None, "difficulty"), view_radius=1, seed=0):
+    """
+    One model trained on a generated corpus against one model per maze.
+
+    For each curriculum order, a corpus model trains on count - held_out
+    mazes until its mean greedy win rate on them reaches 95% (or
+    max_episodes), and is then scored zero-shot on the held-out mazes. Separate models are trained on
+    baseline_mazes of the held-out mazes with the same settings, to the 95%
+    evaluation win rate, and scored on the other held-out mazes too. Also
+    times loading an environment from disk against the cache.
+    """
+    import tempfile
+
+    env_kwargs = {"distance": "geodesic", "view_radius": view_radius}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_corpus(tmp, count, sizes, seed=seed)
+        corpus = MazeCorpus(tmp, cache_size=count, **env_kwargs)
+        names, unseen = corpus.split(held_out, seed=seed)
+
+        start = time.perf_counter()
+        for name in corpus.names:
+            corpus.env(name)
+        results["env_load_ms"] = (time.perf_counter() - start) / len(corpus) * 1e3
+        results["env_cached_us"] = time_calls(lambda: corpus.env(names[0]), 1000) * 1e6
+
+        for order in orders:
+            seed_everything(seed)
+            trainer = CorpusTrainer(corpus, names, order=order, ramp_episodes=max_episodes // 4,
+                                    seed=seed, update_step="compiled", max_memory=20000)
+            summary = trainer.train(max_episodes=max_episodes, save_model=False, verbose=False)
+            zero_shot = trainer.evaluate(unseen)
+            results[f"corpus_{order or 'uniform'}"] = {
+                "mazes": summary["mazes"],
+                "episodes": summary["epochs"],
+                "seconds": summary["seconds"],
+                "seconds_per_maze": summary["seconds_per_maze"],
+                "converged": bool(summary["converged"]),
+                "train_win_rate": summary["eval_win_rate"],
+                "held_out_win_rate": zero_shot["win_rate"],
+                "held_out_optimal_rate": zero_shot["optimal_rate"],
+            }
+
+        runs = []
+        for name in unseen[:baseline_mazes]:
+            seed_everything(seed)
+            single = TreasureHuntTrainer(corpus.env(name), update_step="compiled", verbose=False)
+            run = single.train(n_epoch=baseline_epochs, save_model=False, eval_interval=20)
+            others = [PolicyTable.from_model(single.policy, corpus.env(other)).evaluate()["win_rate"]
+                      for other in unseen if other != name]
+            runs.append({"maze": name, "epochs": run["epochs"], "seconds": run["seconds"],
+                         "converged": bool(run["converged"]),
+                         "eval_win_rate": run["eval_win_rate"],
+                         "other_mazes_win_rate": float(np.mean(others))})
+
+        results["per_maze"] = {
+            "converged_runs": sum(run["converged"] for run in runs),
+            "median_seconds": float(np.median([run["seconds"] for run in runs])),
+            "median_epochs": float(np.median([run["epochs"] for run in runs])),
+            "median_other_mazes_win_rate": float(np.median([run["other_mazes_win_rate"] for run in runs])),
+        }
+        for run in runs:
+            results["per_maze"][run.pop("maze")] = run
+    return results
+
+
+def bench_profiling(n_steps=50000, seed=0):
+    """
+    Overhead of each profiling mode: random-walk steps/sec in the compiled
+    7x7 maze without a profiler, under each CPU profiler, and under each
+    with tracemalloc.
+    """
+    import tempfile
+
+    qmaze = TreasureMaze(MAZE, compiled=True)
+    results = {"none_steps_per_sec": random_walk_rate(qmaze, n_steps, seed)}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in (*PROFILERS, None):
+            for memory in (False, True):
+                if mode is None and not memory:
+                    continue
+                qmaze.reset()
+                with Profiler(tmp, mode=mode, memory=memory):
+                    rate = random_walk_rate(qmaze, n_steps, seed)
+                name = "_".join(filter(None, (mode, "tracemalloc" if memory else None)))
+                results[f"{name}_steps_per_sec"] = rate
+    return results
+
+
+def bench_render(sizes=(7, 100), repeats=20, seed=0):
+    """
+    Headless rendering cost per maze size: one frame, a PNG, and a GIF of
+    an oracle episode, against a matplotlib Agg savefig of the same frame
+    when matplotlib is installed.
+    """
+    import tempfile
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        png, gif = os.path.join(tmp, "frame.png"), os.path.join(tmp, "episode.gif")
+        for size in sizes:
+            maze = MAZE if size == 7 else generate_maze(size, seed=seed)
+            renderer = MazeRenderer(maze)
+            path = solve(maze).path((0, 0))
+            image = renderer.frame(path[-1], path)
+
+            result = {
+                "pixels": image.size,
+                "episode_steps": len(path) - 1,
+                "frame_us": time_calls(lambda: renderer.frame(path[-1], path), repeats) * 1e6,
+                "png_ms": time_calls(lambda: write_png(png, image), repeats) * 1e3,
+                "episode_gif_ms": time_calls(lambda: renderer.save(gif, path), max(1, repeats // 10)) * 1e3,
+            }
+
+            try:
+                import matplotlib
+                matplotlib.use("Agg")
+                import matplotlib.pyplot as plt
+            except ImportError:
+                plt = None
+            if plt is not None:
+                def savefig():
+                    fig = plt.figure(figsize=(5, 5))
+                    plt.imshow(to_rgb(image), interpolation="none")
+                    fig.savefig(png)
+                    plt.close(fig)
+                result["matplotlib_png_ms"] = time_calls(savefig, max(1, repeats // 4)) * 1e3
+
+            results[f"{size}x{size}"] = result
+    return results
+
+
+def bench_startup(repeats=3, seed=0):
+    """
+    Cold-start wall-clock of fresh interpreters: reaching the main menu
+    (and quitting), and importing the game to take one environment step.
+    Best of repeats.
+
+    seed is unused.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "first_menu_sec": ([sys.executable, "main.py"], "6\n"),
+        "first_step_sec": ([sys.executable, "-c",
+                            "from main import MAZE\n"
+                            "from treasure_trainer import TreasureHuntTrainer\n"
+                            "TreasureHuntTrainer(MAZE).qmaze.act(1, 0, 0)"], ""),
+    }
+
+    results = {}
+    for name, (cmd, stdin) in commands.items():
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(cmd, input=stdin, cwd=here, capture_output=True, text=True, check=True)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+    return results
+
+
+# name -> (function, slow); slow benchmarks run end-to-end training or build large datasets
+BENCHMARKS = {
+    "env_steps": (bench_env_steps, False),
+    "observe": (bench_observe, False),
+    "replay": (bench_replay, False),
+    "get_data": (bench_get_data, False),
+    "train_step": (bench_train_step, False),
+    "update_step": (bench_update_step, False),
+    "inference": (bench_inference, False),
+    "registry": (bench_registry, False),
+    "action_selection": (bench_action_selection, False),
+    "startup": (bench_startup, False),
+    "solver": (bench_solver, False),
+    "scaling": (bench_scaling, True),
+    "evaluate": (bench_evaluate, False),
+    "render": (bench_render, False),
+    "policy_table": (bench_policy_table, False),
+    "inference_server": (bench_inference_server, False),
+    "offline": (bench_offline, True),
+    "profiling": (bench_profiling, False),
+    "convergence": (bench_convergence, True),
+    "shaping": (bench_shaping, True),
+    "actor_scaling": (bench_actor_scaling, True),
+    "pipelined": (bench_pipelined, True),
+    "n_step": (bench_n_step, True),
+    "corpus": (bench_corpus, True),
+}
+
+
+def environment_info():
+    """
+    Versions and host details stored alongside the results.
+    """
+    info = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import tensorflow as tf
+        info["tensorflow"] = tf.__version__
+    except ImportError:
+        pass
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def flatten(results, prefix=""):
+    """
+    Flatten nested result dicts into {"bench.key.subkey": value}.
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def higher_is_better(metric):
+    """
+    Direction of a metric, from its name; None if it is not a performance
+    number (sizes, counts, parity errors).
+    """
+    last = metric.rsplit(".", 1)[-1]
+    if last.endswith("_per_sec") or last == "speedup":
+        return True
+    if last.endswith(("_ms", "_us", "_sec")) or last == "seconds":
+        return False
+    return None
+
+
+def compare(current, baseline, tolerance=0.10):
+    """
+    Metrics that got worse than baseline by more than tolerance (relative).
+
+    Returns:
+        list of (metric, baseline value, current value, relative change)
+    """
+    regressions = []
+    old = flatten(baseline)
+    for metric, value in flatten(current).items():
+        direction = higher_is_better(metric)
+        if direction is None or metric not in old or old[metric] == 0:
+            continue
+        change = (value - old[metric]) / abs(old[metric])
+        if (direction and change < -tolerance) or (not direction and change > tolerance):
+            regressions.append((metric, old[metric], value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treasure Hunt benchmarks")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), metavar="NAME",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--slow", action="store_true",
+                        help="include end-to-end training benchmarks (convergence, actor_scaling)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE_JSON",
+                        help="report metrics that regressed against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change allowed before a metric counts as a regression")
+    args = parser.parse_args()
+
+    names = args.only or [name for name, (_, slow) in BENCHMARKS.items()
+                          if args.slow or not slow]
+
+    results = {}
+    for name in names:
+        fn, _ = BENCHMARKS[name]
+        print(f"Running {name}...", flush=True)
+        start = time.perf_counter()
+        results[name] = fn(seed=args.seed)
+        for metric, value in flatten(results[name], name).items():
+            print(f"  {metric:<55} {value:>14,.3f}")
+        print(f"  ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    report = {"environment": environment_info(), "seed": args.seed, "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for metric, old, new, change in regressions:
+                print(f"  {metric:<55} {old:>12,.3f} -> {new:>12,.3f} ({change:+.1%})")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
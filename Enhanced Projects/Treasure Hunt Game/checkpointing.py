@@ -0,0 +1,117 @@
+"""
+Training checkpoints and a background checkpoint writer.
+
+A checkpoint is one .npz file: every array under a "group/name" key
+(network and optimizer weights, replay contents, RNG state) plus a JSON
+"meta" entry for scalars such as epsilon and the epoch counter. Files are
+written to a temporary name and renamed into place, so a crash mid-write
+leaves the previous checkpoint intact. Nothing is pickled.
+
+CheckpointWriter does the writing on a daemon thread. The training loop only
+takes the in-memory snapshot; if the disk is slower than the checkpoint
+interval, a pending snapshot is replaced by the newer one instead of
+queueing up.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+
+def save_checkpoint(path, arrays, meta):
+    """
+    Write arrays and a JSON-serializable meta dict to path atomically.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint written by save_checkpoint.
+
+    Returns:
+        (arrays, meta): dict of arrays keyed as saved, and the meta dict.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != "meta"}
+        meta = json.loads(str(data["meta"]))
+    return arrays, meta
+
+
+def group(arrays, prefix):
+    """
+    Entries of arrays under "prefix/", with the prefix removed.
+    """
+    start = len(prefix) + 1
+    return {key[start:]: value for key, value in arrays.items()
+            if key.startswith(prefix + "/")}
+
+
+class CheckpointWriter:
+    """
+    Saves checkpoints on a background thread.
+
+    Usage:
+        writer = CheckpointWriter()
+        writer.submit(path, arrays, meta)   # returns immediately
+        writer.close()                      # waits for the last write
+    """
+
+    def __init__(self):
+        self._pending = None
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        self.written = 0
+
+    def submit(self, path, arrays, meta):
+        """
+        Queue a snapshot for writing. The arrays must not be modified
+        afterwards; pass copies.
+        """
+        with self._condition:
+            self._raise_error()
+            self._pending = (path, arrays, meta)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                job, self._pending = self._pending, None
+
+            try:
+                save_checkpoint(*job)
+                self.written += 1
+            except Exception as e:
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}") from error
+
+    def close(self):
+        """
+        Write any pending snapshot and stop the thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._raise_error()
@@ -0,0 +1,215 @@
+"""
+One Q-network trained across a corpus of maze layouts.
+
+TreasureHuntTrainer learns one layout. CorpusTrainer wraps it and, before
+every episode, points it at a maze drawn from a MazeCorpus by a
+CurriculumSampler (uniformly, or easiest first with a growing pool). The
+replay memory mixes transitions from every layout, so the network has to
+learn a policy from the observation alone: normalized position, distance
+to the target, the valid-move flags and, with view_radius > 0, the local
+wall layout. Observations of every maze have the same size for a given
+view radius, so the trained model plays any maze, including ones it has
+never seen.
+
+Progress is measured by greedy evaluation from every start cell of each
+training maze, through PolicyTable (one batched forward pass per maze),
+and training stops once the mean win rate reaches 95%. evaluate() scores
+held-out mazes the same way for zero-shot generalization.
+"""
+import datetime
+import random
+import signal
+
+import numpy as np
+
+from maze_corpus import CurriculumSampler, MazeCorpus
+from policy_table import PolicyTable
+from treasure_trainer import TreasureHuntTrainer
+
+
+class CorpusTrainer:
+    """
+    Episodes sampled from many mazes into one replay memory and network.
+
+    Usage:
+        corpus = MazeCorpus("corpora/small", distance="geodesic", view_radius=1)
+        train, held_out = corpus.split(8)
+        trainer = CorpusTrainer(corpus, train, order="difficulty")
+        trainer.train(max_episodes=3000, model_name="corpus")
+        trainer.evaluate(held_out)["win_rate"]
+    """
+
+    def __init__(self, corpus, names=None, order=None, start_fraction=0.25,
+                 ramp_episodes=1000, max_steps=300, seed=0, **trainer_kwargs):
+        """
+        Parameters:
+            corpus (MazeCorpus or str): Corpus, or its directory.
+            names (list): Training mazes (default: the whole corpus).
+            order (str): Curriculum order, None, "size" or "difficulty";
+                see CurriculumSampler.
+            start_fraction (float): Share of the ordered mazes used from the
+                first episode.
+            ramp_episodes (int): Episodes until every training maze is used.
+            max_steps (int): Step limit per episode and evaluation rollout.
+            seed (int): Random seed for the maze draws and training.
+            trainer_kwargs: Passed to TreasureHuntTrainer (epsilon, lr,
+                replay_backend, batch_size, update_step, n_step, ...).
+                distance and view_radius come from the corpus.
+        """
+        if not isinstance(corpus, MazeCorpus):
+            corpus = MazeCorpus(corpus)
+        if trainer_kwargs.get("n_envs", 1) != 1:
+            raise ValueError("CorpusTrainer plays one episode at a time; use n_envs=1.")
+
+        self.corpus = corpus
+        self.names = list(corpus.names if names is None else names)
+        self.sampler = CurriculumSampler(corpus, self.names, order, start_fraction,
+                                         ramp_episodes, seed=seed)
+        self.max_steps = max_steps
+        self.seed = seed
+        self.trainer = TreasureHuntTrainer(corpus.env(self.names[0]), verbose=False,
+                                           **trainer_kwargs)
+
+        # Episodes played on each maze in the last train()
+        self.episode_counts = {}
+
+    def train(self, max_episodes=5000, model_name="corpus", save_model=True,
+              eval_interval=100, eval_mazes=None, verbose=True):
+        """
+        Train until the mean greedy win rate over the training mazes reaches
+        95% or max_episodes have been played.
+
+        Parameters:
+            eval_interval (int): Episodes between evaluations.
+            eval_mazes (int): Evaluate a random sample of this many training
+                mazes (default: all of them) to bound the cost on big corpora.
+
+        Returns:
+            dict: as TreasureHuntTrainer.train (epochs are episodes), plus
+            the last evaluation win rate, gradient steps, mazes trained on,
+            seconds per maze and environments loaded from disk.
+        """
+        trainer = self.trainer
+        corpus = self.corpus
+        soft_target = trainer.target_tau < 1.0
+
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+
+        trainer._build_networks()
+        trainer.update_target_model()
+        trainer._attach_update()
+
+        self.episode_counts = {}
+        win_history = []
+        win_rate = 0.0
+        eval_win_rate = None
+        total_steps = 0
+        grad_steps = 0
+        loss = 0.0
+        converged = False
+        episode = -1
+        loads_before = corpus.disk_loads
+
+        if verbose:
+            curriculum = self.sampler.order or "none"
+            print(f"Starting corpus training: {len(self.names)} mazes, "
+                  f"curriculum {curriculum}, up to {max_episodes} episodes")
+
+        global_start = datetime.datetime.now()
+        previous_handler = trainer._install_stop_handler()
+        try:
+            for episode in range(max_episodes):
+                name = self.sampler.sample(episode)
+                trainer.qmaze = corpus.env(name)
+                self.episode_counts[name] = self.episode_counts.get(name, 0) + 1
+
+                won, steps, _ = trainer._play_episode(self.max_steps)
+                win_history.append(1 if won else 0)
+                total_steps += steps
+
+                loss = trainer._replay_updates(trainer.train_repeats, trainer.batch_size)
+                if len(trainer.exp) >= trainer.batch_size:
+                    grad_steps += trainer.train_repeats
+
+                trainer.epsilon = max(trainer.min_epsilon, trainer.epsilon * trainer.epsilon_decay)
+                if not soft_target and episode % trainer.target_update_interval == 0:
+                    trainer.update_target_model()
+
+                win_rate = float(np.mean(win_history[-50:]))
+                stopped = trainer._stop_requested()
+                if (episode + 1) % eval_interval == 0 or stopped:
+                    names = self.names
+                    if eval_mazes is not None and eval_mazes < len(names):
+                        names = random.sample(names, eval_mazes)
+                    eval_win_rate = self.evaluate(names)["win_rate"]
+                    converged = eval_win_rate >= 0.95
+
+                    if verbose:
+                        elapsed = (datetime.datetime.now() - global_start).total_seconds()
+                        print(f"Episode {episode + 1:5d} | Mazes: {self.sampler.pool_size(episode):4d} | "
+                              f"Loss: {float(loss):0.4f} | Win Rate: {win_rate:0.3f} | "
+                              f"Eval: {eval_win_rate:0.3f} | ε: {trainer.epsilon:0.3f} | "
+                              f"{elapsed:6.1f}s", flush=True)
+                if converged or stopped:
+                    break
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+
+        if verbose and converged:
+            print(f"\nWin-rate target reached on the training mazes ({eval_win_rate:.3f}).\n")
+
+        if save_model:
+            q = trainer.qmaze
+            trainer.save_model(model_name, environment={
+                "corpus": corpus.directory,
+                "corpus_mazes": len(self.names),
+                "curriculum": self.sampler.order,
+                "distance": q.distance,
+                "view_radius": q.view_radius,
+                "obs_size": q.obs_size,
+            }, epochs=episode + 1, win_rate=win_rate, eval_win_rate=eval_win_rate,
+                converged=bool(converged))
+
+        summary = trainer._summary(episode + 1, win_rate, global_start, converged,
+                                   total_steps=total_steps)
+        summary.update({
+            "eval_win_rate": eval_win_rate,
+            "grad_steps": grad_steps,
+            "mazes": len(self.names),
+            "seconds_per_maze": summary["seconds"] / len(self.names),
+            "disk_loads": corpus.disk_loads - loads_before,
+        })
+        return summary
+
+    def evaluate(self, names=None, max_steps=None):
+        """
+        Greedy win rate of the current network from every start cell of each
+        maze, through a PolicyTable built for it.
+
+        Parameters:
+            names (list): Mazes to evaluate, from this trainer's corpus
+                (default: the training mazes). Mazes outside the training
+                set measure zero-shot generalization.
+
+        Returns:
+            dict: mean win rate and optimal rate over the mazes, and
+            {name: win rate} under "mazes".
+        """
+        names = self.names if names is None else list(names)
+        max_steps = self.max_steps if max_steps is None else max_steps
+
+        per_maze = {}
+        optimal = []
+        for name in names:
+            table = PolicyTable.from_model(self.trainer.policy, self.corpus.env(name))
+            result = table.evaluate(max_steps=max_steps)
+            per_maze[name] = result["win_rate"]
+            optimal.append(result["optimal_rate"])
+
+        return {
+            "win_rate": float(np.mean(list(per_maze.values()))) if per_maze else 0.0,
+            "optimal_rate": float(np.mean(optimal)) if optimal else 0.0,
+            "mazes": per_maze,
+        }
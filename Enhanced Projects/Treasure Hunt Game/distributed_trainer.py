@@ -0,0 +1,308 @@
+"""
+Actor–learner training for the Treasure Maze DQN.
+
+A pool of actor processes each play epsilon-greedy episodes in their own
+compiled TreasureMaze, choosing actions with a NumpyQNetwork copy of the
+Q-network. Every finished episode is sent to the learner as stacked arrays
+over a multiprocessing queue. The learner (this process) adds them to its
+replay buffer and keeps taking gradient steps, publishing fresh weights to
+the actors through shared memory every few steps.
+
+Actors never call TensorFlow, so each one uses a single core. The learner
+has already built Keras models, and with them TensorFlow's thread pools,
+when the actors start, so they are never forked from it: they come from a
+forkserver where the platform has one and are spawned elsewhere. Either
+way they import only this module's dependencies, since TensorFlow is
+loaded only when a network is built, and get their network and shared
+state as picklable arguments.
+"""
+import datetime
+import multiprocessing as mp
+import os
+import queue
+import random
+import time
+
+import numpy as np
+
+from numpy_inference import NumpyQNetwork
+from treasure_maze import TreasureMaze
+from treasure_trainer import TreasureHuntTrainer
+
+
+def run_actor(actor_id, maze, env_kwargs, network, shared_weights, weights_version,
+              shared_epsilon, transition_queue, stop_event, max_steps, seed):
+    """
+    Actor process entry point: play episodes until stop_event is set.
+
+    env_kwargs are the TreasureMaze keyword arguments (start, target,
+    distance, view_radius) of the learner's environment.
+    """
+    rng = random.Random(seed)
+    qmaze = TreasureMaze(maze, compiled=True, **env_kwargs)
+    weights = np.frombuffer(shared_weights, dtype=np.float32)
+    local_version = -1
+
+    while not stop_event.is_set():
+        # Pick up the newest weight snapshot, if any
+        if weights_version.value != local_version:
+            with weights_version.get_lock():
+                local_version = weights_version.value
+                network.load_flat(weights)
+        epsilon = shared_epsilon.value
+
+        qmaze.reset()
+        envstate = qmaze.observe()
+        states, actions, rewards, next_states, dones = [], [], [], [], []
+        status = "playing"
+
+        for t in range(max_steps):
+            prev_row, prev_col = qmaze.state
+            valid_actions = qmaze.valid_actions()
+
+            if rng.random() < epsilon:
+                action = rng.choice(valid_actions)
+            else:
+                qs = network.predict_one(envstate)
+                action = max(valid_actions, key=lambda a: qs[a])
+
+            next_state, reward, status = qmaze.act(action, prev_row, prev_col)
+            done = (status == "win") or (t == max_steps - 1)
+
+            states.append(envstate)
+            actions.append(action)
+            rewards.append(reward)
+            next_states.append(next_state)
+            dones.append(done)
+            envstate = next_state
+
+            if done:
+                break
+
+        transition_queue.put((
+            actor_id,
+            status == "win",
+            np.array(states, dtype=np.float32),
+            np.array(actions, dtype=np.int64),
+            np.array(rewards, dtype=np.float32),
+            np.array(next_states, dtype=np.float32),
+            np.array(dones, dtype=bool),
+        ))
+
+
+class DistributedTrainer:
+    """
+    Central learner fed by parallel actor processes.
+
+    Wraps a TreasureHuntTrainer for the networks, replay buffer and model
+    saving, and replaces its single-core act-then-learn loop.
+    """
+
+    def __init__(self, maze, start=(0, 0), n_actors=None,
+                 epsilon=0.9, lr=0.001,
+                 epsilon_decay=0.99, min_epsilon=0.05,
+                 replay_backend="array", batch_size=32,
+                 weight_sync_interval=10, target_update_interval=100,
+                 steps_per_decay=10, max_steps=300, distance="manhattan",
+                 target=None, view_radius=0, seed=0):
+        """
+        Parameters:
+            maze (list): Maze layout.
+            start (tuple): Starting coordinates of every actor.
+            n_actors (int): Actor processes (default: CPU count - 1, at least 1).
+            epsilon, lr, epsilon_decay, min_epsilon: As TreasureHuntTrainer.
+            replay_backend (str): Learner replay memory storage.
+            batch_size (int): Samples per gradient step.
+            weight_sync_interval (int): Gradient steps between weight
+                snapshots published to the actors.
+            target_update_interval (int): Gradient steps between target
+                network syncs.
+            steps_per_decay (int): Gradient steps per epsilon decay. Tying
+                exploration to learner progress (10 matches train_repeats
+                in TreasureHuntTrainer) keeps the schedule independent of
+                how fast the actors produce episodes.
+            max_steps (int): Step limit per actor episode.
+            distance, target, view_radius: Environment settings, as
+                TreasureHuntTrainer.
+            seed (int): Base random seed; actor i uses seed + 1 + i.
+        """
+        self.maze = np.array(maze, dtype=float)
+        self.start = start
+        self.n_actors = n_actors or max(1, (os.cpu_count() or 2) - 1)
+        self.batch_size = batch_size
+        self.weight_sync_interval = weight_sync_interval
+        self.target_update_interval = target_update_interval
+        self.steps_per_decay = steps_per_decay
+        self.max_steps = max_steps
+        self.seed = seed
+
+        self.trainer = TreasureHuntTrainer(
+            self.maze, start, epsilon=epsilon, lr=lr,
+            epsilon_decay=epsilon_decay, min_epsilon=min_epsilon,
+            replay_backend=replay_backend, distance=distance,
+            target=target, view_radius=view_radius)
+
+        qmaze = self.trainer.qmaze
+        self.env_kwargs = {"start": qmaze.start, "target": qmaze.target,
+                           "distance": qmaze.distance, "view_radius": qmaze.view_radius}
+
+    def train(self, max_episodes=5000, model_name="model", save_model=True,
+              time_limit=None):
+        """
+        Run actors and learner until the 95% win rate over the last 50
+        actor episodes is reached, max_episodes have been played, or
+        time_limit seconds have passed.
+
+        Returns:
+            dict: as TreasureHuntTrainer.train, plus actor count, episodes,
+            transitions, gradient steps and transitions/sec.
+        """
+        trainer = self.trainer
+        exp = trainer.exp
+
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+
+        trainer.model = trainer.build_model()
+        trainer.target_model = trainer.build_model()
+        trainer._attach_inference()
+        trainer.update_target_model()
+
+        network = NumpyQNetwork(trainer.model)
+        # Forking a process running TensorFlow threads can deadlock the child
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(method)
+        shared_weights = ctx.RawArray("f", network.num_params())
+        weights_version = ctx.Value("i", 0)
+        shared_epsilon = ctx.Value("d", trainer.epsilon, lock=False)
+        transition_queue = ctx.Queue(maxsize=4 * self.n_actors)
+        stop_event = ctx.Event()
+
+        weights_view = np.frombuffer(shared_weights, dtype=np.float32)
+
+        def publish():
+            with weights_version.get_lock():
+                weights_view[:] = NumpyQNetwork(trainer.model).flatten()
+                weights_version.value += 1
+
+        publish()
+
+        actors = [
+            ctx.Process(
+                target=run_actor,
+                args=(i, self.maze, self.env_kwargs, network, shared_weights,
+                      weights_version, shared_epsilon, transition_queue,
+                      stop_event, self.max_steps, self.seed + 1 + i),
+                daemon=True)
+            for i in range(self.n_actors)
+        ]
+
+        print(f"Starting actor–learner training: {self.n_actors} actors, "
+              f"up to {max_episodes} episodes")
+
+        global_start = datetime.datetime.now()
+        start_time = time.perf_counter()
+        for actor in actors:
+            actor.start()
+
+        win_history = []
+        win_rate = 0.0
+        episodes = 0
+        transitions = 0
+        grad_steps = 0
+        loss = 0.0
+        converged = False
+
+        try:
+            while episodes < max_episodes:
+                if time_limit is not None and time.perf_counter() - start_time > time_limit:
+                    break
+
+                # Block only while the buffer is too small to train on
+                block = len(exp) < self.batch_size
+                for _, won, s, a, r, s_next, d in self._drain(transition_queue, block):
+                    for i in range(len(a)):
+                        exp.remember((s[i], a[i], r[i], s_next[i], d[i]))
+                    transitions += len(a)
+                    episodes += 1
+                    win_history.append(1 if won else 0)
+
+                    if episodes % 10 == 0:
+                        win_rate = np.mean(win_history[-50:])
+                        elapsed = time.perf_counter() - start_time
+                        print(f"Episodes {episodes:5d} | Steps/s: {transitions / elapsed:8.0f} | "
+                              f"Grad steps: {grad_steps:6d} | Loss: {loss:0.4f} | "
+                              f"Win Rate: {win_rate:0.3f} | ε: {trainer.epsilon:0.3f} | "
+                              f"{elapsed:6.1f}s", flush=True)
+
+                win_rate = np.mean(win_history[-50:]) if win_history else 0.0
+                if win_rate >= 0.95 and episodes > 50:
+                    converged = True
+                    print(f"\nWin-rate target reached! ({win_rate:.3f}).\n")
+                    break
+
+                if len(exp) < self.batch_size:
+                    continue
+
+                X, y, weights = exp.get_batch(trainer.policy, trainer.target_policy,
+                                              batch_size=self.batch_size)
+                loss = trainer.model.train_on_batch(X, y, sample_weight=weights)
+                trainer._sync_policy()
+                grad_steps += 1
+
+                if grad_steps % self.steps_per_decay == 0:
+                    trainer.epsilon = max(trainer.min_epsilon,
+                                          trainer.epsilon * trainer.epsilon_decay)
+                    shared_epsilon.value = trainer.epsilon
+                if grad_steps % self.weight_sync_interval == 0:
+                    publish()
+                if grad_steps % self.target_update_interval == 0:
+                    trainer.update_target_model()
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self._shutdown(actors, transition_queue, stop_event)
+
+        if save_model:
+            trainer.save_model(model_name, epochs=episodes, win_rate=float(win_rate),
+                               converged=converged, actors=self.n_actors)
+
+        summary = trainer._summary(episodes, win_rate, global_start, converged,
+                                   total_steps=transitions)
+        summary.update({
+            "actors": self.n_actors,
+            "episodes": episodes,
+            "transitions": transitions,
+            "grad_steps": grad_steps,
+            "transitions_per_sec": transitions / elapsed if elapsed else 0.0,
+        })
+        return summary
+
+    @staticmethod
+    def _drain(transition_queue, block):
+        """
+        Yield every episode waiting in the queue without blocking, or wait
+        for one when block is set.
+        """
+        try:
+            yield transition_queue.get(timeout=1.0) if block else transition_queue.get_nowait()
+            while True:
+                yield transition_queue.get_nowait()
+        except queue.Empty:
+            return
+
+    @staticmethod
+    def _shutdown(actors, transition_queue, stop_event):
+        stop_event.set()
+
+        # Actors blocked on a full queue need it drained before they can exit
+        deadline = time.perf_counter() + 10.0
+        while any(a.is_alive() for a in actors) and time.perf_counter() < deadline:
+            try:
+                transition_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        for actor in actors:
+            actor.join(timeout=1.0)
+            if actor.is_alive():
+                actor.terminate()
@@ -0,0 +1,107 @@
+"""
+DQN gradient step compiled into a single TensorFlow graph.
+
+The default training path builds every minibatch on the host: two predict
+calls for the Q-values and target Q-values, Bellman targets in NumPy, then
+train_on_batch copies the inputs and targets back in. Target syncs go
+through get_weights/set_weights, a host round trip for every weight.
+
+CompiledDQNUpdate takes the raw (s, a, r, s', done) batch instead and runs
+the forward passes, Bellman targets, Huber loss and optimizer step inside one
+tf.function. Target syncs, hard or soft (Polyak averaging), assign the
+variables in place without leaving the graph.
+
+TensorFlow is imported when an update is built, not when this module is.
+"""
+import numpy as np
+
+
+class CompiledDQNUpdate:
+    """
+    Compiled DQN update for a pair of identically shaped Keras Q-networks.
+
+    The loss matches model.compile(loss=Huber()) with train_on_batch on the
+    host-built targets: Huber of the TD error of the taken action, averaged
+    over the action outputs and the (importance-weighted) batch. Starting
+    from the same weights, both paths take the same step.
+
+    jit_compile fuses the step with XLA, which cuts the per-op dispatch
+    overhead that dominates a network this small.
+
+    Usage:
+        update = CompiledDQNUpdate(model, target_model, discount=0.95)
+        loss, td_errors = update(states, actions, rewards, next_states, dones)
+        update.sync_target(tau=0.005)
+    """
+
+    def __init__(self, model, target_model, discount=0.95, delta=1.0, jit_compile=True):
+        import tensorflow as tf
+
+        self.model = model
+        self.target_model = target_model
+        self.discount = discount
+
+        optimizer = model.optimizer
+        if not optimizer.built:
+            optimizer.build(model.trainable_variables)
+
+        variables = model.trainable_variables
+        num_actions = model.output_shape[-1]
+        obs_size = model.input_shape[-1]
+
+        def huber(x):
+            abs_x = tf.abs(x)
+            return tf.where(abs_x <= delta, 0.5 * tf.square(x), delta * (abs_x - 0.5 * delta))
+
+        @tf.function(jit_compile=jit_compile, input_signature=[
+            tf.TensorSpec((None, obs_size), tf.float32),
+            tf.TensorSpec((None,), tf.int64),
+            tf.TensorSpec((None,), tf.float32),
+            tf.TensorSpec((None, obs_size), tf.float32),
+            tf.TensorSpec((None,), tf.bool),
+            tf.TensorSpec((None,), tf.float32),
+        ])
+        def step(states, actions, rewards, next_states, dones, weights):
+            next_q = tf.reduce_max(target_model(next_states, training=False), axis=1)
+            targets = rewards + discount * next_q * (1.0 - tf.cast(dones, tf.float32))
+
+            with tf.GradientTape() as tape:
+                q = model(states, training=True)
+                taken = tf.gather(q, actions, axis=1, batch_dims=1)
+                td_errors = tf.stop_gradient(targets) - taken
+                loss = tf.reduce_mean(weights * huber(td_errors)) / num_actions
+
+            grads = tape.gradient(loss, variables)
+            optimizer.apply_gradients(zip(grads, variables))
+            return loss, td_errors
+
+        @tf.function(input_signature=[tf.TensorSpec((), tf.float32)])
+        def blend(tau):
+            for target, online in zip(target_model.weights, model.weights):
+                target.assign(tau * online + (1.0 - tau) * target)
+
+        self._step = step
+        self._blend = blend
+
+    def __call__(self, states, actions, rewards, next_states, dones, weights=None):
+        """
+        One gradient step on a raw replay minibatch.
+
+        Parameters:
+            weights (ndarray): Importance-sampling weights per sample
+                (default: uniform).
+
+        Returns:
+            (loss, td_errors) as tensors, so the caller decides whether
+            to pay for the device-to-host copy.
+        """
+        if weights is None:
+            weights = np.ones(len(actions), dtype=np.float32)
+        return self._step(states, actions, rewards, next_states, dones, weights)
+
+    def sync_target(self, tau=1.0):
+        """
+        Move the target weights towards the online weights:
+        target = tau * online + (1 - tau) * target. tau=1 copies them.
+        """
+        self._blend(np.float32(tau))
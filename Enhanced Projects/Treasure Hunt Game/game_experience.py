@@ -2,23 +2,221 @@ import numpy as np
 from collections import deque
 
 
+class NStepAccumulator:
+    """
+    Turns one stream of 1-step transitions into n-step transitions.
+
+    Each pending transition carries its discounted return so far, which
+    every new reward extends, so nothing is recomputed from scratch. Once a
+    transition has n rewards it is emitted as (s_t, a_t, R_t, s_t+n, done)
+    with R_t = r_t + discount * r_t+1 + ... + discount^(n-1) * r_t+n-1. When
+    the episode ends, the remaining transitions are emitted with the shorter
+    returns they have and done=True, so none bootstraps past the end.
+    """
+
+    def __init__(self, n_step, discount):
+        self.n_step = n_step
+        self.powers = [discount ** k for k in range(n_step)]
+        self.pending = deque()   # [state, action, return so far]
+
+    def push(self, s, a, r, s_next, done):
+        """
+        Add one transition; returns the n-step transitions now complete.
+        """
+        pending = self.pending
+        pending.append([np.array(s, copy=True), a, 0.0])
+        k = len(pending)
+        for j, item in enumerate(pending):
+            item[2] += self.powers[k - 1 - j] * r
+
+        if done:
+            complete = [(s0, a0, ret, s_next, True) for s0, a0, ret in pending]
+            pending.clear()
+            return complete
+        if k == self.n_step:
+            s0, a0, ret = pending.popleft()
+            return [(s0, a0, ret, s_next, False)]
+        return []
+
+
 class GameExperience:
-    def __init__(self, max_memory=30000, discount=0.95):
+    # Optional trajectory_dataset.TrajectoryRecorder that gets a copy of
+    # every 1-step transition passed to remember()
+    recorder = None
+
+    def __init__(self, max_memory=30000, discount=0.95, n_step=1):
         self.max_memory = max_memory
         self.discount = discount
         self.memory = deque(maxlen=max_memory)
+        self._init_n_step(n_step)
+
+    def _init_n_step(self, n_step):
+        if n_step < 1:
+            raise ValueError("n_step must be at least 1.")
+        self.n_step = n_step
+        # Non-terminal n-step transitions bootstrap from discount^n * max Q(s_t+n)
+        self.bootstrap_discount = self.discount ** n_step
+        self._streams = {}
+
+    def __len__(self):
+        return len(self.memory)
+
+    def remember(self, episode, stream=0):
+        """
+        Add one environment transition (s, a, r, s', done).
+
+        With n_step > 1 transitions are held back until their n-step return
+        is known. Interleaved episodes (vector environments) need one stream
+        key each, so their returns do not mix.
+        """
+        if self.recorder is not None:
+            self.recorder.record(episode)
 
-    def remember(self, episode):
+        if self.n_step == 1:
+            self._store(episode)
+            return
+
+        accumulator = self._streams.get(stream)
+        if accumulator is None:
+            accumulator = self._streams[stream] = NStepAccumulator(self.n_step, self.discount)
+        for transition in accumulator.push(*episode):
+            self._store(transition)
+
+    def _store(self, episode):
         s, a, r, s_next, done = episode
         self.memory.append((s.copy(), a, r, s_next.copy(), done))
 
+    def sample(self, batch_size=32):
+        """
+        Draw a uniform minibatch of transitions and stack it into arrays.
+
+        Returns:
+            (states, actions, rewards, next_states, dones) with one row per
+            sampled transition.
+        """
+        indices = np.random.randint(len(self.memory), size=batch_size)
+        batch = [self.memory[i] for i in indices]
+
+        states = np.array([t[0] for t in batch], dtype=np.float32)
+        actions = np.array([t[1] for t in batch], dtype=np.int64)
+        rewards = np.array([t[2] for t in batch], dtype=np.float32)
+        next_states = np.array([t[3] for t in batch], dtype=np.float32)
+        dones = np.array([t[4] for t in batch], dtype=bool)
+
+        return states, actions, rewards, next_states, dones
+
+    def compute_targets(self, model, target_model, batch):
+        """
+        Compute Bellman targets for a stacked batch of transitions.
+
+        Q-values for the states and target Q-values for the next states are
+        computed with a single forward pass of each network over the whole
+        batch.
+
+        Returns:
+            (y, td_errors): the target matrix for train_on_batch and the TD
+            error of each taken action.
+        """
+        states, actions, rewards, next_states, dones = batch
+        rows = np.arange(len(actions))
+
+        y = np.array(model.predict_on_batch(states), dtype=np.float32)
+        tqs = np.array(target_model.predict_on_batch(next_states), dtype=np.float32)
+
+        targets = rewards + self.bootstrap_discount * np.max(tqs, axis=1) * ~dones
+        td_errors = targets - y[rows, actions]
+        y[rows, actions] = targets
+
+        return y, td_errors
+
+    def get_batch(self, model, target_model, batch_size=32):
+        """
+        Build one training minibatch of inputs, targets and sample weights.
+
+        Uniform replay returns None for the weights.
+        """
+        if len(self) < batch_size:
+            return [], [], None
+
+        batch = self.sample(batch_size)
+        y, _ = self.compute_targets(model, target_model, batch)
+        return batch[0], y, None
+
+    def sample_weighted(self, batch_size=32):
+        """
+        Raw minibatch plus what a learner needs to report back: the sampled
+        indices and importance-sampling weights (both None for uniform
+        replay). Pair with update_priorities().
+        """
+        return self.sample(batch_size), None, None
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Uniform replay keeps no priorities.
+        """
+
+    def train_step(self, update, batch_size=32):
+        """
+        Sample one raw minibatch and train on it with an update that computes
+        its own targets (dqn_update.CompiledDQNUpdate).
+
+        Returns:
+            The update's loss, or None while the memory holds fewer than
+            batch_size transitions.
+        """
+        if len(self) < batch_size:
+            return None
+
+        loss, _ = update(*self.sample(batch_size))
+        return loss
+
     def get_data(self, model, target_model, batch_size=32):
-        if len(self.memory) < batch_size:
+        """
+        Build one training minibatch of inputs and Bellman targets.
+        """
+        X, y, _ = self.get_batch(model, target_model, batch_size)
+        return X, y
+
+    def state_dict(self):
+        """
+        Replay contents as a dict of arrays, oldest transition first, for
+        checkpoints.
+        """
+        if not self.memory:
+            return {}
+        return {
+            "states": np.array([t[0] for t in self.memory], dtype=np.float32),
+            "actions": np.array([t[1] for t in self.memory], dtype=np.int64),
+            "rewards": np.array([t[2] for t in self.memory], dtype=np.float32),
+            "next_states": np.array([t[3] for t in self.memory], dtype=np.float32),
+            "dones": np.array([t[4] for t in self.memory], dtype=bool),
+        }
+
+    def load_state_dict(self, state):
+        """
+        Replace the replay contents with those of a state_dict().
+        Transitions still waiting for their n-step return are dropped.
+        """
+        self.memory.clear()
+        self._streams.clear()
+        if not state:
+            return
+        for s, a, r, s_next, done in zip(state["states"], state["actions"].tolist(),
+                                         state["rewards"].tolist(), state["next_states"],
+                                         state["dones"].tolist()):
+            self.memory.append((s, a, r, s_next, done))
+
+    def get_data_per_sample(self, model, target_model, batch_size=32):
+        """
+        Original target computation with one predict call per transition.
+
+        Kept as the reference path for benchmarks.py; training uses get_data.
+        The minibatch comes from sample(), so every backend shares it.
+        """
+        if len(self) < batch_size:
             return [], []
 
-        batch = []
-        for _ in range(batch_size):
-            batch.append(self.memory[np.random.randint(len(self.memory))])
+        states, actions, rewards, next_states, dones = self.sample(batch_size)
 
         state_dim = model.input_shape[1]
         num_actions = model.output_shape[1]
@@ -26,7 +224,8 @@ class GameExperience:
         X = np.zeros((batch_size, state_dim))
         y = np.zeros((batch_size, num_actions))
 
-        for i, (s, a, r, s_next, done) in enumerate(batch):
+        for i, (s, a, r, s_next, done) in enumerate(zip(states, actions.tolist(), rewards.tolist(),
+                                                        next_states, dones.tolist())):
             X[i] = s
             qs = model.predict(s.reshape(1, -1), verbose=0)[0]
 
@@ -34,8 +233,260 @@ class GameExperience:
                 qs[a] = r
             else:
                 tqs = target_model.predict(s_next.reshape(1, -1), verbose=0)[0]
-                qs[a] = r + self.discount * np.max(tqs)
+                qs[a] = r + self.bootstrap_discount * np.max(tqs)
 
             y[i] = qs
 
         return X, y
+
+
+class ArrayExperience(GameExperience):
+    """
+    Replay memory backed by preallocated contiguous arrays.
+
+    Transitions are written into a fixed-size ring buffer, so inserts are
+    O(1) with no per-transition Python objects, and a minibatch is gathered
+    with one fancy-indexing operation per field. Arrays are allocated on the
+    first remember() call, once the state size is known.
+    """
+
+    def __init__(self, max_memory=30000, discount=0.95, n_step=1):
+        self.max_memory = max_memory
+        self.discount = discount
+        self._init_n_step(n_step)
+        self.size = 0
+        self.position = 0
+
+        self.states = None
+        self.actions = np.zeros(max_memory, dtype=np.int64)
+        self.rewards = np.zeros(max_memory, dtype=np.float32)
+        self.next_states = None
+        self.dones = np.zeros(max_memory, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, state_dim):
+        self.states = np.zeros((self.max_memory, state_dim), dtype=np.float32)
+        self.next_states = np.zeros((self.max_memory, state_dim), dtype=np.float32)
+
+    def _store(self, episode):
+        s, a, r, s_next, done = episode
+        if self.states is None:
+            self._allocate(np.size(s))
+
+        i = self.position
+        self.states[i] = s
+        self.actions[i] = a
+        self.rewards[i] = r
+        self.next_states[i] = s_next
+        self.dones[i] = done
+
+        self.position = (i + 1) % self.max_memory
+        self.size = min(self.size + 1, self.max_memory)
+
+    def gather(self, indices):
+        return (self.states[indices], self.actions[indices],
+                self.rewards[indices], self.next_states[indices],
+                self.dones[indices])
+
+    def sample(self, batch_size=32):
+        return self.gather(np.random.randint(self.size, size=batch_size))
+
+    def state_dict(self):
+        if self.states is None:
+            return {}
+        return {
+            "states": self.states.copy(),
+            "actions": self.actions.copy(),
+            "rewards": self.rewards.copy(),
+            "next_states": self.next_states.copy(),
+            "dones": self.dones.copy(),
+            "size": np.int64(self.size),
+            "position": np.int64(self.position),
+        }
+
+    def load_state_dict(self, state):
+        self.size = self.position = 0
+        self._streams.clear()
+        if not state:
+            return
+        if len(state["actions"]) != self.max_memory:
+            raise ValueError(f"Checkpoint replay capacity {len(state['actions'])} "
+                             f"does not match max_memory={self.max_memory}")
+        self._allocate(state["states"].shape[1])
+        for name in ("states", "actions", "rewards", "next_states", "dones"):
+            getattr(self, name)[...] = state[name]
+        self.size = int(state["size"])
+        self.position = int(state["position"])
+
+
+class SumTree:
+    """
+    Binary sum-tree over a fixed number of leaf priorities.
+
+    Internal node i holds the sum of nodes 2i and 2i+1, so the root (node 1)
+    is the total priority. Updates and prefix-sum lookups walk one
+    root-to-leaf path, O(log n), and are vectorized over a whole batch.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaf_base = 1
+        while self.leaf_base < capacity:
+            self.leaf_base *= 2
+        self.tree = np.zeros(2 * self.leaf_base, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.leaf_base]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaf_base
+        self.tree[nodes] = priorities
+
+        # Recompute every ancestor of the touched leaves, one level at a time
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+        Return the leaf index whose prefix-sum interval contains each value.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        while nodes[0] < self.leaf_base:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values > left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+
+        return nodes - self.leaf_base
+
+
+class PrioritizedExperience(ArrayExperience):
+    """
+    Proportional prioritized replay (Schaul et al., 2016).
+
+    Transitions are sampled with probability proportional to
+    (|TD error| + epsilon) ** alpha using a SumTree, and each sample carries
+    an importance-sampling weight (N * P(i)) ** -beta, normalized to a
+    maximum of 1, which is passed to train_on_batch. Beta anneals towards 1
+    as sampling proceeds. New transitions enter at the current maximum
+    priority so each is replayed at least once.
+    """
+
+    def __init__(self, max_memory=30000, discount=0.95, n_step=1,
+                 alpha=0.6, beta=0.4, beta_increment=1e-4, epsilon=1e-3):
+        super().__init__(max_memory=max_memory, discount=discount, n_step=n_step)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(max_memory)
+        self.max_priority = 1.0
+
+    def _store(self, episode):
+        i = self.position
+        super()._store(episode)
+        self.tree.update([i], [self.max_priority])
+
+    def sample_indices(self, batch_size=32):
+        """
+        Stratified proportional sampling.
+
+        Returns:
+            (indices, weights): buffer indices and their normalized
+            importance-sampling weights.
+        """
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+
+        # Floating-point round-off can walk past the last filled leaf
+        indices = np.minimum(self.tree.find(values), self.size - 1)
+
+        # A leaf the draw lands on can still be zero (round-off at a segment
+        # edge, a restored tree); floor it at the smallest priority
+        # update_priorities() can assign so its weight stays finite
+        priorities = np.maximum(self.tree.get(indices), self.epsilon ** self.alpha)
+        probs = priorities / total
+        weights = (self.size * probs) ** (-self.beta)
+        weights = (weights / weights.max()).astype(np.float32)
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return indices, weights
+
+    def sample(self, batch_size=32):
+        indices, _ = self.sample_indices(batch_size)
+        return self.gather(indices)
+
+    def sample_weighted(self, batch_size=32):
+        indices, weights = self.sample_indices(batch_size)
+        return self.gather(indices), indices, weights
+
+    def state_dict(self):
+        state = super().state_dict()
+        if state:
+            state.update({
+                "tree": self.tree.tree.copy(),
+                "max_priority": np.float64(self.max_priority),
+                "beta": np.float64(self.beta),
+            })
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree[:] = state["tree"] if state else 0.0
+        self.max_priority = float(state["max_priority"]) if state else 1.0
+        if state:
+            self.beta = float(state["beta"])
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def get_batch(self, model, target_model, batch_size=32):
+        if self.size < batch_size:
+            return [], [], None
+
+        indices, weights = self.sample_indices(batch_size)
+        batch = self.gather(indices)
+        y, td_errors = self.compute_targets(model, target_model, batch)
+        self.update_priorities(indices, td_errors)
+
+        return batch[0], y, weights
+
+    def train_step(self, update, batch_size=32):
+        if self.size < batch_size:
+            return None
+
+        indices, weights = self.sample_indices(batch_size)
+        loss, td_errors = update(*self.gather(indices), weights=weights)
+        self.update_priorities(indices, np.asarray(td_errors))
+        return loss
+
+
+REPLAY_BACKENDS = {
+    "deque": GameExperience,
+    "array": ArrayExperience,
+    "prioritized": PrioritizedExperience,
+}
+
+
+def make_experience(backend="deque", max_memory=30000, discount=0.95, n_step=1):
+    """
+    Build a replay memory for the given backend name, storing n_step-step
+    returns.
+    """
+    if backend not in REPLAY_BACKENDS:
+        raise ValueError(f"Unknown replay backend '{backend}'. "
+                         f"Choose from: {', '.join(REPLAY_BACKENDS)}")
+    return REPLAY_BACKENDS[backend](max_memory=max_memory, discount=discount, n_step=n_step)
@@ -0,0 +1,465 @@
+"""
+Local Q-value server that micro-batches requests from many agents.
+
+Agents that each run a forward pass on one state pay the per-call overhead
+every step. InferenceServer loads one model and answers Q-value requests
+over a localhost TCP port or a Unix socket. A batching thread collects the
+requests waiting in its queue, up to max_batch or until max_wait_ms has
+passed since the first, and answers them with one forward pass.
+
+Wire protocol (little-endian, one connection per agent):
+    on connect, server -> client: obs_size, num_actions (two uint32)
+    request, client -> server:    one observation, obs_size float32
+    reply, server -> client:      status (uint8), then its Q-values,
+                                  num_actions float32
+A connection carries one request at a time; concurrency comes from many
+connections. The status is REPLY_OK, or REPLY_ERROR when the forward pass
+failed; the Q-values of an error reply are zeros and the server then
+closes that connection.
+
+Serve a saved model, or measure it under simulated agents:
+    python inference_server.py --model CONVERGED --port 5555
+    python inference_server.py --model CONVERGED --load 32 --duration 10
+"""
+import argparse
+import os
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from model_registry import default_registry
+from numpy_inference import NumpyQNetwork
+from treasure_maze import TreasureMaze
+
+_HEADER = struct.Struct("<II")
+REPLY_OK = 0
+REPLY_ERROR = 1
+
+
+def _connect_socket(address):
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.connect(address)
+    return sock
+
+
+def _recv_exact(sock, size):
+    """
+    Read exactly size bytes, or return None if the peer closed first.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return None
+        received += n
+    return buffer
+
+
+class _Request:
+    __slots__ = ("state", "done", "result")
+
+    def __init__(self, state):
+        self.state = state
+        self.done = threading.Event()
+        self.result = None
+
+
+class InferenceServer:
+    """
+    Micro-batching Q-value server for one model.
+
+    Usage:
+        with InferenceServer("CONVERGED", max_batch=64, max_wait_ms=1.0) as server:
+            with InferenceClient(server.address) as client:
+                qs = client.q_values(state)
+    """
+
+    def __init__(self, model, address=("127.0.0.1", 0), max_batch=64, max_wait_ms=1.0,
+                 engine="numpy"):
+        """
+        Parameters:
+            model: Keras Q-network, or the name of a model in saved_models/
+                (loaded through the model registry).
+            address: (host, port) to listen on (port 0 picks a free one), or
+                a filesystem path for a Unix socket.
+            max_batch (int): Most requests answered by one forward pass.
+            max_wait_ms (float): How long the first request of a batch may
+                wait for others. The wait also ends once every connected
+                client and every in-process predict() caller is in the
+                batch, since none can send another request.
+            engine (str): "numpy" runs batches through a NumpyQNetwork copy;
+                "keras" calls the model's predict_on_batch.
+        """
+        if engine not in ("numpy", "keras"):
+            raise ValueError(f"Unknown inference engine '{engine}'. Choose 'numpy' or 'keras'.")
+        if isinstance(model, str):
+            model = default_registry().load(model)
+
+        self.obs_size = model.input_shape[-1]
+        self.num_actions = model.output_shape[-1]
+        self._forward = NumpyQNetwork(model).predict_on_batch if engine == "numpy" \
+            else model.predict_on_batch
+
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.engine = engine
+
+        self._queue = queue.Queue()
+        self._listener = None
+        self._threads = []
+        self._connections = set()
+        self._local_callers = 0
+        self._lock = threading.Lock()
+        self._stopping = False
+
+        self.requests = 0
+        self.batches = 0
+
+    def start(self):
+        """
+        Bind the socket and start the accept and batching threads.
+        """
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen(128)
+        self.address = listener.getsockname()
+        self._listener = listener
+
+        for target, name in ((self._accept_loop, "accept"), (self._batch_loop, "batcher")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        Close the socket and every connection, and stop the threads.
+        """
+        self._stopping = True
+        self._queue.put(None)
+        if self._listener is not None:
+            # shutdown() wakes the thread blocked in accept(); close() alone may not
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+        with self._lock:
+            for conn in list(self._connections):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        """
+        Requests and batches answered so far, and the mean batch size.
+        """
+        return {"requests": self.requests, "batches": self.batches,
+                "mean_batch": self.requests / self.batches if self.batches else 0.0}
+
+    def predict(self, state):
+        """
+        Q-values for one state, batched with whatever else is waiting.
+        Thread-safe, for in-process callers alongside the socket clients.
+        """
+        with self._lock:
+            self._local_callers += 1
+        try:
+            return self._submit(state)
+        finally:
+            with self._lock:
+                self._local_callers -= 1
+
+    def _submit(self, state):
+        request = _Request(np.asarray(state, dtype=np.float32).reshape(self.obs_size))
+        self._queue.put(request)
+        request.done.wait()
+        if isinstance(request.result, Exception):
+            raise RuntimeError("Inference failed.") from request.result
+        return request.result
+
+    def _accept_loop(self):
+        while not self._stopping:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                break
+            if conn.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.add(conn)
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            thread.start()
+
+    def _serve(self, conn):
+        """
+        Answer one client's requests until it disconnects.
+        """
+        request_size = self.obs_size * 4
+        try:
+            conn.sendall(_HEADER.pack(self.obs_size, self.num_actions))
+            while True:
+                data = _recv_exact(conn, request_size)
+                if data is None:
+                    break
+                try:
+                    qs = self._submit(np.frombuffer(data, dtype=np.float32))
+                except RuntimeError:
+                    # Tell this client and drop it; the others keep being served
+                    conn.sendall(bytes([REPLY_ERROR]) + bytes(self.num_actions * 4))
+                    break
+                conn.sendall(bytes([REPLY_OK]) + qs.tobytes())
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _batch_loop(self):
+        pending = self._queue
+        while True:
+            request = pending.get()
+            if request is None:
+                return
+            batch = [request]
+            stop = False
+            deadline = time.perf_counter() + self.max_wait
+
+            # Socket clients and in-process callers each wait for their
+            # answer before asking again, so once all of them are in the
+            # batch nothing else can arrive
+            with self._lock:
+                callers = len(self._connections) + self._local_callers
+            limit = min(self.max_batch, callers or self.max_batch)
+            while len(batch) < limit:
+                try:
+                    request = pending.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            try:
+                states = np.stack([r.state for r in batch])
+                results = np.asarray(self._forward(states), dtype=np.float32)
+            except Exception as e:
+                results = [e] * len(batch)
+            for r, result in zip(batch, results):
+                r.result = result
+                r.done.set()
+
+            self.requests += len(batch)
+            self.batches += 1
+            if stop:
+                return
+
+
+class InferenceClient:
+    """
+    Blocking client for one InferenceServer connection; one per agent.
+    """
+
+    def __init__(self, address):
+        self.sock = _connect_socket(address)
+        header = _recv_exact(self.sock, _HEADER.size)
+        if header is None:
+            raise ConnectionError("Server closed the connection.")
+        self.obs_size, self.num_actions = _HEADER.unpack(header)
+        self._reply_size = 1 + self.num_actions * 4
+
+    def q_values(self, state):
+        """
+        Q-values of one observation.
+
+        Raises:
+            RuntimeError: The server's forward pass failed; it has closed
+                the connection.
+        """
+        self.sock.sendall(np.asarray(state, dtype=np.float32).tobytes())
+        data = _recv_exact(self.sock, self._reply_size)
+        if data is None:
+            raise ConnectionError("Server closed the connection.")
+        if data[0] != REPLY_OK:
+            raise RuntimeError("Inference failed on the server.")
+        return np.frombuffer(data, dtype=np.float32, offset=1)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_load(connect, maze, n_agents=8, duration=5.0, max_steps=300, seed=0, **env_kwargs):
+    """
+    Load generator: n_agents threads, each playing greedy episodes in its
+    own compiled TreasureMaze from random start cells and asking for
+    Q-values every step.
+
+    Parameters:
+        connect (callable): Returns a client with q_values(state) and
+            close(), one per agent; e.g. lambda: InferenceClient(address).
+        maze (list): Maze layout the model was trained on.
+        duration (float): Seconds to run.
+        env_kwargs: TreasureMaze options (distance, view_radius, target).
+
+    Returns:
+        dict: agents, requests, requests/sec, p50 and p99 request latency
+        in milliseconds, episodes and wins.
+    """
+    latencies = [[] for _ in range(n_agents)]
+    outcomes = [[0, 0] for _ in range(n_agents)]
+    errors = []
+    ready = threading.Barrier(n_agents + 1)
+
+    def agent(i):
+        rng = random.Random(seed + i)
+        qmaze = TreasureMaze(maze, compiled=True, **env_kwargs)
+        cells = [c for c in qmaze.free_cells if c != qmaze.target]
+        times = latencies[i]
+        try:
+            client = connect()
+        except Exception as e:
+            errors.append(e)
+            ready.abort()
+            return
+        try:
+            ready.wait()
+            end = time.perf_counter() + duration
+            while time.perf_counter() < end:
+                qmaze.reset(rng.choice(cells))
+                envstate = qmaze.observe()
+                status = "playing"
+                for _ in range(max_steps):
+                    started = time.perf_counter()
+                    qs = client.q_values(envstate)
+                    times.append(time.perf_counter() - started)
+
+                    row, col = qmaze.state
+                    action = max(qmaze.valid_actions(), key=lambda a: qs[a])
+                    envstate, _, status = qmaze.act(action, row, col)
+                    if status == "win" or time.perf_counter() >= end:
+                        break
+                outcomes[i][0] += 1
+                outcomes[i][1] += status == "win"
+        except Exception as e:
+            errors.append(e)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=agent, args=(i,), daemon=True) for i in range(n_agents)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    all_latencies = np.concatenate([np.asarray(t) for t in latencies]) * 1e3
+    return {
+        "agents": n_agents,
+        "requests": len(all_latencies),
+        "requests_per_sec": len(all_latencies) / elapsed,
+        "p50_ms": float(np.percentile(all_latencies, 50)) if len(all_latencies) else 0.0,
+        "p99_ms": float(np.percentile(all_latencies, 99)) if len(all_latencies) else 0.0,
+        "episodes": sum(o[0] for o in outcomes),
+        "wins": sum(o[1] for o in outcomes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching Q-value server")
+    parser.add_argument("--model", required=True, help="model name under saved_models/")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=1.0)
+    parser.add_argument("--engine", choices=("numpy", "keras"), default="numpy")
+    parser.add_argument("--load", type=int, metavar="N",
+                        help="instead of serving, run N simulated agents against the server")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of --load")
+    parser.add_argument("--size", type=int, default=None, metavar="N",
+                        help="agents play a generated N x N maze (the one the model was trained on)")
+    parser.add_argument("--maze-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    address = args.unix or (args.host, 0 if args.load else args.port)
+    server = InferenceServer(args.model, address, max_batch=args.max_batch,
+                             max_wait_ms=args.max_wait_ms, engine=args.engine)
+
+    with server:
+        if not args.load:
+            print(f"Serving '{args.model}' on {server.address} (Ctrl+C to stop)")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                return
+
+        from main import MAZE
+        from maze_generator import generate_maze
+        maze = MAZE if args.size is None else generate_maze(args.size, seed=args.maze_seed)
+        info = default_registry().info(args.model)
+        env_kwargs = {k: info[k] for k in ("distance", "view_radius") if k in info}
+        if "target" in info:
+            env_kwargs["target"] = tuple(info["target"])
+
+        result = run_load(lambda: InferenceClient(server.address), maze, n_agents=args.load,
+                          duration=args.duration, **env_kwargs)
+        stats = server.stats()
+        print(f"{result['agents']} agents, {result['requests']} requests in {args.duration:.0f}s: "
+              f"{result['requests_per_sec']:.0f} req/s | p50 {result['p50_ms']:.2f} ms | "
+              f"p99 {result['p99_ms']:.2f} ms | mean batch {stats['mean_batch']:.1f} | "
+              f"{result['wins']}/{result['episodes']} episodes won")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,25 +19,53 @@ Description:
     The user can train a new model, load an existing model, visualize the maze,
     or watch the agent navigate it. Models are saved automatically when training
     completes or early-stop criteria are met.
+
+    Run without arguments for the interactive menu, or with a command for
+    batch/headless use:
+        python main.py train --name MODEL --epochs 500
+        python main.py play --model CONVERGED
+        python main.py evaluate --model CONVERGED
+        python main.py render --model CONVERGED --out renders
+        python main.py export --model CONVERGED
+        python main.py play --table saved_models/CONVERGED.qpol
+        python main.py list
+        python main.py train --name MODEL --record datasets/run1
+        python main.py offline --name MODEL2 --dataset datasets/run1
+        python main.py corpus --name GENERAL --corpus corpora/small --held-out 8
+        python main.py train --name MODEL --profile profiles/run1 --profile-epochs 20 10
 """
 from treasure_trainer import TreasureHuntTrainer
-import matplotlib.pyplot as plt
+from treasure_maze import TreasureMaze
+from maze_solver import DISTANCES
+from maze_generator import generate_maze
+from maze_render import MazeRenderer, tile, to_rgb, write_png
+from model_registry import default_registry
+from policy_table import PolicyTable, TABLE_SUFFIX
+from maze_corpus import MazeCorpus, ORDERS
+from profiling import PROFILERS, Profiler, TrainingProfiler
+from contextlib import contextmanager
+import argparse
 import numpy as np
 import os
+import sys
+import time
+
+
+# 7x7 block defines maze
+# 0 = wall, 1 = path
+MAZE = [
+    [1, 0, 1, 1, 1, 1, 1],
+    [1, 1, 1, 0, 0, 1, 0],
+    [0, 0, 0, 1, 1, 1, 0],
+    [1, 1, 1, 1, 0, 0, 1],
+    [1, 0, 0, 0, 1, 1, 1],
+    [1, 0, 1, 1, 1, 1, 1],
+    [1, 1, 1, 0, 1, 1, 1],
+]
 
 
 def main():
-    # 7x7 block defines maze
-    # 0 = wall, 1 = path
-    maze = [
-        [1, 0, 1, 1, 1, 1, 1],
-        [1, 1, 1, 0, 0, 1, 0],
-        [0, 0, 0, 1, 1, 1, 0],
-        [1, 1, 1, 1, 0, 0, 1],
-        [1, 0, 0, 0, 1, 1, 1],
-        [1, 0, 1, 1, 1, 1, 1],
-        [1, 1, 1, 0, 1, 1, 1],
-    ]
+    maze = MAZE
 
     trainer = TreasureHuntTrainer(maze)
 
@@ -86,17 +114,12 @@ def main():
         # LOAD MODEL
         elif choice == "2":
             model_name = input("Enter model name to load: ").strip()
-            filepath = os.path.join("saved_models", f"{model_name}.keras")
 
-            if not os.path.exists(filepath):
-                print(f"Model file not found: {filepath}")
+            if model_name not in trainer.registry:
+                print(f"Model file not found: {trainer.registry.path(model_name)}")
                 print("Available models:")
-                if os.path.exists("saved_models"):
-                    models = [f for f in os.listdir("saved_models") if f.endswith(".keras")]
-                    for m in models:
-                        print(f"  - {m}")
-                else:
-                    print("(No saved_models directory yet)")
+                if not print_models():
+                    print("(No saved models yet)")
                 continue
 
             success = trainer.load_model(model_name)
@@ -109,23 +132,11 @@ def main():
                 print("No model loaded. Train or load one first.")
                 continue
 
-            trainer.play(start_cell=(0, 0), max_steps=300)
+            trainer.play(max_steps=300)
 
         # SHOW MAZE
         elif choice == "4":
-            maze_array = np.array(maze, dtype=float)
-            start = (0, 0)
-            end = (len(maze) - 1, len(maze[0]) - 1)
-            maze_array[start] = 0.5
-            maze_array[end] = 0.7
-
-            plt.figure(figsize=(7, 7))
-            plt.imshow(maze_array, cmap='gray_r', interpolation='none')
-            plt.title("Treasure Maze\n(White = Wall, Black = Path, Light Grey = Start, Dark Grey = Goal)", fontsize=12)
-            plt.xticks([])
-            plt.yticks([])
-            plt.grid(True, which='minor', color='black', linewidth=1)
-            plt.show()
+            show_maze(maze, trainer.qmaze.start, trainer.qmaze.target)
 
         # HELP OPTION
         elif choice == "5":
@@ -141,6 +152,381 @@ def main():
         else:
             print("Invalid choice. Please enter 1–6.")
 
+def show_maze(maze, start=(0, 0), end=None):
+    # matplotlib is only needed for this view, so it is imported here
+    import matplotlib.pyplot as plt
+
+    image = MazeRenderer(maze, start, end).frame()
+
+    plt.figure(figsize=(7, 7))
+    plt.imshow(to_rgb(image), interpolation='none')
+    plt.title("Treasure Maze\n(White = Wall, Black = Path, Green = Start, Gold = Goal)", fontsize=12)
+    plt.xticks([])
+    plt.yticks([])
+    plt.show()
+
+
+def render_rollouts(trainer, out_dir, max_steps=300, n_cells=None, animate=False, cell_px=None):
+    """
+    Greedy rollouts from many start cells written to out_dir: one image per
+    episode (final frame, or a GIF with animate) and grid.png with the final
+    frames of all of them.
+
+    Returns:
+        The evaluate() result the rollouts came from.
+    """
+    result = trainer.evaluate(max_steps=max_steps, n_cells=n_cells, paths=True)
+    q = trainer.qmaze
+    renderer = MazeRenderer(q.maze, q.start, q.target, cell_px=cell_px)
+    os.makedirs(out_dir, exist_ok=True)
+
+    finals = []
+    for (r, c), path in sorted(result["paths"].items()):
+        extension = "gif" if animate else "png"
+        renderer.save(os.path.join(out_dir, f"r{r:03d}_c{c:03d}.{extension}"), path)
+        finals.append(renderer.frame(path[-1], path))
+
+    if finals:
+        write_png(os.path.join(out_dir, "grid.png"), tile(finals))
+    return result
+
+
+def print_models():
+    """
+    One line per saved model with its indexed metadata. Returns the count.
+    """
+    entries = default_registry().entries()
+    if entries:
+        print(f"  {'NAME':<20} {'EPOCHS':>6} {'WIN':>6} {'EVAL':>6} {'SIZE KB':>8}  {'MAZE':<12} {'SAVED'}")
+
+    def rate(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    for name, info in entries.items():
+        print(f"  {name:<20} {info.get('epochs', '-'):>6} {rate(info.get('win_rate')):>6} "
+              f"{rate(info.get('eval_win_rate')):>6} {info.get('file_size', 0) / 1024:>8.0f}  "
+              f"{info.get('maze_hash', '-'):<12} {info.get('saved_at', '-')}")
+    return len(entries)
+
+
+def run_cli(argv):
+    """
+    Non-interactive entry point: python main.py <command> [options].
+
+    Returns the process exit code.
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Treasure Hunt – Deep Q-Learning")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Environment options; a model must be played with the settings it was trained with
+    env = argparse.ArgumentParser(add_help=False)
+    env.add_argument("--size", type=int, default=None, metavar="N",
+                     help="use a generated N x N maze instead of the built-in 7x7 one")
+    env.add_argument("--maze-seed", type=int, default=0, help="seed for --size")
+    env.add_argument("--target", type=int, nargs=2, default=None, metavar=("ROW", "COL"),
+                     help="treasure cell (default: bottom-right)")
+    env.add_argument("--distance", choices=DISTANCES, default="manhattan",
+                     help="distance used for reward shaping and observations")
+    env.add_argument("--view-radius", type=int, default=0, metavar="R",
+                     help="add the (2R+1)^2 local wall layout to observations")
+
+    # CPU and memory profiling (see profiling.py)
+    profile = argparse.ArgumentParser(add_help=False)
+    profile.add_argument("--profile", metavar="DIR",
+                         help="write CPU and memory profile reports (flame-graph stacks, "
+                              "summary.txt) to DIR")
+    profile.add_argument("--profiler", choices=PROFILERS, default="sampling",
+                         help="stack sampling (low overhead) or cProfile (every call)")
+    profile.add_argument("--profile-cpu-only", action="store_true",
+                         help="skip tracemalloc, which slows allocation down")
+
+    # Optional failing exit code for scripts; a low win rate is otherwise a result, not an error
+    threshold = argparse.ArgumentParser(add_help=False)
+    threshold.add_argument("--min-win-rate", type=float, default=None, metavar="RATE",
+                           help="exit with status 1 if the win rate is below RATE")
+
+    train = commands.add_parser("train", parents=[env, profile], help="train a new model")
+    train.add_argument("--name", required=True, help="model name under saved_models/")
+    train.add_argument("--epochs", type=int, default=500)
+    train.add_argument("--max-steps", type=int, default=300)
+    train.add_argument("--metrics-log", help="write per-epoch JSONL metrics to this file")
+    train.add_argument("--quiet", action="store_true", help="no per-epoch log lines")
+    train.add_argument("--eval-interval", type=int, default=None, metavar="N",
+                       help="early-stop on a greedy evaluation from every free cell every N epochs")
+    train.add_argument("--checkpoint-interval", type=int, default=None, metavar="N",
+                       help="write a resumable checkpoint every N epochs")
+    train.add_argument("--resume", action="store_true",
+                       help="continue from the model's checkpoint if there is one")
+    train.add_argument("--update-step", choices=("keras", "compiled"), default="keras",
+                       help="gradient step: host-built targets or one compiled TensorFlow graph")
+    train.add_argument("--target-tau", type=float, default=1.0, metavar="TAU",
+                       help="below 1, Polyak-average the target network after every gradient step")
+    train.add_argument("--n-step", type=int, default=1, metavar="N",
+                       help="sum N discounted rewards into each replay target")
+    train.add_argument("--record", metavar="DIR",
+                       help="append every transition played to the trajectory dataset in DIR")
+    train.add_argument("--inference", choices=("numpy", "keras"), default="numpy",
+                       help="forward passes for acting and replay targets")
+    train.add_argument("--profile-epochs", type=int, nargs=2, default=(0, 5),
+                       metavar=("SKIP", "COUNT"),
+                       help="epochs covered by --profile, counted from the first one run")
+
+    offline = commands.add_parser("offline", parents=[env, threshold],
+                                  help="train a new model from a recorded trajectory dataset")
+    offline.add_argument("--name", required=True, help="model name under saved_models/")
+    offline.add_argument("--dataset", required=True, metavar="DIR")
+    offline.add_argument("--passes", type=int, default=1, help="passes over the dataset")
+    offline.add_argument("--max-grad-steps", type=int, default=None, metavar="N")
+    offline.add_argument("--eval-interval", type=int, default=1000, metavar="N",
+                         help="gradient steps between greedy evaluations (early stop at 95%%)")
+    offline.add_argument("--max-steps", type=int, default=300)
+    offline.add_argument("--update-step", choices=("keras", "compiled"), default="keras",
+                         help="gradient step: host-built targets or one compiled TensorFlow graph")
+
+    corpus = commands.add_parser("corpus", parents=[threshold], help="train one model across a corpus of mazes "
+                                                "(generate one with maze_corpus.py)")
+    corpus.add_argument("--name", required=True, help="model name under saved_models/")
+    corpus.add_argument("--corpus", required=True, metavar="DIR")
+    corpus.add_argument("--episodes", type=int, default=5000)
+    corpus.add_argument("--held-out", type=int, default=0, metavar="K",
+                        help="keep K random mazes out of training and report the zero-shot "
+                             "win rate on them")
+    corpus.add_argument("--curriculum", choices=ORDERS, default=None,
+                        help="start from the smallest or easiest mazes and add the rest over "
+                             "--ramp-episodes")
+    corpus.add_argument("--ramp-episodes", type=int, default=1000, metavar="N")
+    corpus.add_argument("--eval-interval", type=int, default=100, metavar="N",
+                        help="episodes between greedy evaluations on the training mazes")
+    corpus.add_argument("--cache-size", type=int, default=16, metavar="N",
+                        help="compiled mazes kept in memory")
+    corpus.add_argument("--max-steps", type=int, default=300)
+    corpus.add_argument("--distance", choices=DISTANCES, default="geodesic")
+    corpus.add_argument("--view-radius", type=int, default=1, metavar="R")
+    corpus.add_argument("--update-step", choices=("keras", "compiled"), default="keras")
+    corpus.add_argument("--n-step", type=int, default=1, metavar="N")
+    corpus.add_argument("--quiet", action="store_true")
+
+    play = commands.add_parser("play", parents=[env, profile],
+                               help="play one episode with a saved model")
+    source = play.add_mutually_exclusive_group(required=True)
+    source.add_argument("--model")
+    source.add_argument("--table", metavar="FILE",
+                        help="play from an exported policy table, without TensorFlow")
+    play.add_argument("--start", type=int, nargs=2, default=None, metavar=("ROW", "COL"))
+    play.add_argument("--max-steps", type=int, default=300)
+    play.add_argument("--render", action="store_true", help="show the path in a matplotlib window")
+    play.add_argument("--save", metavar="FILE",
+                      help="write the episode to FILE: .gif animation or .png final frame")
+
+    evaluate = commands.add_parser("evaluate", parents=[env, profile, threshold],
+                                   help="greedy rollouts from every free cell")
+    source = evaluate.add_mutually_exclusive_group(required=True)
+    source.add_argument("--model")
+    source.add_argument("--table", metavar="FILE",
+                        help="evaluate an exported policy table, without TensorFlow")
+    evaluate.add_argument("--max-steps", type=int, default=300)
+    evaluate.add_argument("--cells", type=int, default=None, metavar="N",
+                          help="evaluate a random sample of N start cells")
+
+    render = commands.add_parser("render", parents=[env],
+                                 help="write greedy rollouts from many start cells as images")
+    render.add_argument("--model", required=True)
+    render.add_argument("--max-steps", type=int, default=300)
+    render.add_argument("--cells", type=int, default=None, metavar="N",
+                        help="render a random sample of N start cells")
+    render.add_argument("--out", default="renders", help="output directory")
+    render.add_argument("--gif", action="store_true", help="animate each episode")
+    render.add_argument("--cell-px", type=int, default=None, metavar="PX", help="pixels per cell")
+
+    export = commands.add_parser("export", parents=[env],
+                                 help="compile a saved model into a per-cell policy table")
+    export.add_argument("--model", required=True)
+    export.add_argument("--out", default=None, metavar="FILE",
+                        help=f"table file (default: saved_models/MODEL{TABLE_SUFFIX})")
+
+    commands.add_parser("list", help="list saved models with their metadata")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print_models()
+        return 0
+
+    if args.command == "corpus":
+        return run_corpus(args)
+
+    if getattr(args, "table", None):
+        return run_table(args)
+
+    # The generated maze is carved for the start and target the agent uses,
+    # so it is solvable for them
+    start = (0, 0)
+    target = None if args.target is None else tuple(args.target)
+    rows, cols = np.shape(MAZE) if args.size is None else (args.size, args.size)
+    if target is not None and not (0 <= target[0] < rows and 0 <= target[1] < cols):
+        parser.error(f"--target {target} is outside the {rows}x{cols} maze")
+    if args.size is None:
+        maze = MAZE
+        if target is not None and MAZE[target[0]][target[1]] != 1.0:
+            parser.error(f"--target {target} is a wall of the built-in maze")
+    else:
+        maze = generate_maze(args.size, start=start, target=target, seed=args.maze_seed)
+    trainer = TreasureHuntTrainer(maze, start=start, distance=args.distance,
+                                  target=target, view_radius=args.view_radius,
+                                  update_step=getattr(args, "update_step", "keras"),
+                                  target_tau=getattr(args, "target_tau", 1.0),
+                                  n_step=getattr(args, "n_step", 1),
+                                  inference=getattr(args, "inference", "numpy"),
+                                  verbose=not getattr(args, "quiet", False))
+
+    if args.command == "train":
+        callbacks = []
+        if args.profile:
+            skip, count = args.profile_epochs
+            callbacks.append(TrainingProfiler(args.profile, skip, count, mode=args.profiler,
+                                              memory=not args.profile_cpu_only))
+        summary = trainer.train(n_epoch=args.epochs, model_name=args.name,
+                                max_steps=args.max_steps, metrics_log=args.metrics_log,
+                                eval_interval=args.eval_interval,
+                                checkpoint_interval=args.checkpoint_interval, resume=args.resume,
+                                record=args.record, callbacks=callbacks)
+        print(f"Trained '{args.name}': {summary['epochs']} epochs, "
+              f"win rate {summary['win_rate']:.3f}, {summary['seconds']:.0f}s")
+        if callbacks and callbacks[0].summary is not None:
+            print(f"Profile of {callbacks[0].profiler.label} written to {args.profile}/")
+        return 0
+
+    if args.command == "offline":
+        summary = trainer.train_offline(args.dataset, passes=args.passes,
+                                        max_grad_steps=args.max_grad_steps, model_name=args.name,
+                                        eval_interval=args.eval_interval, max_steps=args.max_steps)
+        print(f"Trained '{args.name}' offline: {summary['grad_steps']} gradient steps, "
+              f"eval win rate {summary['eval_win_rate']:.3f}, {summary['seconds']:.0f}s")
+        return win_rate_status(summary["eval_win_rate"], args.min_win_rate)
+
+    if not trainer.load_model(args.model):
+        return 1
+
+    if args.command == "play":
+        with profiled(args, "play"):
+            trainer.play(start_cell=args.start, max_steps=args.max_steps, render=args.render,
+                         save=args.save)
+        return 0
+
+    if args.command == "export":
+        out = args.out or os.path.splitext(trainer.registry.path(args.model))[0] + TABLE_SUFFIX
+        table = PolicyTable.from_model(trainer.model, trainer.qmaze, model_name=args.model)
+        table.save(out)
+        print(f"Wrote the policy for {len(table.q_values)} cells to {out} "
+              f"({os.path.getsize(out)} bytes)")
+        return 0
+
+    if args.command == "render":
+        started = time.perf_counter()
+        result = render_rollouts(trainer, args.out, max_steps=args.max_steps,
+                                 n_cells=args.cells, animate=args.gif, cell_px=args.cell_px)
+        print(f"Wrote {result['episodes']} episodes and grid.png to {args.out}/ "
+              f"(win rate {result['win_rate']:.3f}, {time.perf_counter() - started:.1f}s)")
+        return 0
+
+    with profiled(args, "evaluate"):
+        result = trainer.evaluate(max_steps=args.max_steps, n_cells=args.cells)
+    return print_evaluation(result, args.min_win_rate)
+
+
+@contextmanager
+def profiled(args, label):
+    """
+    Profile the block when --profile was given.
+    """
+    if not getattr(args, "profile", None):
+        yield
+        return
+    with Profiler(args.profile, mode=args.profiler, memory=not args.profile_cpu_only, label=label):
+        yield
+    print(f"Profile of {label} written to {args.profile}/")
+
+
+def print_evaluation(result, min_win_rate=None):
+    """
+    Print an evaluate() result; returns the CLI exit code (see
+    win_rate_status).
+    """
+    print(f"Win rate: {result['win_rate']:.3f} "
+          f"({result['wins']}/{result['episodes']} start cells)")
+    print(f"Shortest path taken: {result['optimal_rate']:.3f} | "
+          f"Path length / shortest: {result['path_ratio']:.2f} | "
+          f"Greedy action optimal: {result['policy_agreement']:.3f} of cells")
+    return win_rate_status(result["win_rate"], min_win_rate)
+
+
+def win_rate_status(win_rate, min_win_rate=None):
+    """
+    CLI exit code of a finished run: 1 only when min_win_rate is given and
+    the win rate falls below it.
+    """
+    if min_win_rate is not None and win_rate < min_win_rate:
+        print(f"Win rate below --min-win-rate {min_win_rate:.3f}")
+        return 1
+    return 0
+
+
+def run_corpus(args):
+    """
+    Train one model on a maze corpus, then score it on the held-out mazes.
+    """
+    from corpus_trainer import CorpusTrainer
+
+    corpus = MazeCorpus(args.corpus, cache_size=args.cache_size, distance=args.distance,
+                        view_radius=args.view_radius)
+    names, held_out = corpus.split(args.held_out)
+    trainer = CorpusTrainer(corpus, names, order=args.curriculum,
+                            ramp_episodes=args.ramp_episodes, max_steps=args.max_steps,
+                            update_step=args.update_step, n_step=args.n_step)
+    summary = trainer.train(max_episodes=args.episodes, model_name=args.name,
+                            eval_interval=args.eval_interval, verbose=not args.quiet)
+    print(f"Trained '{args.name}' on {summary['mazes']} mazes: {summary['epochs']} episodes, "
+          f"eval win rate {summary['eval_win_rate'] or 0.0:.3f}, {summary['seconds']:.0f}s "
+          f"({summary['seconds_per_maze']:.1f}s per maze)")
+
+    if held_out:
+        result = trainer.evaluate(held_out)
+        print(f"Zero-shot win rate on {len(held_out)} held-out mazes: {result['win_rate']:.3f} "
+              f"(shortest path taken: {result['optimal_rate']:.3f})")
+        for name, rate in result["mazes"].items():
+            print(f"  {name:<20} {rate:.3f}")
+    return win_rate_status(summary["eval_win_rate"] or 0.0, args.min_win_rate)
+
+
+def run_table(args):
+    """
+    play and evaluate from an exported policy table. The table holds its
+    own maze, so the environment options are ignored, and TensorFlow is
+    never imported.
+    """
+    table = PolicyTable.load(args.table)
+
+    if args.command == "evaluate":
+        with profiled(args, "evaluate"):
+            result = table.evaluate(max_steps=args.max_steps, n_cells=args.cells)
+        return print_evaluation(result, args.min_win_rate)
+
+    with profiled(args, "play"):
+        won, path = table.play(args.start, max_steps=args.max_steps)
+    print(f"Start: {path[0]} | Target: {table.target}")
+    if won:
+        print(f"WIN! Agent reached the treasure in {len(path) - 1} steps.")
+    else:
+        print("Timeout — Agent failed to reach the goal.")
+
+    if args.render:
+        TreasureMaze(table.maze, path[0], target=table.target).show(path=path)
+    if args.save:
+        MazeRenderer(table.maze, path[0], table.target).save(args.save, path)
+        print(f"Episode written to {args.save}")
+    return 0
+
+
 def show_help():
     print("\n" + "=" * 50)
     print("               TREASURE HUNT – HELP MENU")
@@ -204,4 +590,6 @@ Enjoy exploring machine learning with Treasure Hunt!
 
 if __name__ == "__main__":
     os.makedirs("saved_models", exist_ok=True)
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+Maze corpora: many layouts on disk, loaded on demand into a bounded cache.
+
+A corpus is a directory of mazes plus an index:
+
+    index.json      one entry per maze: file, shape, free cells, start,
+                    target, shortest start-to-target path and maze hash
+    <name>.npy      the grid as uint8, 1 = path and 0 = wall
+
+Opening a corpus reads only index.json, so sizes, difficulties and the
+curriculum order are known without touching the mazes. MazeCorpus.env()
+loads a layout the first time it is asked for and keeps the compiled
+TreasureMaze in an LRU cache of cache_size environments; building one costs
+a distance field and the per-cell tables, so the cache bounds both memory
+and rebuilds when training cycles through more mazes than it holds.
+
+Create one with write_corpus() from your own layouts, or generate one:
+    python maze_corpus.py corpora/small --count 40 --sizes 7 11 --seed 0
+"""
+import argparse
+import json
+import math
+import os
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+from maze_generator import generate_maze
+from maze_solver import solve
+from model_registry import maze_hash
+from treasure_maze import TreasureMaze
+
+INDEX_FILE = "index.json"
+MAZE_SUFFIX = ".npy"
+ORDERS = ("size", "difficulty")
+
+
+def _write_index(directory, index):
+    path = os.path.join(directory, INDEX_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def write_corpus(directory, mazes, start=(0, 0)):
+    """
+    Write layouts to a corpus directory, adding to any index already there.
+
+    Parameters:
+        directory (str): Corpus directory, created if needed.
+        mazes (dict or iterable): {name: grid}, or grids named maze_00000,
+            maze_00001, ... after the mazes already in the corpus.
+        start (tuple): Start cell of every maze; the target is the
+            bottom-right cell.
+
+    Returns:
+        list: Names of the mazes written.
+
+    Raises:
+        ValueError: A maze has no path from start to target.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX_FILE)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    if not isinstance(mazes, dict):
+        mazes = {f"maze_{len(index) + i:05d}": grid for i, grid in enumerate(mazes)}
+
+    for name, grid in mazes.items():
+        grid = np.asarray(grid)
+        target = (grid.shape[0] - 1, grid.shape[1] - 1)
+        shortest = int(solve(grid, target).distance[tuple(start)])
+        if shortest < 0:
+            raise ValueError(f"Maze '{name}' has no path from {tuple(start)} to {target}.")
+
+        np.save(os.path.join(directory, name + MAZE_SUFFIX), (grid == 1.0).astype(np.uint8))
+        index[name] = {
+            "file": name + MAZE_SUFFIX,
+            "shape": list(grid.shape),
+            "free_cells": int((grid == 1.0).sum()),
+            "start": list(start),
+            "target": list(target),
+            "shortest_path": shortest,
+            "maze_hash": maze_hash(grid),
+        }
+
+    _write_index(directory, index)
+    return list(mazes)
+
+
+def generate_corpus(directory, count, sizes=(7, 11), loop_fraction=0.1, seed=0):
+    """
+    Write count generated mazes with sides drawn uniformly from the
+    inclusive range sizes.
+
+    Returns:
+        list: Names of the mazes written.
+    """
+    rng = random.Random(seed)
+    low, high = sizes
+    return write_corpus(directory, [
+        generate_maze(rng.randint(low, high), loop_fraction=loop_fraction, seed=rng.randrange(2**31))
+        for _ in range(count)
+    ])
+
+
+class MazeCorpus:
+    """
+    Index of a corpus directory with an LRU cache of compiled environments.
+
+    Usage:
+        corpus = MazeCorpus("corpora/small", distance="geodesic")
+        train, held_out = corpus.split(8, seed=0)
+        qmaze = corpus.env(train[0])        # loaded and compiled on first use
+    """
+
+    def __init__(self, directory, cache_size=16, distance="manhattan", view_radius=0):
+        """
+        Parameters:
+            directory (str): Corpus directory written by write_corpus().
+            cache_size (int): Compiled environments kept in memory.
+            distance (str): Distance for every environment; see TreasureMaze.
+            view_radius (int): Local view for every environment; see
+                TreasureMaze. All mazes then produce observations of the
+                same size, so one network plays any of them.
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self.distance = distance
+        self.view_radius = view_radius
+        self.disk_loads = 0
+        self._cache = OrderedDict()
+
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.names = sorted(self.index)
+        if not self.names:
+            raise ValueError(f"Corpus {directory} holds no mazes.")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def info(self, name):
+        return dict(self.index[name])
+
+    def key(self, name, order):
+        """
+        Curriculum sort key of a maze: its number of free cells for "size",
+        its shortest start-to-target path for "difficulty".
+        """
+        if order == "size":
+            return self.index[name]["free_cells"]
+        if order == "difficulty":
+            return self.index[name]["shortest_path"]
+        raise ValueError(f"Unknown order '{order}'. Choose from: {', '.join(ORDERS)}")
+
+    def split(self, n_held_out, seed=0):
+        """
+        Random (training names, held-out names) partition of the corpus.
+        """
+        names = list(self.names)
+        random.Random(seed).shuffle(names)
+        return sorted(names[n_held_out:]), sorted(names[:n_held_out])
+
+    def load(self, name):
+        """
+        The maze grid as a float array, read from disk.
+        """
+        return np.load(os.path.join(self.directory, self.index[name]["file"])).astype(float)
+
+    def env(self, name):
+        """
+        Compiled TreasureMaze for name, built on first use and cached. The
+        instance is shared; reset() it before playing.
+        """
+        env = self._cache.get(name)
+        if env is not None:
+            self._cache.move_to_end(name)
+            return env
+
+        info = self.index[name]
+        env = TreasureMaze(self.load(name), tuple(info["start"]), compiled=True,
+                           distance=self.distance, target=tuple(info["target"]),
+                           view_radius=self.view_radius)
+        self.disk_loads += 1
+
+        self._cache[name] = env
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return env
+
+
+class CurriculumSampler:
+    """
+    Picks the maze for each training episode.
+
+    Without an order every maze is equally likely throughout. With one, the
+    mazes are sorted by it and episodes are drawn from a pool of the easiest
+    start_fraction of them that grows linearly to the whole list over
+    ramp_episodes.
+    """
+
+    def __init__(self, corpus, names=None, order=None, start_fraction=0.25,
+                 ramp_episodes=1000, seed=0):
+        """
+        Parameters:
+            corpus (MazeCorpus): Corpus the names belong to.
+            names (list): Mazes to sample from (default: all of them).
+            order (str): None, "size" or "difficulty".
+            start_fraction (float): Share of the sorted mazes available at
+                the first episode.
+            ramp_episodes (int): Episodes until every maze is available.
+            seed (int): Random seed.
+        """
+        names = list(corpus.names if names is None else names)
+        if order is not None:
+            names.sort(key=lambda name: (corpus.key(name, order), name))
+        self.names = names
+        self.order = order
+        self.start_fraction = start_fraction
+        self.ramp_episodes = ramp_episodes
+        self._rng = random.Random(seed)
+
+    def pool_size(self, episode):
+        """
+        Number of mazes (from the start of self.names) available at episode.
+        """
+        if self.order is None or self.ramp_episodes <= 0:
+            return len(self.names)
+        fraction = min(1.0, self.start_fraction
+                       + (1.0 - self.start_fraction) * episode / self.ramp_episodes)
+        return max(1, min(len(self.names), math.ceil(fraction * len(self.names))))
+
+    def sample(self, episode):
+        return self.names[self._rng.randrange(self.pool_size(episode))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a maze corpus")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--sizes", type=int, nargs=2, default=(7, 11), metavar=("MIN", "MAX"),
+                        help="inclusive range of maze sides")
+    parser.add_argument("--loop-fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = generate_corpus(args.directory, args.count, args.sizes,
+                            loop_fraction=args.loop_fraction, seed=args.seed)
+    print(f"Wrote {len(names)} mazes to {args.directory}/")
+
+
+if __name__ == "__main__":
+    main()
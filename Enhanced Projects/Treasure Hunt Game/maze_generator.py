@@ -0,0 +1,109 @@
+"""
+Procedural maze layouts for TreasureMaze.
+
+generate_maze() carves a random spanning tree over the cells with even
+coordinates (iterative randomized depth-first search), so every one of them
+is connected to every other, then knocks out a fraction of the remaining
+walls between neighbouring cells to add loops. Start and target are always
+open and joined to the tree, so the layout is solvable at any size.
+
+Example:
+    maze = generate_maze(100, seed=0)
+    trainer = TreasureHuntTrainer(maze, distance="geodesic")
+"""
+import random
+
+import numpy as np
+
+
+def _join(grid, cell):
+    """
+    Open cell and connect it to the tree cell at its even-coordinate corner.
+    """
+    r, c = cell
+    grid[r, c] = 1.0
+    grid[r - r % 2, c] = 1.0
+    grid[r - r % 2, c - c % 2] = 1.0
+
+
+def generate_maze(rows, cols=None, loop_fraction=0.1, start=(0, 0), target=None, seed=None):
+    """
+    Random solvable maze.
+
+    Parameters:
+        rows (int): Grid height (at least 2).
+        cols (int): Grid width (default: rows).
+        loop_fraction (float): Share of the walls between neighbouring cells
+            that are removed after carving. 0 gives a perfect maze, with
+            exactly one path between any two cells.
+        start (tuple): Cell that must be open.
+        target (tuple): Cell that must be open and reachable from start
+            (default: bottom-right).
+        seed (int): Random seed.
+
+    Returns:
+        ndarray: (rows, cols) float grid, 1 = path and 0 = wall.
+    """
+    cols = rows if cols is None else cols
+    if rows < 2 or cols < 2:
+        raise ValueError("Mazes must be at least 2x2.")
+    if target is None:
+        target = (rows - 1, cols - 1)
+
+    rng = random.Random(seed)
+
+    # Tree cells sit at even (row, col); number them row-major
+    R, C = (rows + 1) // 2, (cols + 1) // 2
+    visited = bytearray(R * C)
+    visited[0] = 1
+    stack = [0]
+    parents, children = [], []
+
+    while stack:
+        cell = stack[-1]
+        r, c = divmod(cell, C)
+
+        neighbours = []
+        if r > 0 and not visited[cell - C]:
+            neighbours.append(cell - C)
+        if r < R - 1 and not visited[cell + C]:
+            neighbours.append(cell + C)
+        if c > 0 and not visited[cell - 1]:
+            neighbours.append(cell - 1)
+        if c < C - 1 and not visited[cell + 1]:
+            neighbours.append(cell + 1)
+
+        if not neighbours:
+            stack.pop()
+            continue
+
+        nxt = neighbours[rng.randrange(len(neighbours))]
+        visited[nxt] = 1
+        parents.append(cell)
+        children.append(nxt)
+        stack.append(nxt)
+
+    grid = np.zeros((rows, cols))
+    grid[::2, ::2] = 1.0
+
+    # The wall between two tree cells sits at the sum of their coordinates
+    pr, pc = np.divmod(np.array(parents, dtype=np.int64), C)
+    cr, cc = np.divmod(np.array(children, dtype=np.int64), C)
+    grid[pr + cr, pc + cc] = 1.0
+
+    # Loops: open walls that separate two tree cells
+    if loop_fraction > 0:
+        np_rng = np.random.default_rng(seed)
+        walls = np.zeros((rows, cols), dtype=bool)
+        walls[1:-1:2, ::2] = True     # between vertical neighbours
+        walls[::2, 1:-1:2] = True     # between horizontal neighbours
+        if rows % 2 == 0:
+            walls[-1, :] = False
+        if cols % 2 == 0:
+            walls[:, -1] = False
+        walls &= grid == 0.0
+        grid[walls & (np_rng.random((rows, cols)) < loop_fraction)] = 1.0
+
+    _join(grid, start)
+    _join(grid, target)
+    return grid
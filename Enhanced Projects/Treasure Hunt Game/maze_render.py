@@ -0,0 +1,304 @@
+"""
+Headless raster rendering of mazes and episode paths.
+
+MazeRenderer draws a maze, the agent and its path straight into a NumPy
+array of palette indices: each cell is a cell_px x cell_px block, with
+optional grid lines. Frames of an episode are produced by repainting only
+the cells that changed. write_png() and write_gif() encode index images
+with the standard library (zlib and a small LZW encoder), so writing
+hundreds of rollouts needs neither a display nor matplotlib. GIF frames
+after the first store only the rectangle that changed.
+
+Example:
+    renderer = MazeRenderer(maze)
+    renderer.save("episode.gif", path)             # animation
+    renderer.save("episode.png", path)             # final frame
+    write_png("grid.png", tile([renderer.frame(p[-1], p) for p in paths]))
+"""
+import math
+import struct
+import zlib
+
+import numpy as np
+
+# Palette indices; walls and paths keep the white/black of the pyplot view
+WALL, FREE, TRAIL, AGENT, START, TARGET, GRID, BACKGROUND = range(8)
+
+PALETTE = np.array([
+    (255, 255, 255),    # WALL
+    (0, 0, 0),          # FREE
+    (70, 130, 180),     # TRAIL: cells the agent has visited
+    (255, 140, 0),      # AGENT
+    (60, 179, 113),     # START
+    (255, 215, 0),      # TARGET
+    (96, 96, 96),       # GRID lines
+    (40, 40, 40),       # BACKGROUND between tiles
+], dtype=np.uint8)
+
+
+class MazeRenderer:
+    """
+    Renders one maze layout at a fixed scale.
+
+    Images are (height, width) uint8 arrays of PALETTE indices; to_rgb()
+    converts them for display.
+    """
+
+    def __init__(self, maze, start=(0, 0), target=None, cell_px=None, grid=None):
+        """
+        Parameters:
+            maze (list or ndarray): Grid of 1 (path) and 0 (wall).
+            start (tuple): Start cell, drawn in the START colour.
+            target (tuple): Treasure cell (default: bottom-right).
+            cell_px (int): Pixels per cell (default: about 256 pixels
+                across the longer side, at least 1).
+            grid (bool): Draw one-pixel grid lines between cells (default:
+                when cell_px is 4 or more).
+        """
+        free = np.asarray(maze) == 1.0
+        rows, cols = free.shape
+        self.start = tuple(start)
+        self.target = (rows - 1, cols - 1) if target is None else tuple(target)
+        self.cell_px = cell_px or max(1, 256 // max(rows, cols))
+        self.grid = self.cell_px >= 4 if grid is None else grid
+        self._inset = self.cell_px // 4 if self.cell_px >= 4 else 0
+
+        codes = np.where(free, FREE, WALL).astype(np.uint8)
+        codes[self.start] = START
+        codes[self.target] = TARGET
+        self.codes = codes
+        self.base = self._upscale(codes)
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    def _upscale(self, codes):
+        px = self.cell_px
+        image = np.repeat(np.repeat(codes, px, axis=0), px, axis=1)
+        if self.grid:
+            image[px - 1::px, :] = GRID
+            image[:, px - 1::px] = GRID
+        return image
+
+    def _paint(self, image, cell, code, inset=0):
+        px = self.cell_px
+        end = px - int(self.grid) - inset
+        r, c = cell
+        image[r * px + inset:r * px + end, c * px + inset:c * px + end] = code
+
+    def _trail_code(self, cell):
+        code = self.codes[cell]
+        return TRAIL if code == FREE else code
+
+    def frame(self, agent=None, path=()):
+        """
+        One image: the maze, path cells in the TRAIL colour (start and
+        target keep theirs) and the agent, if given, on top.
+        """
+        codes = self.codes.copy()
+        if len(path):
+            rows, cols = np.asarray(path, dtype=np.int64).reshape(-1, 2).T
+            codes[rows, cols] = np.where(codes[rows, cols] == FREE, TRAIL, codes[rows, cols])
+
+        image = self._upscale(codes)
+        if agent is not None:
+            self._paint(image, agent, AGENT, self._inset)
+        return image
+
+    def episode(self, path):
+        """
+        Yield one image per position in path: the agent at that position
+        with the trail behind it. Only the two cells that change are
+        repainted between frames.
+        """
+        image = self.base.copy()
+        previous = None
+        for cell in path:
+            cell = tuple(cell)
+            if previous is not None:
+                self._paint(image, previous, self._trail_code(previous))
+            self._paint(image, cell, self._trail_code(cell))
+            self._paint(image, cell, AGENT, self._inset)
+            previous = cell
+            yield image.copy()
+
+    def save(self, filename, path, frame_ms=100):
+        """
+        Write an episode: an animation for .gif, the final frame otherwise.
+        """
+        if filename.lower().endswith(".gif"):
+            write_gif(filename, self.episode(path), frame_ms=frame_ms)
+        else:
+            write_png(filename, self.frame(path[-1] if len(path) else None, path))
+
+
+def to_rgb(image, palette=PALETTE):
+    """
+    (height, width, 3) uint8 RGB array for an index image.
+    """
+    return palette[image]
+
+
+def tile(images, columns=None, pad=4, fill=BACKGROUND):
+    """
+    Arrange equally sized images in a grid, row-major, pad pixels apart.
+    """
+    images = list(images)
+    if not images:
+        raise ValueError("No images to tile.")
+    columns = columns or math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    h, w = images[0].shape
+
+    sheet = np.full((rows * (h + pad) + pad, columns * (w + pad) + pad), fill, dtype=np.uint8)
+    for i, image in enumerate(images):
+        r, c = divmod(i, columns)
+        top, left = pad + r * (h + pad), pad + c * (w + pad)
+        sheet[top:top + h, left:left + w] = image
+    return sheet
+
+
+def _chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def write_png(filename, image, palette=PALETTE):
+    """
+    Write an index image as an 8-bit palette PNG.
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape
+
+    # Every scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = image
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+        f.write(_chunk(b"PLTE", np.asarray(palette, dtype=np.uint8).tobytes()))
+        f.write(_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(_chunk(b"IEND", b""))
+
+
+def _lzw(data, min_code_size):
+    """
+    GIF-flavoured LZW: variable code width from min_code_size + 1 up to 12
+    bits, a clear code first and whenever the table fills, packed LSB first.
+    """
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    buffer = 0
+    nbits = 0
+
+    code_size = min_code_size + 1
+    next_code = end + 1
+    table = {}
+
+    def reset():
+        nonlocal code_size, next_code
+        table.clear()
+        code_size = min_code_size + 1
+        next_code = end + 1
+
+    # Emit clear, then the codes; widen after the emit that fills the width
+    buffer |= clear << nbits
+    nbits += code_size
+
+    prefix = data[0]
+    for k in data[1:]:
+        code = table.get((prefix << 8) | k)
+        if code is not None:
+            prefix = code
+            continue
+
+        buffer |= prefix << nbits
+        nbits += code_size
+        while nbits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            nbits -= 8
+
+        if next_code < 4096:
+            if next_code > (1 << code_size) - 1 and code_size < 12:
+                code_size += 1
+            table[(prefix << 8) | k] = next_code
+            next_code += 1
+        else:
+            buffer |= clear << nbits
+            nbits += code_size
+            reset()
+        prefix = k
+
+    for code in (prefix, end):
+        buffer |= code << nbits
+        nbits += code_size
+        if next_code > (1 << code_size) - 1 and code_size < 12:
+            code_size += 1
+    while nbits > 0:
+        out.append(buffer & 0xFF)
+        buffer >>= 8
+        nbits -= 8
+
+    # Data sub-blocks of at most 255 bytes, then a zero-length terminator
+    blocks = bytearray()
+    for i in range(0, len(out), 255):
+        block = out[i:i + 255]
+        blocks.append(len(block))
+        blocks += block
+    blocks.append(0)
+    return bytes(blocks)
+
+
+def write_gif(filename, frames, palette=PALETTE, frame_ms=100, loop=0):
+    """
+    Write index images as a looping GIF animation.
+
+    Parameters:
+        frames (iterable): Equally sized index images.
+        frame_ms (int): Display time per frame (GIF resolution is 10 ms).
+        loop (int): Repeat count; 0 loops forever.
+    """
+    palette = np.asarray(palette, dtype=np.uint8)
+    table_bits = max(1, math.ceil(math.log2(len(palette))))
+    table = np.zeros((1 << table_bits, 3), dtype=np.uint8)
+    table[:len(palette)] = palette
+    min_code_size = max(2, table_bits)
+    delay = max(1, round(frame_ms / 10))
+
+    previous = None
+    with open(filename, "wb") as f:
+        for image in frames:
+            image = np.asarray(image, dtype=np.uint8)
+            if previous is None:
+                height, width = image.shape
+                f.write(b"GIF89a")
+                f.write(struct.pack("<HHBBB", width, height, 0xF0 | (table_bits - 1), 0, 0))
+                f.write(table.tobytes())
+                f.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+                top, left, patch = 0, 0, image
+            else:
+                # Only the bounding box of the changed pixels
+                changed = image != previous
+                rows = np.flatnonzero(changed.any(axis=1))
+                cols = np.flatnonzero(changed.any(axis=0))
+                if len(rows):
+                    top, left = rows[0], cols[0]
+                    patch = image[top:rows[-1] + 1, left:cols[-1] + 1]
+                else:
+                    top, left, patch = 0, 0, image[:1, :1]
+
+            # Graphic control: keep the previous frame underneath, set the delay
+            f.write(b"\x21\xF9\x04\x04" + struct.pack("<H", delay) + b"\x00\x00")
+            h, w = patch.shape
+            f.write(b"\x2C" + struct.pack("<HHHHB", left, top, w, h, 0))
+            f.write(bytes([min_code_size]))
+            f.write(_lzw(patch.tobytes(), min_code_size))
+            previous = image
+
+        if previous is None:
+            raise ValueError("No frames to write.")
+        f.write(b"\x3B")
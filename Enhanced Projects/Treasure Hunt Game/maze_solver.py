@@ -0,0 +1,169 @@
+"""
+Exact shortest-path solver for Treasure Maze layouts.
+
+solve() runs one breadth-first search from the target over the free cells
+(value iteration with unit step costs converges to the same field) and
+returns a MazeSolution: the geodesic distance from every cell to the target
+and the optimal action(s) from every cell. Solutions are cached per
+(layout, target), so every environment built on the same maze shares one.
+
+The distance field can replace Manhattan distance for reward shaping and the
+observation's distance feature (TreasureMaze(distance="geodesic")), and the
+optimal actions make an instant oracle policy and a ground truth for scoring
+trained models.
+"""
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+
+# Distance measures accepted by TreasureMaze, VectorTreasureMaze and the trainer
+DISTANCES = ("manhattan", "geodesic")
+
+
+class MazeSolution:
+    """
+    Shortest-path distances and optimal actions towards one target.
+
+    Attributes:
+        target (tuple): Goal cell.
+        distance (ndarray): (rows, cols) int array of steps to the target;
+            -1 for walls and cells with no path to it.
+        optimal (ndarray): (rows, cols, 4) bool array, True where the action
+            (up, down, left, right) moves one step closer to the target.
+        best_action (ndarray): (rows, cols) int array with the first optimal
+            action per cell; -1 at the target and where there is no path.
+    """
+
+    def __init__(self, target, distance, optimal):
+        self.target = target
+        self.distance = distance
+        self.optimal = optimal
+        self.best_action = np.where(optimal.any(axis=2), np.argmax(optimal, axis=2), -1)
+
+    def reachable(self, cell):
+        return self.distance[cell] >= 0
+
+    def action(self, cell):
+        """
+        Oracle policy: an optimal action from cell, or -1 if there is none.
+        """
+        return int(self.best_action[cell])
+
+    def path(self, start):
+        """
+        Cells visited following the oracle from start to the target,
+        inclusive, or None if the target cannot be reached.
+        """
+        if not self.reachable(start):
+            return None
+
+        deltas = ((-1, 0), (1, 0), (0, -1), (0, 1))
+        path = [tuple(start)]
+        while path[-1] != self.target:
+            r, c = path[-1]
+            dr, dc = deltas[self.best_action[r, c]]
+            path.append((r + dr, c + dc))
+        return path
+
+
+def _bfs(free, target):
+    """
+    Breadth-first search distances on a boolean grid, -1 where unreachable.
+
+    Runs on flat Python lists over a zero-padded copy of the grid, so the
+    inner loop needs no bounds checks.
+    """
+    nrows, ncols = free.shape
+    width = ncols + 2
+    padded = np.pad(free, 1, constant_values=False)
+    is_free = padded.ravel().tolist()
+    dist = [-1] * len(is_free)
+
+    tr, tc = target
+    source = (tr + 1) * width + tc + 1
+    if is_free[source]:
+        dist[source] = 0
+        queue = deque([source])
+        offsets = (-width, width, -1, 1)
+        while queue:
+            cell = queue.popleft()
+            d = dist[cell] + 1
+            for offset in offsets:
+                nxt = cell + offset
+                if is_free[nxt] and dist[nxt] < 0:
+                    dist[nxt] = d
+                    queue.append(nxt)
+
+    return np.array(dist, dtype=np.int64).reshape(nrows + 2, width)[1:-1, 1:-1]
+
+
+@lru_cache(maxsize=16)
+def _solve_cached(layout, shape, target):
+    free = np.frombuffer(layout, dtype=bool).reshape(shape)
+    distance = _bfs(free, target)
+
+    # An action is optimal when it leads to a reachable neighbour one step
+    # closer to the target
+    padded = np.pad(distance, 1, constant_values=-1)
+    neighbours = np.stack([
+        padded[:-2, 1:-1], padded[2:, 1:-1],
+        padded[1:-1, :-2], padded[1:-1, 2:],
+    ], axis=2)
+    optimal = (neighbours >= 0) & (neighbours == distance[:, :, None] - 1) \
+        & (distance[:, :, None] > 0)
+
+    distance.flags.writeable = False
+    optimal.flags.writeable = False
+    return MazeSolution(target, distance, optimal)
+
+
+def solve(maze, target=None):
+    """
+    Solve a maze layout for the given target (default: bottom-right cell).
+
+    Parameters:
+        maze (list or ndarray): Grid of 1 (path) and 0 (wall).
+        target (tuple): Goal cell.
+
+    Returns:
+        MazeSolution, shared with every other caller asking for the same
+        layout and target. Its arrays are read-only.
+    """
+    free = np.asarray(maze) == 1.0
+    if target is None:
+        target = (free.shape[0] - 1, free.shape[1] - 1)
+    return _solve_cached(free.tobytes(), free.shape, tuple(int(x) for x in target))
+
+
+def clear_solutions():
+    """
+    Drop every cached MazeSolution.
+    """
+    _solve_cached.cache_clear()
+
+
+def distance_field(maze, target, distance="manhattan"):
+    """
+    Per-cell distance to target used for shaping and observations.
+
+    Returns:
+        (field, scale): a (rows, cols) array and the value dividing it in
+        the observation's distance feature. Manhattan distances are scaled
+        by rows + cols as before. Geodesic distances are scaled by the
+        longest shortest path + 1; cells with no path to the target get that
+        value, so moves between them are never shaped.
+    """
+    rows, cols = np.shape(maze)
+    tr, tc = target
+
+    if distance == "manhattan":
+        r, c = np.indices((rows, cols))
+        return np.abs(r - tr) + np.abs(c - tc), rows + cols
+
+    if distance == "geodesic":
+        geo = solve(maze, target).distance
+        scale = int(geo.max()) + 1
+        return np.where(geo >= 0, geo, scale), scale
+
+    raise ValueError(f"Unknown distance '{distance}'. Choose from: {', '.join(DISTANCES)}")
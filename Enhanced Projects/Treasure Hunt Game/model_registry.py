@@ -0,0 +1,222 @@
+"""
+Saved-model registry: a metadata index and an in-memory model cache.
+
+saved_models/index.json keeps one entry per model with the hash of the maze
+it was trained on, its environment settings and hyperparameters, epochs
+trained, win rates, file size and save time. Listing reads that one file
+and the directory, never the models themselves. Models saved before the
+index existed, or copied in by hand, are listed from their file alone.
+
+Loaded models stay in a small LRU cache, so switching back and forth
+between models reads each file once. Target networks are cloned from the
+loaded model in memory instead of reading the file a second time, and
+cached with it.
+"""
+import datetime
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+MODEL_SUFFIX = ".keras"
+
+
+def _json_default(value):
+    # NumPy scalars (np.float64 win rates, np.bool_ flags) as Python values
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def maze_hash(maze):
+    """
+    Short stable fingerprint of a maze layout (shape and free cells).
+    """
+    free = np.asarray(maze) == 1.0
+    digest = hashlib.sha1(np.array(free.shape, dtype=np.int64).tobytes()
+                          + np.packbits(free).tobytes())
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """
+    Saves, lists and loads the models in one directory.
+
+    Usage:
+        registry = ModelRegistry("saved_models")
+        registry.save("run1", model, epochs=120, win_rate=0.96)
+        registry.entries()                  # {name: metadata}
+        model = registry.load("run1")       # cached after the first call
+        target = registry.load_target("run1")
+    """
+
+    def __init__(self, directory="saved_models", cache_size=4):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.disk_loads = 0
+        self._cache = OrderedDict()
+        self._index = None
+        self._index_mtime = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name + MODEL_SUFFIX)
+
+    def __contains__(self, name):
+        return name in self._cache or os.path.exists(self.path(name))
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _read_index(self):
+        """
+        The index, re-read only when the file has changed on disk.
+        """
+        path = self._index_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._index is None or mtime != self._index_mtime:
+            if mtime is None:
+                self._index = {}
+            else:
+                with open(path) as f:
+                    self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def _write_index(self, index):
+        path = self._index_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True, default=_json_default)
+        os.replace(tmp_path, path)
+        self._index = index
+        self._index_mtime = os.stat(path).st_mtime_ns
+
+    def entries(self):
+        """
+        Metadata of every model in the directory, sorted by name. Models
+        missing from the index report their file size only.
+        """
+        index = self._read_index()
+        if not os.path.isdir(self.directory):
+            return {}
+
+        entries = {}
+        with os.scandir(self.directory) as files:
+            for f in files:
+                if f.name.endswith(MODEL_SUFFIX) and f.is_file():
+                    name = f.name[:-len(MODEL_SUFFIX)]
+                    entries[name] = dict(index.get(name, {"file_size": f.stat().st_size}))
+        return dict(sorted(entries.items()))
+
+    def names(self):
+        return list(self.entries())
+
+    def info(self, name):
+        """
+        Index entry for name, or an empty dict if it has none.
+        """
+        return dict(self._read_index().get(name, {}))
+
+    def save(self, name, model, **metadata):
+        """
+        Write model to <directory>/<name>.keras and record metadata (any
+        JSON-serializable values, NumPy scalars included) in the index, with
+        file size and time.
+        A cached copy of an older model under this name is dropped.
+
+        Returns:
+            dict: The new index entry.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        model.save(path)
+
+        entry = dict(metadata)
+        entry["file_size"] = os.path.getsize(path)
+        entry["saved_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+        index = dict(self._read_index())
+        index[name] = entry
+        self._write_index(index)
+        self._cache.pop(name, None)
+        return entry
+
+    def load(self, name):
+        """
+        Keras model saved under name, read from disk only if it is not
+        cached. The cached instance is shared between callers; clone() it
+        before changing its weights.
+
+        Raises:
+            FileNotFoundError: No model with that name.
+        """
+        return self._entry(name)[0]
+
+    def load_target(self, name):
+        """
+        Target network for the model saved under name: an in-memory clone
+        of load(name), made once and cached (and shared) alongside it.
+        """
+        entry = self._entry(name)
+        if entry[1] is None:
+            entry[1] = self.clone(entry[0])
+        return entry[1]
+
+    def _entry(self, name):
+        entry = self._cache.get(name)
+        if entry is not None:
+            self._cache.move_to_end(name)
+            return entry
+
+        path = self.path(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model not found: {path}")
+
+        from tensorflow.keras.models import load_model
+        model = load_model(path)
+        self.disk_loads += 1
+
+        entry = self._cache[name] = [model, None]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def clone(model):
+        """
+        Independent in-memory copy of model with the same weights.
+        """
+        from tensorflow.keras.models import clone_model
+        copy = clone_model(model)
+        copy.set_weights(model.get_weights())
+        return copy
+
+    def evict(self, name=None):
+        """
+        Drop one model, or every model, from the cache.
+        """
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+
+_default = None
+
+
+def default_registry():
+    """
+    Process-wide registry for saved_models/, shared by every trainer so the
+    cache survives switching trainers.
+    """
+    global _default
+    if _default is None:
+        _default = ModelRegistry()
+    return _default
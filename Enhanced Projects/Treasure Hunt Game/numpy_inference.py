@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class NumpyQNetwork:
+    """
+    Forward pass of a Sequential Dense/PReLU Q-network in plain NumPy.
+
+    Keras predict() carries millisecond-scale overhead per call, which
+    dominates acting and play where one state is evaluated per step. This
+    class copies the weights out of the Keras model once (and again on every
+    sync()) and runs the same computation as matrix products on the host.
+
+    Supports the layers produced by TreasureHuntTrainer.build_model: Dense
+    (linear or relu activation) and PReLU.
+    """
+
+    def __init__(self, model=None):
+        self.layers = []
+        if model is not None:
+            self.sync(model)
+
+    def sync(self, model):
+        """
+        Copy the current weights of a Keras model into NumPy arrays.
+        """
+        layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+
+            if kind == "Dense":
+                activation = getattr(layer.activation, "__name__", "linear")
+                if activation not in ("linear", "relu"):
+                    raise ValueError(f"Unsupported Dense activation: {activation}")
+                kernel, bias = weights
+                layers.append(("dense", kernel, bias, activation == "relu"))
+            elif kind == "PReLU":
+                layers.append(("prelu", weights[0]))
+            elif kind == "InputLayer":
+                continue
+            else:
+                raise ValueError(f"Unsupported layer type: {kind}")
+
+        self.layers = layers
+
+    def _arrays(self):
+        for layer in self.layers:
+            if layer[0] == "dense":
+                yield layer[1]
+                yield layer[2]
+            else:
+                yield layer[1]
+
+    def num_params(self):
+        return sum(a.size for a in self._arrays())
+
+    def flatten(self):
+        """
+        All weights concatenated into one float32 vector, in layer order.
+        """
+        return np.concatenate([a.ravel() for a in self._arrays()])
+
+    def load_flat(self, vector):
+        """
+        Overwrite the weights in place from a vector made by flatten().
+        """
+        offset = 0
+        for a in self._arrays():
+            a[...] = np.reshape(vector[offset:offset + a.size], a.shape)
+            offset += a.size
+
+    def predict_on_batch(self, states):
+        """
+        Q-values for a (batch, state_dim) array of states.
+        """
+        x = np.asarray(states, dtype=np.float32)
+        for layer in self.layers:
+            if layer[0] == "dense":
+                _, kernel, bias, relu = layer
+                x = x @ kernel
+                x += bias
+                if relu:
+                    np.maximum(x, 0.0, out=x)
+            else:
+                x = np.where(x > 0.0, x, layer[1] * x)
+        return x
+
+    def predict_one(self, state):
+        """
+        Q-values for a single state vector.
+        """
+        return self.predict_on_batch(np.reshape(state, (1, -1)))[0]
+
+    def max_abs_error(self, model, states):
+        """
+        Largest absolute difference from Keras outputs on the given states.
+        """
+        expected = np.asarray(model.predict_on_batch(np.asarray(states, dtype=np.float32)))
+        return float(np.max(np.abs(self.predict_on_batch(states) - expected)))
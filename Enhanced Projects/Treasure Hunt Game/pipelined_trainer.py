@@ -0,0 +1,301 @@
+"""
+Overlapped acting and learning for the Treasure Maze DQN, in one process.
+
+TreasureHuntTrainer.train plays a whole episode and only then takes its
+gradient steps, so environment code and TensorFlow never run at the same
+time. PipelinedTrainer runs them side by side on two threads:
+
+- The actor thread plays epsilon-greedy episodes in its own compiled
+  TreasureMaze, choosing actions with a NumPy copy of the Q-network that the
+  learner refreshes every few gradient steps, and adds every transition to
+  the shared replay memory as soon as it happens.
+- The learner (the calling thread) keeps sampling minibatches and taking
+  gradient steps. It holds the replay lock only to sample and to update
+  priorities, never during a forward or backward pass.
+
+updates_per_step fixes the update-to-data ratio. The learner waits when it
+gets ahead of the data, and the actor waits when it gets more than max_lead
+transitions ahead of the learner. The amount of learning per transition is
+therefore the same however the threads are scheduled. TensorFlow and large
+NumPy operations release the GIL, which is what lets the two overlap.
+"""
+import datetime
+import random
+import threading
+import time
+
+import numpy as np
+
+from numpy_inference import NumpyQNetwork
+from treasure_maze import TreasureMaze
+from treasure_trainer import TreasureHuntTrainer
+
+
+class PipelinedTrainer:
+    """
+    Actor thread and learner thread sharing one replay memory.
+
+    Wraps a TreasureHuntTrainer for the networks, update step, replay memory
+    and model saving, and replaces its alternating act-then-learn loop.
+    """
+
+    def __init__(self, maze, start=(0, 0), updates_per_step=0.1, max_lead=300,
+                 weight_sync_interval=10, target_update_interval=10,
+                 max_steps=300, seed=0, **trainer_kwargs):
+        """
+        Parameters:
+            maze (list): Maze layout.
+            start (tuple): Starting coordinates of the agent.
+            updates_per_step (float): Gradient steps per environment step.
+                The sequential loop's 10 steps per episode of 30-300 steps
+                is 0.03-0.3.
+            max_lead (int): Transitions the actor may run ahead of the
+                ratio before it waits for the learner.
+            weight_sync_interval (int): Gradient steps between weight
+                snapshots handed to the actor.
+            target_update_interval (int): Gradient steps between target
+                network syncs (ignored when target_tau < 1, which
+                Polyak-averages after every step).
+            max_steps (int): Step limit per episode.
+            seed (int): Random seed; the actor uses seed + 1.
+            trainer_kwargs: Passed to TreasureHuntTrainer (epsilon, lr,
+                replay_backend, batch_size, update_step, target_tau,
+                distance, target, view_radius, ...).
+        """
+        if updates_per_step <= 0:
+            raise ValueError("updates_per_step must be positive.")
+
+        self.updates_per_step = updates_per_step
+        self.max_lead = max_lead
+        self.weight_sync_interval = weight_sync_interval
+        self.target_update_interval = target_update_interval
+        self.max_steps = max_steps
+        self.seed = seed
+
+        self.trainer = TreasureHuntTrainer(maze, start, verbose=False, **trainer_kwargs)
+        qmaze = self.trainer.qmaze
+        self.env_kwargs = {"start": qmaze.start, "target": qmaze.target,
+                           "distance": qmaze.distance, "view_radius": qmaze.view_radius}
+
+        # Shared between the threads; guarded by _condition
+        self._condition = threading.Condition()
+        self._stop = False
+        self._actor_done = False
+        self._error = None
+        self.transitions = 0
+        self.grad_steps = 0
+        self.win_history = []
+
+        # (version, flat weights), replaced whole so the actor reads it safely
+        self._snapshot = (0, None)
+
+    def train(self, max_episodes=5000, model_name="model", save_model=True,
+              time_limit=None, verbose=True):
+        """
+        Run actor and learner until the 95% win rate over the last 50
+        episodes is reached, max_episodes have been played, or time_limit
+        seconds have passed.
+
+        Returns:
+            dict: as TreasureHuntTrainer.train, plus episodes, transitions,
+            gradient steps, transitions/sec, gradient steps/sec and the
+            update-to-data ratio achieved.
+        """
+        trainer = self.trainer
+        exp = trainer.exp
+        batch_size = trainer.batch_size
+        soft_target = trainer.target_tau < 1.0
+
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+
+        # Every run starts from zero, also after a stopped or finished one
+        self._stop = False
+        self._actor_done = False
+        self._error = None
+        self.transitions = 0
+        self.grad_steps = 0
+        self.win_history = []
+
+        trainer._build_networks()
+        trainer.update_target_model()
+        trainer._attach_update()
+
+        actor_policy = NumpyQNetwork(trainer.model)
+        self._publish()
+
+        if verbose:
+            print(f"Starting pipelined training: {self.updates_per_step} updates per step, "
+                  f"up to {max_episodes} episodes")
+
+        global_start = datetime.datetime.now()
+        start_time = time.perf_counter()
+        actor = threading.Thread(target=self._run_actor, args=(actor_policy, max_episodes),
+                                 name="actor", daemon=True)
+        actor.start()
+
+        win_rate = 0.0
+        loss = 0.0
+        logged = 0
+        converged = False
+
+        try:
+            while True:
+                with self._condition:
+                    # Wait for enough data for the next update
+                    while not self._ready(batch_size):
+                        if self._actor_done or self._error is not None:
+                            break
+                        self._condition.wait(timeout=1.0)
+                    if self._error is not None:
+                        raise self._error
+                    if not self._ready(batch_size):
+                        break
+
+                    episodes = len(self.win_history)
+                    if episodes > 50:
+                        win_rate = float(np.mean(self.win_history[-50:]))
+                    batch, indices, weights = exp.sample_weighted(batch_size)
+
+                if episodes > 50 and win_rate >= 0.95:
+                    converged = True
+                    break
+                if time_limit is not None and time.perf_counter() - start_time > time_limit:
+                    break
+
+                # Learn outside the lock; the actor keeps playing meanwhile
+                if trainer._update is not None:
+                    loss, td_errors = trainer._update(*batch, weights=weights)
+                else:
+                    y, td_errors = exp.compute_targets(trainer.policy, trainer.target_policy, batch)
+                    loss = trainer.model.train_on_batch(batch[0], y, sample_weight=weights)
+                    trainer._sync_policy()
+
+                with self._condition:
+                    if indices is not None:
+                        exp.update_priorities(indices, np.asarray(td_errors))
+                    self.grad_steps += 1
+                    self._condition.notify_all()
+                grad_steps = self.grad_steps
+
+                if soft_target:
+                    trainer.update_target_model(trainer.target_tau)
+                elif grad_steps % self.target_update_interval == 0:
+                    trainer.update_target_model()
+                if grad_steps % self.weight_sync_interval == 0:
+                    self._publish()
+
+                if verbose and episodes >= logged + 10:
+                    logged = episodes - episodes % 10
+                    elapsed = time.perf_counter() - start_time
+                    print(f"Episodes {episodes:5d} | Steps/s: {self.transitions / elapsed:8.0f} | "
+                          f"Grad steps: {grad_steps:6d} | Loss: {float(loss):0.4f} | "
+                          f"Win Rate: {win_rate:0.3f} | ε: {trainer.epsilon:0.3f} | "
+                          f"{elapsed:6.1f}s", flush=True)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            with self._condition:
+                self._stop = True
+                self._condition.notify_all()
+            actor.join()
+
+        if self._error is not None:
+            raise self._error
+
+        episodes = len(self.win_history)
+        if episodes:
+            win_rate = float(np.mean(self.win_history[-50:]))
+        if verbose and converged:
+            print(f"\nWin-rate target reached! ({win_rate:.3f}).\n")
+
+        trainer._sync_policy()
+        if save_model:
+            trainer.save_model(model_name, epochs=episodes, win_rate=win_rate,
+                               converged=converged, updates_per_step=self.updates_per_step)
+
+        summary = trainer._summary(episodes, win_rate, global_start, converged,
+                                   total_steps=self.transitions)
+        summary.update({
+            "episodes": episodes,
+            "transitions": self.transitions,
+            "grad_steps": self.grad_steps,
+            "transitions_per_sec": self.transitions / elapsed if elapsed else 0.0,
+            "grad_steps_per_sec": self.grad_steps / elapsed if elapsed else 0.0,
+            "updates_per_step": self.grad_steps / self.transitions if self.transitions else 0.0,
+        })
+        return summary
+
+    def _ready(self, batch_size):
+        """
+        True when the learner may take its next step (lock held).
+        """
+        return (len(self.trainer.exp) >= batch_size
+                and self.grad_steps < self.updates_per_step * self.transitions)
+
+    def _publish(self):
+        """
+        Hand the actor a snapshot of the current Q-network weights.
+        """
+        version = self._snapshot[0] + 1
+        self._snapshot = (version, NumpyQNetwork(self.trainer.model).flatten())
+
+    def _run_actor(self, policy, max_episodes):
+        """
+        Actor thread: play episodes until stopped or max_episodes are done.
+        """
+        trainer = self.trainer
+        exp = trainer.exp
+        condition = self._condition
+        rng = random.Random(self.seed + 1)
+        qmaze = TreasureMaze(trainer.qmaze.maze, compiled=True, **self.env_kwargs)
+        version = 0
+        max_steps = self.max_steps
+
+        try:
+            while not self._stop and len(self.win_history) < max_episodes:
+                qmaze.reset()
+                envstate = qmaze.observe()
+                status = "playing"
+                epsilon = trainer.epsilon
+
+                for t in range(max_steps):
+                    # Pick up the newest weight snapshot, if any
+                    if self._snapshot[0] != version:
+                        version, weights = self._snapshot
+                        policy.load_flat(weights)
+
+                    valid_actions = qmaze.valid_actions()
+                    if rng.random() < epsilon:
+                        action = rng.choice(valid_actions)
+                    else:
+                        qs = policy.predict_one(envstate)
+                        action = max(valid_actions, key=lambda a: qs[a])
+
+                    prev_row, prev_col = qmaze.state
+                    next_state, reward, status = qmaze.act(action, prev_row, prev_col)
+                    done = (status == "win") or (t == max_steps - 1)
+
+                    with condition:
+                        # Hold back while the learner is behind the ratio
+                        while (not self._stop and self.transitions
+                               - self.grad_steps / self.updates_per_step > self.max_lead):
+                            condition.wait(timeout=1.0)
+                        if self._stop:
+                            return
+                        exp.remember((envstate, action, reward, next_state, done))
+                        self.transitions += 1
+                        condition.notify_all()
+                    envstate = next_state
+
+                    if done:
+                        break
+
+                with condition:
+                    self.win_history.append(1 if status == "win" else 0)
+                    trainer.epsilon = max(trainer.min_epsilon, trainer.epsilon * trainer.epsilon_decay)
+        except BaseException as e:
+            self._error = e
+        finally:
+            with condition:
+                self._actor_done = True
+                condition.notify_all()
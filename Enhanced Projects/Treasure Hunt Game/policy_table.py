@@ -0,0 +1,306 @@
+"""
+Greedy policy tables: a trained Q-network compiled to one entry per cell.
+
+On a fixed maze the observation depends only on the agent's cell, so a
+trained network is a function of the cell as well. PolicyTable.from_model
+runs the network once, in one batch over every free cell, and keeps the
+greedy valid action and the Q-values of each. Playing from the table is
+then one array lookup per step, and evaluating every start cell is a few
+vectorized gathers per step.
+
+Tables are saved in a small binary file:
+
+    b"QPOL", format version (uint16), header length (uint32)
+    JSON header: shape, start, target, distance, view_radius, maze_hash,
+                 model_name, n_free, q_dtype; padded with spaces to 8 bytes
+    int8 action per cell, row-major, -1 for walls; zero-padded to 8 bytes
+    Q-values of the free cells, row-major, n_free x 4 (float16 by default)
+
+Loading and playing a table needs NumPy only; TensorFlow is imported when a
+table is built from a model, never when one is loaded. The maze itself is
+the set of non-wall cells, so a table carries everything needed to play,
+evaluate against the exact solution and render.
+"""
+import json
+import random
+import struct
+from functools import cached_property
+
+import numpy as np
+
+from maze_solver import solve
+
+MAGIC = b"QPOL"
+VERSION = 1
+WALL_ACTION = -1
+TABLE_SUFFIX = ".qpol"
+
+_PREFIX = struct.Struct("<4sHI")
+
+
+class PolicyTable:
+    """
+    Greedy action and Q-values for every cell of one maze.
+
+    Usage:
+        table = PolicyTable.from_model(trainer.model, trainer.qmaze)
+        table.save("saved_models/CONVERGED.qpol")
+
+        table = PolicyTable.load("saved_models/CONVERGED.qpol")
+        won, path = table.play((0, 0))
+        table.evaluate()["win_rate"]
+    """
+
+    def __init__(self, actions, q_values, start=(0, 0), target=None, **metadata):
+        """
+        Parameters:
+            actions (ndarray): (rows, cols) int8 greedy action per cell,
+                WALL_ACTION for walls.
+            q_values (ndarray): (n_free, 4) Q-values of the free cells in
+                row-major order.
+            start (tuple): Default start cell.
+            target (tuple): Treasure cell (default: bottom-right).
+            metadata: distance, view_radius, maze_hash, model_name, ... as
+                recorded by from_model.
+        """
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.q_values = np.asarray(q_values)
+        rows, cols = self.actions.shape
+        self.shape = (rows, cols)
+        self.start = tuple(start)
+        self.target = (rows - 1, cols - 1) if target is None else tuple(target)
+        self.metadata = metadata
+
+        free = (self.actions != WALL_ACTION).ravel()
+        if len(self.q_values) != free.sum():
+            raise ValueError(f"{free.sum()} free cells but {len(self.q_values)} Q-value rows.")
+
+        # Row of each free cell in q_values, -1 for walls
+        self._q_row = np.where(free, np.cumsum(free) - 1, -1)
+
+        # Cell reached from each cell by its greedy action; cells whose
+        # action leads into a wall or off the grid stay where they are
+        cells = np.arange(rows * cols)
+        r, c = np.divmod(cells, cols)
+        dr = np.array([-1, 1, 0, 0])[self.actions.ravel()]
+        dc = np.array([0, 0, -1, 1])[self.actions.ravel()]
+        nr, nc = r + dr, c + dc
+        inside = (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+        nxt = np.where(inside, nr * cols + nc, cells)
+        self.next_cell = np.where(free & free[nxt], nxt, cells).astype(np.int64)
+
+    @cached_property
+    def _next_list(self):
+        # Indexing a list with a Python int is much cheaper than indexing
+        # a NumPy array, which matters in the one-step-at-a-time play()
+        return self.next_cell.tolist()
+
+    @property
+    def maze(self):
+        """
+        The maze as a grid of 1 (path) and 0 (wall).
+        """
+        return (self.actions != WALL_ACTION).astype(float)
+
+    @classmethod
+    def from_model(cls, model, qmaze, batch_size=65536, q_dtype=np.float16, **metadata):
+        """
+        Evaluate model on every free cell of qmaze and keep the greedy valid
+        action of each.
+
+        Parameters:
+            model: Keras Q-network (or a NumpyQNetwork) trained on qmaze's
+                observations.
+            qmaze (TreasureMaze): Environment the model plays in.
+            batch_size (int): Cells per forward pass, to bound memory on
+                large mazes.
+            q_dtype: Storage type of the Q-values. Actions are chosen from
+                the full-precision values before rounding.
+            metadata: Extra header fields (model_name, ...).
+        """
+        from numpy_inference import NumpyQNetwork
+        from model_registry import maze_hash
+
+        network = model if isinstance(model, NumpyQNetwork) else NumpyQNetwork(model)
+        rows, cols = qmaze.maze.shape
+        free = np.flatnonzero(qmaze.maze.ravel() == 1.0)
+        obs = qmaze.observation_table()[free]
+
+        actions = np.full(rows * cols, WALL_ACTION, dtype=np.int8)
+        q_values = np.empty((len(free), 4), dtype=q_dtype)
+        for i in range(0, len(free), batch_size):
+            qs = np.asarray(network.predict_on_batch(obs[i:i + batch_size]), dtype=np.float32)
+            # Observation features 3-6 are the valid-move flags; with none
+            # valid the environment falls back to action 0, as argmax does
+            mask = obs[i:i + batch_size, 3:7] > 0
+            actions[free[i:i + batch_size]] = np.argmax(np.where(mask, qs, -np.inf), axis=1)
+            q_values[i:i + batch_size] = qs
+
+        header = {"distance": qmaze.distance, "view_radius": qmaze.view_radius,
+                  "maze_hash": maze_hash(qmaze.maze)}
+        header.update(metadata)
+        return cls(actions.reshape(rows, cols), q_values, qmaze.start, qmaze.target, **header)
+
+    def save(self, filename):
+        """
+        Write the table in the binary format described in the module
+        docstring.
+        """
+        header = dict(self.metadata)
+        header.update({
+            "shape": list(self.shape),
+            "start": list(self.start),
+            "target": list(self.target),
+            "n_free": len(self.q_values),
+            "q_dtype": self.q_values.dtype.str,
+        })
+        encoded = json.dumps(header, sort_keys=True).encode()
+        encoded += b" " * (-(_PREFIX.size + len(encoded)) % 8)
+
+        with open(filename, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, VERSION, len(encoded)))
+            f.write(encoded)
+            f.write(self.actions.tobytes())
+            f.write(bytes(-self.actions.size % 8))
+            f.write(np.ascontiguousarray(self.q_values).tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a table written by save().
+
+        Raises:
+            ValueError: Not a policy table, or a newer format version.
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        magic, version, header_size = _PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a policy table.")
+        if version > VERSION:
+            raise ValueError(f"{filename} has format version {version}; "
+                             f"this reader supports up to {VERSION}.")
+
+        offset = _PREFIX.size
+        header = json.loads(data[offset:offset + header_size])
+        offset += header_size
+
+        rows, cols = header.pop("shape")
+        actions = np.frombuffer(data, dtype=np.int8, count=rows * cols, offset=offset)
+        offset += rows * cols + (-(rows * cols) % 8)
+        q_values = np.frombuffer(data, dtype=np.dtype(header.pop("q_dtype")),
+                                 count=header.pop("n_free") * 4, offset=offset)
+
+        return cls(actions.reshape(rows, cols), q_values.reshape(-1, 4),
+                   header.pop("start"), header.pop("target"), **header)
+
+    def action(self, cell):
+        """
+        Greedy action in cell (WALL_ACTION for a wall).
+        """
+        return int(self.actions[cell])
+
+    def q(self, cell):
+        """
+        Q-values of the four actions in a free cell.
+        """
+        row = self._q_row[cell[0] * self.shape[1] + cell[1]]
+        if row < 0:
+            raise ValueError(f"{tuple(cell)} is a wall.")
+        return self.q_values[row].astype(np.float32)
+
+    def play(self, start=None, max_steps=300):
+        """
+        One greedy episode.
+
+        Returns:
+            (won, path): whether the treasure was reached within max_steps,
+            and the cells visited, start first.
+        """
+        cols = self.shape[1]
+        r, c = self.start if start is None else start
+        cell = r * cols + c
+        target = self.target[0] * cols + self.target[1]
+        nxt = self._next_list
+
+        cells = [cell]
+        for _ in range(max_steps):
+            cell = nxt[cell]
+            cells.append(cell)
+            if cell == target:
+                break
+        return cell == target, [divmod(cell, cols) for cell in cells]
+
+    def steps_to_target(self, start_cells, max_steps=300):
+        """
+        Greedy episodes from many start cells side by side.
+
+        Returns:
+            (won, steps): per start cell, whether the treasure was reached
+            and after how many steps (max_steps when it was not).
+        """
+        cols = self.shape[1]
+        starts = np.asarray(start_cells, dtype=np.int64).reshape(-1, 2)
+        cells = starts[:, 0] * cols + starts[:, 1]
+        target = self.target[0] * cols + self.target[1]
+
+        won = cells == target
+        steps = np.where(won, 0, max_steps).astype(np.int64)
+        active = np.flatnonzero(~won)
+        for t in range(max_steps):
+            if len(active) == 0:
+                break
+            cells[active] = self.next_cell[cells[active]]
+            arrived = cells[active] == target
+            won[active[arrived]] = True
+            steps[active[arrived]] = t + 1
+            active = active[~arrived]
+        return won, steps
+
+    def evaluate(self, start_cells=None, max_steps=300, n_cells=None):
+        """
+        Greedy rollouts from many start cells, scored against the exact
+        solution of the maze as in TreasureHuntTrainer.evaluate.
+
+        Parameters:
+            start_cells (list): Cells to start from (default: every free cell
+                with a path to the target, except the target itself).
+            n_cells (int): Evaluate a random sample of this many start cells.
+
+        Returns:
+            dict: win rate, win and episode counts, optimal rate, mean ratio
+            of path length to shortest path over won cells, policy agreement,
+            and per-cell {cell: (won, steps, shortest)} results.
+        """
+        solution = solve(self.maze, self.target)
+        if start_cells is None:
+            start_cells = list(map(tuple, np.argwhere(solution.distance > 0).tolist()))
+        if n_cells is not None and n_cells < len(start_cells):
+            start_cells = random.sample(list(start_cells), n_cells)
+        starts = np.asarray(start_cells, dtype=np.int64).reshape(-1, 2)
+
+        n = len(starts)
+        if n == 0:
+            return {"win_rate": 0.0, "wins": 0, "episodes": 0, "optimal_rate": 0.0,
+                    "path_ratio": 0.0, "policy_agreement": 0.0, "cells": {}}
+
+        won, steps = self.steps_to_target(starts, max_steps)
+        rows, cols = starts.T
+        shortest = solution.distance[rows, cols]
+        optimal = won & (steps == shortest)
+        first_actions = self.actions[rows, cols]
+
+        return {
+            "win_rate": float(won.mean()),
+            "wins": int(won.sum()),
+            "episodes": n,
+            "optimal_rate": float(optimal.mean()),
+            "path_ratio": float(np.mean(steps[won] / shortest[won])) if won.any() else 0.0,
+            "policy_agreement": float(np.mean(solution.optimal[rows, cols, first_actions])),
+            "cells": {
+                (r, c): (bool(w), int(k), int(d))
+                for r, c, w, k, d in zip(rows.tolist(), cols.tolist(), won.tolist(),
+                                         steps.tolist(), shortest.tolist())
+            },
+        }
@@ -0,0 +1,378 @@
+"""
+CPU and memory profiling for training and play.
+
+Profiler wraps any stretch of code; TrainingProfiler is a TrainingCallback
+that runs one over a window of training epochs. Each writes its reports to
+a directory:
+
+    cpu.collapsed   sampling mode: one "frame;frame;...;frame count" line
+                    per distinct call stack, the input format of
+                    flamegraph.pl, speedscope and inferno
+    cpu.pstats      deterministic mode: cProfile statistics (pstats,
+                    snakeviz, flameprof)
+    summary.txt     the hottest functions, memory allocated during the
+                    window per component and per source line, and RSS
+
+The sampling profiler reads the profiled thread's Python stack from a
+background thread every interval_ms, so its overhead is small and time
+spent inside NumPy or TensorFlow is charged to the Python call that
+entered it (predict_on_batch, train_on_batch, ...). The deterministic
+profiler counts every call exactly but slows Python-heavy code such as
+TreasureMaze.act several times over.
+
+Memory is traced with tracemalloc from the start of the window. Every
+allocation still alive at its end is attributed to the innermost frame of
+its traceback that belongs to a known component: the replay memory, the
+environment or the models (this repo's network code, Keras and
+TensorFlow). tracemalloc slows allocation down too, so profile CPU time
+without it (memory=False) when the timings matter.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from training_metrics import TrainingCallback
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; RSS is then left out of the report
+    resource = None
+
+PROFILERS = ("sampling", "deterministic")
+
+# Source files (by name) and package directories of each memory component
+COMPONENTS = {
+    "replay": ("game_experience.py", "trajectory_dataset.py"),
+    "environment": ("treasure_maze.py", "maze_solver.py", "maze_corpus.py", "maze_generator.py"),
+    "models": ("numpy_inference.py", "dqn_update.py", "model_registry.py", "policy_table.py",
+               "keras", "tensorflow"),
+}
+
+
+def _component(traceback):
+    """
+    Component of the innermost frame in traceback that belongs to one,
+    or "other".
+    """
+    for frame in reversed(traceback):
+        parts = frame.filename.replace("\\", "/").split("/")
+        for component, names in COMPONENTS.items():
+            if parts[-1] in names or any(name in parts[:-1] for name in names):
+                return component
+    return "other"
+
+
+def _rss_mb():
+    """
+    (current, peak) resident set size in MB; None where unknown.
+    """
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    peak = None
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        scale = 2**20 if sys.platform == "darwin" else 2**10
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return current, peak
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """
+    Counts the call stacks of one thread, read every interval seconds.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        labels = {}
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _label(code)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Profiler:
+    """
+    CPU and memory profile of everything the calling thread runs between
+    start() and stop().
+
+    Usage:
+        with Profiler("profiles/play"):
+            trainer.play(render=False)
+    """
+
+    def __init__(self, out_dir, mode="sampling", interval_ms=5.0, memory=True, memory_frames=10,
+                 top=25, label=None):
+        """
+        Parameters:
+            out_dir (str): Directory for the reports, created if needed.
+            mode (str): CPU profiler, "sampling" or "deterministic"; None
+                profiles memory only.
+            interval_ms (float): Sampling period.
+            memory (bool): Trace allocations with tracemalloc.
+            memory_frames (int): Frames kept per allocation traceback. More
+                attribute allocations made deep inside libraries, at a
+                higher cost per allocation.
+            top (int): Functions and allocation sites listed in summary.txt.
+            label (str): What was profiled, for the report header.
+        """
+        if mode is not None and mode not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{mode}'. Choose from: {', '.join(PROFILERS)}")
+        self.out_dir = out_dir
+        self.mode = mode
+        self.interval = interval_ms / 1e3
+        self.memory = memory
+        self.memory_frames = memory_frames
+        self.top = top
+        self.label = label
+        self.summary = None
+        self._sampler = None
+        self._profile = None
+        self._started_tracing = False
+        self._start_time = None
+
+    def start(self):
+        self._rss_start = _rss_mb()[0]
+        if self.memory:
+            # Keep an outer tracemalloc session (e.g. a benchmark's) running
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start(self.memory_frames)
+            tracemalloc.reset_peak()
+            self._memory_start = self._snapshot()
+
+        if self.mode == "sampling":
+            self._sampler = _StackSampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        elif self.mode == "deterministic":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._start_time = time.perf_counter()
+        return self
+
+    def stop(self):
+        """
+        Stop profiling and write the reports.
+
+        Returns:
+            dict: seconds profiled, CPU sample count, top functions, memory
+            per component, traced peak and RSS (see summary.txt).
+        """
+        seconds = time.perf_counter() - self._start_time
+        self._start_time = None
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+        memory = None
+        if self.memory:
+            snapshot = self._snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if self._started_tracing:
+                tracemalloc.stop()
+            memory = self._memory_report(snapshot, peak)
+
+        rss, rss_peak = _rss_mb()
+        self.summary = {
+            "label": self.label,
+            "mode": self.mode,
+            "seconds": seconds,
+            "cpu": self._cpu_report(),
+            "memory": memory,
+            "rss_start_mb": self._rss_start,
+            "rss_end_mb": rss,
+            "rss_peak_mb": rss_peak,
+        }
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self._sampler is not None:
+            with open(os.path.join(self.out_dir, "cpu.collapsed"), "w") as f:
+                for stack, count in sorted(self._sampler.stacks.items()):
+                    f.write(";".join(stack) + f" {count}\n")
+        if self._profile is not None:
+            self._profile.dump_stats(os.path.join(self.out_dir, "cpu.pstats"))
+        with open(os.path.join(self.out_dir, "summary.txt"), "w") as f:
+            f.write(self.format_summary())
+        return self.summary
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _cpu_report(self):
+        """
+        Top functions by own time and by time including callees, as
+        fractions of the samples or of the total profiled time.
+        """
+        own, total = Counter(), Counter()
+        if self._sampler is not None:
+            n = self._sampler.samples
+            for stack, count in self._sampler.stacks.items():
+                own[stack[-1]] += count
+                for label in set(stack):
+                    total[label] += count
+        elif self._profile is not None:
+            stats = pstats.Stats(self._profile).stats
+            for (filename, line, name), (_, _, tt, ct, _) in stats.items():
+                label = f"{name} ({os.path.basename(filename)}:{line})"
+                own[label] += tt
+                total[label] += ct
+            n = sum(own.values())
+        else:
+            return None
+
+        def ranked(counter):
+            return [(label, value / n) for label, value in counter.most_common(self.top)] if n else []
+
+        return {"samples": self._sampler.samples if self._sampler is not None else None,
+                "self": ranked(own), "total": ranked(total)}
+
+    @staticmethod
+    def _snapshot():
+        # The sampler's own bookkeeping is not part of the profiled code
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__)])
+
+    def _memory_report(self, snapshot, peak):
+        """
+        Allocations made during the window and still alive at its end, per
+        component and per source line (innermost frame).
+        """
+        diff = snapshot.compare_to(self._memory_start, "traceback")
+        components = {name: [0, 0] for name in (*COMPONENTS, "other")}
+        for stat in diff:
+            if stat.size_diff > 0:
+                entry = components[_component(stat.traceback)]
+                entry[0] += stat.size_diff
+                entry[1] += max(stat.count_diff, 0)
+
+        lines = snapshot.compare_to(self._memory_start, "lineno")
+        return {
+            "traced_peak_mb": peak / 2**20,
+            "net_mb": sum(stat.size_diff for stat in lines) / 2**20,
+            "components": {name: {"mb": size / 2**20, "blocks": blocks}
+                           for name, (size, blocks) in components.items()},
+            "lines": [(f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                       stat.size_diff / 2**10)
+                      for stat in lines[:self.top] if stat.size_diff > 0],
+        }
+
+    def format_summary(self):
+        s = self.summary
+        out = [f"Profile of {s['label'] or 'run'}: {s['seconds']:.2f}s"]
+
+        cpu = s["cpu"]
+        if cpu is not None:
+            unit = (f"{cpu['samples']} samples every {self.interval * 1e3:g} ms"
+                    if s["mode"] == "sampling" else "cProfile, share of profiled time")
+            out += ["", f"CPU ({s['mode']}, {unit})"]
+            for title, rows in (("own time", cpu["self"]), ("including callees", cpu["total"])):
+                out.append(f"  Top functions by {title}:")
+                out += [f"    {share * 100:6.1f}%  {label}" for label, share in rows]
+
+        memory = s["memory"]
+        if memory is not None:
+            out += ["", f"Memory (tracemalloc): {memory['net_mb']:+.2f} MB still allocated from "
+                        f"the window, traced peak {memory['traced_peak_mb']:.2f} MB",
+                    "  By component:"]
+            out += [f"    {name:<12} {entry['mb']:9.2f} MB  {entry['blocks']:8d} blocks"
+                    for name, entry in memory["components"].items()]
+            out.append("  Top allocation sites:")
+            out += [f"    {kb:9.1f} KB  {site}" for site, kb in memory["lines"]]
+
+        def mb(value):
+            return "-" if value is None else f"{value:.0f} MB"
+
+        out += ["", f"RSS: {mb(s['rss_start_mb'])} at start, {mb(s['rss_end_mb'])} at end, "
+                    f"peak {mb(s['rss_peak_mb'])}", ""]
+        return "\n".join(out)
+
+
+class TrainingProfiler(TrainingCallback):
+    """
+    Profile epochs skip to skip + epochs - 1 of the run, counted from the
+    first epoch it actually plays, so a resumed run is profiled too.
+
+    Usage:
+        trainer.train(callbacks=[TrainingProfiler("profiles/run1", skip=50, epochs=10)])
+
+    The window opens when the epoch before it ends (or when training
+    begins) and closes after its last epoch, or when training stops early.
+    """
+
+    def __init__(self, out_dir, skip=0, epochs=5, **profiler_kwargs):
+        """
+        Parameters:
+            out_dir (str): Report directory.
+            skip (int): Epochs played before the window opens.
+            epochs (int): Number of epochs profiled.
+            profiler_kwargs: mode, interval_ms, memory, top; see Profiler.
+        """
+        self.skip = skip
+        self.epochs = epochs
+        self.profiler = Profiler(out_dir, **profiler_kwargs)
+        self.summary = None
+        self.start_epoch = None
+        self.end_epoch = None
+        self._active = False
+
+    def _open(self):
+        self._active = True
+        self.profiler.start()
+
+    def _close(self):
+        self._active = False
+        self.summary = self.profiler.stop()
+
+    def on_train_begin(self, info):
+        self.start_epoch = info.get("start_epoch", 0) + self.skip
+        self.end_epoch = self.start_epoch + self.epochs
+        self.profiler.label = f"epochs {self.start_epoch}-{self.end_epoch - 1}"
+        if self.skip == 0:
+            self._open()
+
+    def on_epoch_end(self, record):
+        epoch = record["epoch"]
+        if self._active and epoch + 1 >= self.end_epoch:
+            self._close()
+        elif not self._active and self.summary is None and epoch + 1 == self.start_epoch:
+            self._open()
+
+    def on_train_end(self, summary):
+        if self._active:
+            self._close()
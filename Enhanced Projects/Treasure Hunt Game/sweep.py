@@ -0,0 +1,217 @@
+"""
+Hyperparameter sweep runner for TreasureHuntTrainer.
+
+Each configuration trains in its own worker process with TensorFlow limited
+to one thread, so a pool of N workers uses about N cores. Results are
+written as a CSV table with one row per configuration.
+
+Examples:
+    python sweep.py --grid lr=0.001,0.0005 epsilon_decay=0.99,0.995 --workers 4
+    python sweep.py --random 20 --space lr=0.0001:0.003 batch_size=16,32,64
+"""
+import argparse
+import csv
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+# Keyword arguments accepted by TreasureHuntTrainer(...)
+TRAINER_KEYS = (
+    "epsilon", "epsilon_decay", "min_epsilon", "lr", "batch_size",
+    "train_repeats", "target_update_interval", "max_memory", "discount",
+    "replay_backend", "n_envs", "inference", "distance", "view_radius",
+    "update_step", "target_tau", "n_step",
+)
+
+# Keyword arguments accepted by TreasureHuntTrainer.train(...)
+TRAIN_KEYS = ("n_epoch", "max_steps", "eval_interval", "eval_cells")
+
+RESULT_COLUMNS = (
+    "epochs_to_95", "seconds_to_95", "final_win_rate", "steps_per_sec",
+    "epochs", "seconds", "error",
+)
+
+
+def grid_space(space):
+    """
+    Every combination of the value lists in space.
+
+    Parameters:
+        space (dict): Parameter name -> list of values.
+    """
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+
+def random_space(space, n_samples, seed=0):
+    """
+    n_samples random configurations drawn from space.
+
+    A list is sampled uniformly; a (low, high) tuple is sampled uniformly in
+    the range, as an integer when both bounds are integers.
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n_samples):
+        config = {}
+        for key, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[key] = rng.randint(low, high)
+                else:
+                    config[key] = rng.uniform(low, high)
+            else:
+                config[key] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+
+def _limit_threads():
+    """
+    Pool initializer: one TensorFlow/BLAS thread per worker process.
+    """
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[var] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_config(config, maze, seed=0):
+    """
+    Train one configuration and return its result row.
+    """
+    import numpy as np
+    import tensorflow as tf
+    from treasure_trainer import TreasureHuntTrainer
+
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+    unknown = set(config) - set(TRAINER_KEYS) - set(TRAIN_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+
+    trainer_kwargs = {k: v for k, v in config.items() if k in TRAINER_KEYS}
+    train_kwargs = {k: v for k, v in config.items() if k in TRAIN_KEYS}
+
+    trainer = TreasureHuntTrainer(maze, verbose=False, **trainer_kwargs)
+    summary = trainer.train(save_model=False, **train_kwargs)
+
+    return {
+        "epochs_to_95": summary["epochs"] if summary["converged"] else "",
+        "seconds_to_95": round(summary["seconds"], 2) if summary["converged"] else "",
+        "final_win_rate": round(summary["win_rate"], 4),
+        "steps_per_sec": round(summary["steps_per_sec"], 1),
+        "epochs": summary["epochs"],
+        "seconds": round(summary["seconds"], 2),
+        "error": "",
+    }
+
+
+def run_sweep(configs, maze, workers=None, out_path="sweep_results.csv", seed=0):
+    """
+    Run every configuration across a process pool and write a CSV table.
+
+    Rows are written as runs finish, so a partial table survives an
+    interrupted sweep. A failing configuration records its error instead of
+    stopping the sweep.
+
+    Returns:
+        list of dict: one row per configuration (parameters + results).
+    """
+    workers = workers or os.cpu_count() or 1
+    param_keys = sorted({k for config in configs for k in config})
+    rows = []
+
+    ctx = mp.get_context("spawn")
+    with open(out_path, "w", newline="") as f, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                initializer=_limit_threads) as pool:
+        writer = csv.DictWriter(f, fieldnames=["run"] + param_keys + list(RESULT_COLUMNS))
+        writer.writeheader()
+
+        futures = {pool.submit(run_config, config, maze, seed): (i, config)
+                   for i, config in enumerate(configs)}
+
+        for future in as_completed(futures):
+            i, config = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {col: "" for col in RESULT_COLUMNS}
+                result["error"] = repr(e)
+
+            row = {"run": i, **config, **result}
+            rows.append(row)
+            writer.writerow(row)
+            f.flush()
+            print(f"[{len(rows)}/{len(configs)}] run {i} {config} -> "
+                  f"win rate {result['final_win_rate']} "
+                  f"epochs to 95%: {result['epochs_to_95'] or '-'}", flush=True)
+
+    return sorted(rows, key=lambda row: row["run"])
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_space(items):
+    """
+    Parse "key=a,b,c" (choices) and "key=low:high" (range) arguments.
+    """
+    space = {}
+    for item in items:
+        key, _, values = item.partition("=")
+        if ":" in values:
+            low, high = values.split(":")
+            space[key] = (_parse_value(low), _parse_value(high))
+        else:
+            space[key] = [_parse_value(v) for v in values.split(",")]
+    return space
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TreasureHuntTrainer hyperparameter sweep")
+    parser.add_argument("--grid", nargs="+", metavar="KEY=V1,V2",
+                        help="grid search over every combination")
+    parser.add_argument("--random", type=int, metavar="N",
+                        help="random search with N samples from --space")
+    parser.add_argument("--space", nargs="+", metavar="KEY=V1,V2|LOW:HIGH",
+                        help="search space for --random")
+    parser.add_argument("--epochs", type=int, default=500, help="n_epoch per run")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    if args.grid:
+        configs = grid_space(parse_space(args.grid))
+    elif args.random and args.space:
+        configs = random_space(parse_space(args.space), args.random, args.seed)
+    else:
+        parser.error("give --grid, or --random N with --space")
+
+    for config in configs:
+        config.setdefault("n_epoch", args.epochs)
+
+    from main import MAZE
+    run_sweep(configs, MAZE, workers=args.workers, out_path=args.out, seed=args.seed)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Regression tests for PolicyTable rollouts.
+
+Run with: python -m unittest test_policy_table
+"""
+import unittest
+
+import numpy as np
+
+from policy_table import PolicyTable
+
+UP, DOWN, LEFT, RIGHT = range(4)
+
+
+def open_corridor_table():
+    """
+    2x5 maze with no walls and a policy that walks right along the top row,
+    then down to the target at (1, 4): 5 steps from (0, 0), the shortest path.
+    """
+    actions = np.full((2, 5), RIGHT, dtype=np.int8)
+    actions[0, 4] = DOWN
+    return PolicyTable(actions, np.zeros((10, 4), dtype=np.float16))
+
+
+class StepsToTargetTest(unittest.TestCase):
+
+    def test_arrival_on_the_last_allowed_step_is_a_win(self):
+        table = open_corridor_table()
+        won, path = table.play((0, 0), max_steps=5)
+        self.assertTrue(won)
+        self.assertEqual(len(path) - 1, 5)
+
+        won, steps = table.steps_to_target([(0, 0)], max_steps=5)
+        self.assertEqual(won.tolist(), [True])
+        self.assertEqual(steps.tolist(), [5])
+
+        result = table.evaluate(start_cells=[(0, 0)], max_steps=5)
+        self.assertEqual(result["win_rate"], 1.0)
+        self.assertEqual(result["optimal_rate"], 1.0)
+
+    def test_running_out_of_steps_is_a_loss(self):
+        table = open_corridor_table()
+        won, steps = table.steps_to_target([(0, 0)], max_steps=4)
+        self.assertEqual(won.tolist(), [False])
+        self.assertEqual(steps.tolist(), [4])
+        self.assertEqual(table.evaluate(start_cells=[(0, 0)], max_steps=4)["win_rate"], 0.0)
+
+    def test_start_on_target_is_a_win_in_zero_steps(self):
+        table = open_corridor_table()
+        won, steps = table.steps_to_target([(1, 4)], max_steps=0)
+        self.assertEqual(won.tolist(), [True])
+        self.assertEqual(steps.tolist(), [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Per-phase timing and structured metrics for training runs.
+
+TreasureHuntTrainer.train accepts callbacks; when any are given it times each
+phase of every epoch with a PhaseTimer and hands one record per epoch to each
+callback. JsonlMetricsSink is the built-in callback that appends those
+records to a JSON Lines file. Without callbacks the trainer uses NULL_TIMER,
+whose timing blocks do nothing.
+"""
+import json
+import time
+from contextlib import nullcontext
+
+# Phases timed by TreasureHuntTrainer.train, in epoch order
+PHASES = (
+    "action_selection",   # epsilon-greedy choice, including Q-network inference
+    "env_step",           # TreasureMaze.act / VectorTreasureMaze.act
+    "replay_insert",      # GameExperience.remember
+    "replay_sample",      # minibatch sampling and Bellman target computation
+    "gradient_step",      # train_on_batch and inference-engine sync
+    "target_sync",        # update_target_model
+    "evaluation",         # greedy whole-maze evaluation for early stopping
+    "checkpoint",         # saving the model
+)
+
+
+class _Phase:
+    """
+    Context manager that adds its elapsed time to one PhaseTimer slot.
+    """
+    __slots__ = ("totals", "name", "start")
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.totals[self.name] += time.perf_counter() - self.start
+
+
+class PhaseTimer:
+    """
+    Accumulates wall-clock seconds per named phase.
+
+    Usage:
+        with timer.phase("env_step"):
+            qmaze.act(...)
+    """
+    enabled = True
+
+    def __init__(self, phases=PHASES):
+        self.totals = dict.fromkeys(phases, 0.0)
+        self._phases = {name: _Phase(self.totals, name) for name in phases}
+
+    def phase(self, name):
+        return self._phases[name]
+
+    def reset(self):
+        """
+        Return the totals since the last reset and start from zero.
+        """
+        totals = dict(self.totals)
+        for name in self.totals:
+            self.totals[name] = 0.0
+        return totals
+
+
+class _NullTimer:
+    """
+    Disabled timer: every phase is a shared no-op context manager.
+    """
+    enabled = False
+    _null = nullcontext()
+
+    def phase(self, name):
+        return self._null
+
+    def reset(self):
+        return {}
+
+
+NULL_TIMER = _NullTimer()
+
+
+class TrainingCallback:
+    """
+    Base class for training hooks. Override any of the methods.
+    """
+
+    def on_train_begin(self, info):
+        """info: model name, epochs, max steps and trainer settings."""
+
+    def on_epoch_end(self, record):
+        """record: the per-epoch metrics dict, including "phases"."""
+
+    def on_train_end(self, summary):
+        """summary: the dict returned by TreasureHuntTrainer.train."""
+
+
+class JsonlMetricsSink(TrainingCallback):
+    """
+    Append one JSON object per epoch to a JSON Lines file.
+
+    The run's settings are written first as a record with "event":
+    "train_begin", and the final summary last with "event": "train_end".
+    Each line is flushed as it is written so monitoring can tail the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, default=float) + "\n")
+        self._file.flush()
+
+    def on_train_begin(self, info):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._write({"event": "train_begin", **info})
+
+    def on_epoch_end(self, record):
+        self._write({"event": "epoch", **record})
+
+    def on_train_end(self, summary):
+        self._write({"event": "train_end", **summary})
+        self._file.close()
+        self._file = None
@@ -0,0 +1,252 @@
+"""
+Offline trajectory datasets: transitions recorded to disk in columnar chunks.
+
+A dataset is a directory of chunks plus an index:
+
+    meta.json               obs_size, chunk_size, length of every chunk,
+                            and the environment the transitions came from
+    00000.states.npy        chunk 0, one .npy file per field
+    00000.actions.npy
+    00000.rewards.npy
+    00000.next_states.npy
+    00000.dones.npy
+    00001.states.npy        chunk 1, ...
+
+TrajectoryRecorder fills one chunk in memory and writes it out when it is
+full (or on flush), each file under a temporary name and renamed, then
+rewrites meta.json. A crash loses at most the chunk being filled, and
+recording into an existing directory appends new chunks.
+
+TrajectoryDataset memory-maps the chunk files, so opening a dataset of any
+size reads only meta.json. batches() streams shuffled minibatches a few
+chunks at a time with bounded memory. sample() draws uniformly from the
+whole dataset through the memory maps.
+"""
+import json
+import os
+
+import numpy as np
+
+META_FILE = "meta.json"
+FIELDS = ("states", "actions", "rewards", "next_states", "dones")
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, META_FILE)) as f:
+        return json.load(f)
+
+
+def _chunk_path(directory, index, field):
+    return os.path.join(directory, f"{index:05d}.{field}.npy")
+
+
+class TrajectoryRecorder:
+    """
+    Appends (s, a, r, s', done) transitions to a dataset directory.
+
+    Usage:
+        with TrajectoryRecorder("datasets/run1", maze_hash=..., discount=0.95) as recorder:
+            recorder.record((state, action, reward, next_state, done))
+
+    Setting it as a replay memory's recorder records every transition the
+    trainer remembers; TreasureHuntTrainer.train(record=...) does that.
+    """
+
+    def __init__(self, directory, chunk_size=65536, **metadata):
+        """
+        Parameters:
+            directory (str): Dataset directory, created if needed. An
+                existing dataset is appended to.
+            chunk_size (int): Transitions per chunk file (for a new dataset).
+            metadata: JSON-serializable environment description (maze hash,
+                distance, view radius, discount, ...) stored in meta.json.
+                When appending, it must match what the dataset recorded.
+
+        Raises:
+            ValueError: The existing dataset was recorded with different
+                metadata.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            self.meta = _read_meta(directory)
+            # Compare as stored, so tuples match the lists JSON gives back
+            for key, value in json.loads(json.dumps(metadata)).items():
+                if self.meta.get(key) != value:
+                    raise ValueError(f"Dataset {directory} was recorded with {key} "
+                                     f"{self.meta.get(key)!r}, not {value!r}.")
+        else:
+            self.meta = {"obs_size": None, "chunk_size": chunk_size, "chunks": []}
+            self.meta.update(metadata)
+
+        self.chunk_size = self.meta["chunk_size"]
+        self.recorded = 0
+        self._buffers = None
+        self._count = 0
+
+    def _allocate(self, obs_size):
+        if self.meta["obs_size"] is None:
+            self.meta["obs_size"] = obs_size
+        elif self.meta["obs_size"] != obs_size:
+            raise ValueError(f"Dataset {self.directory} holds {self.meta['obs_size']}-feature "
+                             f"observations, not {obs_size}.")
+
+        n = self.chunk_size
+        self._buffers = {
+            "states": np.zeros((n, obs_size), dtype=np.float32),
+            "actions": np.zeros(n, dtype=np.int8),
+            "rewards": np.zeros(n, dtype=np.float32),
+            "next_states": np.zeros((n, obs_size), dtype=np.float32),
+            "dones": np.zeros(n, dtype=bool),
+        }
+
+    def record(self, transition):
+        """
+        Add one transition; writes a chunk when the buffer fills.
+        """
+        s, a, r, s_next, done = transition
+        if self._buffers is None:
+            self._allocate(np.size(s))
+
+        i = self._count
+        buffers = self._buffers
+        buffers["states"][i] = s
+        buffers["actions"][i] = a
+        buffers["rewards"][i] = r
+        buffers["next_states"][i] = s_next
+        buffers["dones"][i] = done
+
+        self._count = i + 1
+        self.recorded += 1
+        if self._count == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the transitions buffered so far as a chunk, if there are any.
+        """
+        n = self._count
+        if n == 0:
+            return
+
+        index = len(self.meta["chunks"])
+        for field in FIELDS:
+            path = _chunk_path(self.directory, index, field)
+            # np.save appends .npy to names that lack it
+            tmp_path = path[:-len(".npy")] + ".tmp.npy"
+            np.save(tmp_path, self._buffers[field][:n])
+            os.replace(tmp_path, path)
+
+        self.meta["chunks"].append(n)
+        _write_json(os.path.join(self.directory, META_FILE), self.meta)
+        self._count = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryDataset:
+    """
+    Read-only view of a recorded dataset, memory-mapped chunk by chunk.
+
+    Batches have the layout of the replay memories' sample(): (states,
+    actions, rewards, next_states, dones) with int64 actions.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = _read_meta(directory)
+        self.obs_size = self.meta["obs_size"]
+        self.lengths = np.array(self.meta["chunks"], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.lengths)])
+        self._maps = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def num_chunks(self):
+        return len(self.lengths)
+
+    def chunk(self, index):
+        """
+        Memory-mapped {field: array} of one chunk, opened on first use.
+        """
+        columns = self._maps.get(index)
+        if columns is None:
+            columns = self._maps[index] = {
+                field: np.load(_chunk_path(self.directory, index, field), mmap_mode="r")
+                for field in FIELDS
+            }
+        return columns
+
+    @staticmethod
+    def _batch(columns, rows):
+        return (np.asarray(columns["states"][rows], dtype=np.float32),
+                np.asarray(columns["actions"][rows], dtype=np.int64),
+                np.asarray(columns["rewards"][rows], dtype=np.float32),
+                np.asarray(columns["next_states"][rows], dtype=np.float32),
+                np.asarray(columns["dones"][rows], dtype=bool))
+
+    def gather(self, indices):
+        """
+        Transitions at the given dataset-wide indices, in that order.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        chunk_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+
+        n = len(indices)
+        out = (np.empty((n, self.obs_size), dtype=np.float32), np.empty(n, dtype=np.int64),
+               np.empty(n, dtype=np.float32), np.empty((n, self.obs_size), dtype=np.float32),
+               np.empty(n, dtype=bool))
+        for c in np.unique(chunk_ids):
+            where = np.flatnonzero(chunk_ids == c)
+            rows = indices[where] - self.offsets[c]
+            # Sorted rows read each page of the memory map once
+            order = np.argsort(rows)
+            part = self._batch(self.chunk(int(c)), rows[order])
+            for column, values in zip(out, part):
+                column[where[order]] = values
+        return out
+
+    def sample(self, batch_size=32):
+        """
+        Uniform random minibatch from the whole dataset.
+        """
+        return self.gather(np.random.randint(len(self), size=batch_size))
+
+    def batches(self, batch_size=32, passes=1, window=4, shuffle=True, drop_last=False):
+        """
+        Stream minibatches over the dataset, passes times.
+
+        Chunks are visited in random order, window at a time. Each window is
+        read into memory and shuffled, so at most window * chunk_size
+        transitions are held at once. The last batch of each window may be
+        smaller, unless drop_last skips it.
+        """
+        for _ in range(passes):
+            order = np.random.permutation(self.num_chunks) if shuffle else np.arange(self.num_chunks)
+            for start in range(0, len(order), window):
+                parts = [self._batch(self.chunk(int(c)), slice(None))
+                         for c in order[start:start + window]]
+                columns = [np.concatenate(field) for field in zip(*parts)]
+                n = len(columns[1])
+                rows = np.random.permutation(n) if shuffle else np.arange(n)
+                end = n - n % batch_size if drop_last else n
+                for i in range(0, end, batch_size):
+                    take = rows[i:i + batch_size]
+                    yield tuple(column[take] for column in columns)
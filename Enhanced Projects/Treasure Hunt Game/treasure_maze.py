@@ -1,29 +1,167 @@
+from functools import cached_property
+
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import defaultdict
+
+from maze_render import MazeRenderer, to_rgb
+from maze_solver import DISTANCES, distance_field, solve
+
+
+def _check_cells(maze, start, target):
+    rows, cols = maze.shape
+    for name, (r, c) in (("start", start), ("target", target)):
+        if not (0 <= r < rows and 0 <= c < cols) or maze[r, c] != 1.0:
+            raise ValueError(f"The {name} cell {(r, c)} must be a free cell inside the maze.")
+
+
+def _view_window(padded, rows, cols, radius):
+    """
+    Free-cell flags in the (2 * radius + 1)^2 window around each (row, col),
+    row-major. padded is the free-cell grid padded by radius walls.
+    """
+    side = 2 * radius + 1
+    dr, dc = np.divmod(np.arange(side * side), side)
+    return padded[np.add.outer(rows, dr), np.add.outer(cols, dc)]
 
 
 class TreasureMaze:
-    def __init__(self, maze, start=(0, 0)):
+    def __init__(self, maze, start=(0, 0), compiled=False, distance="manhattan",
+                 target=None, view_radius=0):
+        """
+        Parameters:
+            maze (list or ndarray): Grid of 1 (path) and 0 (wall).
+            start (tuple): Default starting cell for reset().
+            compiled (bool): Precompute per-cell transition, observation,
+                valid-action and reward tables so act() and observe() are
+                table lookups. Only valid while self.maze is not modified.
+            distance (str): Distance to the target used for reward shaping
+                and the observation's distance feature: "manhattan", or
+                "geodesic" for exact shortest-path lengths (maze_solver).
+            target (tuple): Treasure cell (default: bottom-right).
+            view_radius (int): Above 0, append the free/wall flags of the
+                (2 * view_radius + 1)^2 cells around the agent to the
+                observation. On large grids neighbouring cells differ by
+                tiny amounts in the normalized coordinates, so the local
+                view is what lets the network tell them apart.
+        """
+        if distance not in DISTANCES:
+            raise ValueError(f"Unknown distance '{distance}'. Choose from: {', '.join(DISTANCES)}")
+
         self.maze = np.array(maze, dtype=float)
-        self.start = start
+        nrows, ncols = self.maze.shape
+        self.start = tuple(start)
+        self.target = (nrows - 1, ncols - 1) if target is None else tuple(target)
+        _check_cells(self.maze, self.start, self.target)
+
+        self.compiled = compiled
+        self.distance = distance
+        self.view_radius = view_radius
+        self.obs_size = 7 + (2 * view_radius + 1) ** 2 if view_radius else 7
+        self.num_actions = 4
+
+        # Per-episode visit counts, one entry per cell. reset() zeroes only
+        # the cells listed in _visited, so it costs the same on any maze size
+        self.visit_count = np.zeros((nrows, ncols), dtype=np.int32)
+        self._visits_flat = self.visit_count.ravel()
+        self._visited = []
         self.reset(start)
 
-        self.free_cells = [
-            (r, c)
-            for r in range(self.maze.shape[0])
-            for c in range(self.maze.shape[1])
-            if self.maze[r, c] == 1.0
-        ]
+        self._dist, self._dist_scale = distance_field(self.maze, self.target, distance)
+        if view_radius:
+            self._view_pad = np.pad(self.maze == 1.0, view_radius, constant_values=False)
 
-        self.target = (self.maze.shape[0] - 1, self.maze.shape[1] - 1)
-        self.num_actions = 4
+        if compiled:
+            self._compile()
+
+    @cached_property
+    def free_cells(self):
+        """
+        Free cells as (row, col) tuples, built on first use: on a 1000x1000
+        maze the list alone takes about 60 MB.
+        """
+        return list(map(tuple, np.argwhere(self.maze == 1.0).tolist()))
+
+    def observation_table(self):
+        """
+        observe() for every cell at once: a (rows * cols, obs_size) float32
+        array, row-major (cell = row * ncols + col). Rows of wall cells are
+        filled in but never observed.
+        """
+        nrows, ncols = self.maze.shape
+        free = np.pad(self.maze == 1.0, 1, constant_values=False)
+        rows, cols = np.divmod(np.arange(nrows * ncols), ncols)
+        pr, pc = rows + 1, cols + 1
+
+        obs = np.empty((nrows * ncols, self.obs_size), dtype=np.float32)
+        obs[:, 0] = 2 * rows / (nrows - 1) - 1
+        obs[:, 1] = 2 * cols / (ncols - 1) - 1
+        obs[:, 2] = self._dist.ravel() / self._dist_scale
+        obs[:, 3:7] = np.stack([
+            free[pr - 1, pc], free[pr + 1, pc],
+            free[pr, pc - 1], free[pr, pc + 1],
+        ], axis=1)
+        if self.view_radius:
+            obs[:, 7:] = _view_window(self._view_pad, rows, cols, self.view_radius)
+        return obs
+
+    def _compile(self):
+        """
+        Build the lookup tables used in compiled mode.
+
+        Cells are numbered row-major (cell = row * ncols + col), and the
+        (cell, action) tables are flattened to index cell * 4 + action.
+        Scalar tables are kept as flat Python lists because indexing a list
+        with a Python int is much cheaper than indexing a NumPy array.
+        """
+        nrows, ncols = self.maze.shape
+        free = np.pad(self.maze == 1.0, 1, constant_values=False)
+        rows, cols = np.divmod(np.arange(nrows * ncols), ncols)
+        pr, pc = rows + 1, cols + 1
+
+        # Free-neighbour flags in action order: up, down, left, right
+        flags = np.stack([
+            free[pr - 1, pc], free[pr + 1, pc],
+            free[pr, pc - 1], free[pr, pc + 1],
+        ], axis=1)
+        n_valid = np.maximum(flags.sum(axis=1), 1)   # fallback action counts
+
+        # Next cell per (cell, action), -1 for walls and the border
+        offsets = np.array([-ncols, ncols, -1, 1])
+        next_cell = np.where(flags, np.arange(nrows * ncols)[:, None] + offsets, -1)
+
+        # Observation vector per cell
+        tr, tc = self.target
+        dist = self._dist.ravel()
+        obs = self.observation_table()
+
+        # Static reward per (cell, action): step penalty, distance shaping
+        # and dead-end penalty of the destination. Revisits are added at
+        # step time; walls are -1.
+        dest = np.maximum(next_cell, 0)
+        reward = np.full(next_cell.shape, -0.05)
+        reward += np.where(dist[dest] < dist[:, None], 0.2, 0.0)
+        reward -= np.where(dist[dest] > dist[:, None], 0.1, 0.0)
+        reward -= np.where(n_valid[dest] == 1, 0.15, 0.0)
+        reward = np.where(next_cell >= 0, reward, -1.0)
+
+        self._ncols = ncols
+        self._target_cell = tr * ncols + tc
+        self._next_cell = next_cell.ravel().tolist()
+        self._step_reward = reward.ravel().tolist()
+        self._obs_table = obs
+
+        # Valid-action list per cell, shared between cells with the same
+        # 4-bit neighbour pattern
+        patterns = [[a for a in range(4) if code >> a & 1] or [0] for code in range(16)]
+        codes = flags @ np.array([1, 2, 4, 8])
+        self._valid_table = [patterns[code] for code in codes.tolist()]
 
     def reset(self, start=None):
-        self.state = start if start is not None else self.start
-        self.visited = set([self.state])
-        self.visit_count = defaultdict(int)
-        self.visit_count[self.state] += 1
+        self.state = tuple(start) if start is not None else self.start
+        visits = self._visits_flat
+        visits[self._visited] = 0
+        cell = self.state[0] * self.visit_count.shape[1] + self.state[1]
+        visits[cell] = 1
+        self._visited = [cell]
         return self.state
 
     def valid_actions(self, cell=None):
@@ -32,6 +170,9 @@ class TreasureMaze:
         else:
             row, col = cell
 
+        if self.compiled:
+            return self._valid_table[row * self._ncols + col]
+
         actions = []
         nrows, ncols = self.maze.shape
 
@@ -54,6 +195,10 @@ class TreasureMaze:
         return actions
 
     def act(self, action, prev_row=None, prev_col=None):
+        # The static reward table assumes shaping from the current cell
+        if self.compiled and (prev_row, prev_col) == self.state:
+            return self._act_compiled(action)
+
         row, col = self.state
 
         # Apply the action
@@ -76,8 +221,10 @@ class TreasureMaze:
 
         # Valid move → update state
         self.state = (row, col)
-        self.visit_count[self.state] += 1
-        visited_before = (self.visit_count[self.state] > 1)
+        visited_before = self.visit_count[row, col] > 0
+        self.visit_count[row, col] += 1
+        if not visited_before:
+            self._visited.append(row * ncols + col)
 
         # ------------------------------------------------------------------
         # Base step penalty
@@ -88,9 +235,8 @@ class TreasureMaze:
         # Distance shaping (primary positive signal)
         # ------------------------------------------------------------------
         if prev_row is not None and prev_col is not None:
-            tr, tc = self.target
-            prev_dist = abs(prev_row - tr) + abs(prev_col - tc)
-            new_dist = abs(row - tr) + abs(col - tc)
+            prev_dist = self._dist[prev_row, prev_col]
+            new_dist = self._dist[row, col]
 
             if new_dist < prev_dist:
                 reward += 0.2
@@ -117,7 +263,36 @@ class TreasureMaze:
 
         return self.observe(), reward, "playing"
 
+    def _act_compiled(self, action):
+        row, col = self.state
+        key = (row * self._ncols + col) * 4 + action
+        nxt = self._next_cell[key]
+
+        # Out-of-bounds or wall
+        if nxt < 0:
+            return self.observe(), -1.0, "playing"
+
+        self.state = divmod(nxt, self._ncols)
+        visits = self._visits_flat
+        seen = visits[nxt]
+        visits[nxt] = seen + 1
+        if not seen:
+            self._visited.append(nxt)
+
+        if nxt == self._target_cell:
+            return self._obs_table[nxt].copy(), 10.0, "win"
+
+        reward = self._step_reward[key]
+        if seen:
+            reward -= 0.10
+
+        return self._obs_table[nxt].copy(), reward, "playing"
+
     def observe(self):
+        if self.compiled:
+            r, c = self.state
+            return self._obs_table[r * self._ncols + c].copy()
+
         r, c = self.state
         rows, cols = self.maze.shape
 
@@ -126,9 +301,7 @@ class TreasureMaze:
         c_norm = 2 * c / (cols - 1) - 1
 
         # Distance to target, normalized
-        tr, tc = self.target
-        max_dist = rows + cols
-        dist_norm = (abs(r - tr) + abs(c - tc)) / max_dist
+        dist_norm = self._dist[r, c] / self._dist_scale
 
         # Action availability flags
         up_free = 1.0 if r > 0 and self.maze[r - 1, c] == 1.0 else 0.0
@@ -136,25 +309,199 @@ class TreasureMaze:
         left_free = 1.0 if c > 0 and self.maze[r, c - 1] == 1.0 else 0.0
         right_free = 1.0 if c < cols - 1 and self.maze[r, c + 1] == 1.0 else 0.0
 
-        return np.array([
+        obs = np.array([
             r_norm, c_norm,
             dist_norm,
             up_free, down_free, left_free, right_free
         ], dtype=np.float32)
 
-    def show(self, path=None):
-        canvas = np.copy(self.maze)
+        # Local view window
+        if self.view_radius:
+            side = 2 * self.view_radius + 1
+            window = self._view_pad[r:r + side, c:c + side]
+            obs = np.concatenate([obs, window.ravel().astype(np.float32)])
 
-        if path is not None:
-            for (r, c) in path:
-                if 0 <= r < self.maze.shape[0] and 0 <= c < self.maze.shape[1]:
-                    canvas[r, c] = 0.6
+        return obs
 
-        r, c = self.state
-        canvas[r, c] = 0.3
+    def solution(self):
+        """
+        Exact shortest-path solution for this maze and target (cached).
+        """
+        return solve(self.maze, self.target)
+
+    def render(self, path=None, cell_px=None):
+        """
+        Palette-index image of the maze, the path so far and the agent;
+        see maze_render.
+        """
+        renderer = MazeRenderer(self.maze, self.start, self.target, cell_px=cell_px)
+        return renderer.frame(self.state, path if path is not None else ())
+
+    def show(self, path=None):
+        # Deferred so the environment works without a display or matplotlib
+        import matplotlib.pyplot as plt
 
         plt.figure(figsize=(5, 5))
-        plt.imshow(canvas, cmap='gray_r', interpolation='none')
+        plt.imshow(to_rgb(self.render(path)), interpolation='none')
         plt.xticks([])
         plt.yticks([])
         plt.show()
+
+
+# Status codes returned by VectorTreasureMaze.act
+PLAYING = 0
+WIN = 1
+
+# Row/column offsets for actions up, down, left, right
+ACTION_DELTAS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]], dtype=np.int64)
+
+
+class VectorTreasureMaze:
+    """
+    N independent agents in the same maze, stepped together with NumPy.
+
+    Positions, visited-cell flags and statuses are arrays with one row per agent,
+    and act() takes one action per agent and returns batched observations,
+    rewards and statuses with the same reward shaping as TreasureMaze.act
+    (shaping is always measured from the agent's position before the move,
+    as the trainer does), including the choice of distance. Agents that
+    have already won are frozen and get a reward of 0 until they are reset.
+
+    With track_visits=False no per-agent visited flags are kept (they cost
+    n_envs * rows * cols bytes) and the revisit penalty is not applied;
+    greedy evaluation, which ignores rewards, uses this for one agent per
+    free cell.
+    """
+
+    def __init__(self, maze, n_envs, start=(0, 0), distance="manhattan", track_visits=True,
+                 target=None, view_radius=0):
+        self.maze = np.array(maze, dtype=float)
+        rows, cols = self.maze.shape
+        self.n_envs = n_envs
+        self.start = tuple(start)
+        self.target = (rows - 1, cols - 1) if target is None else tuple(target)
+        _check_cells(self.maze, self.start, self.target)
+        self.num_actions = 4
+        self.distance = distance
+        self._dist, self._dist_scale = distance_field(self.maze, self.target, distance)
+        self.view_radius = view_radius
+        self.obs_size = 7 + (2 * view_radius + 1) ** 2 if view_radius else 7
+
+        # Zero border so neighbour lookups never go out of bounds
+        self.padded = np.pad(self.maze == 1.0, 1, constant_values=False)
+        if view_radius:
+            self._view_pad = np.pad(self.maze == 1.0, view_radius, constant_values=False)
+
+        self.positions = np.zeros((n_envs, 2), dtype=np.int64)
+        self.visited = np.zeros((n_envs, rows, cols), dtype=bool) if track_visits else None
+        self.status = np.full(n_envs, PLAYING, dtype=np.int8)
+        self.reset()
+
+    def reset(self, indices=None, starts=None):
+        """
+        Reset the given agents (all by default) to their start cells.
+
+        starts may be a single (row, col) or one cell per reset agent.
+        """
+        if indices is None:
+            indices = np.arange(self.n_envs)
+        if starts is None:
+            starts = self.start
+
+        self.positions[indices] = starts
+        if self.visited is not None:
+            self.visited[indices] = False
+            rows, cols = self.positions[indices].T
+            self.visited[indices, rows, cols] = True
+        self.status[indices] = PLAYING
+        return self.observe()
+
+    def valid_action_mask(self):
+        """
+        Boolean (n_envs, 4) mask of moves that stay on a free cell.
+
+        Mirrors TreasureMaze.valid_actions, including its fallback of
+        allowing action 0 when an agent has no free neighbour.
+        """
+        pr, pc = self.positions[:, 0] + 1, self.positions[:, 1] + 1
+        mask = np.stack([
+            self.padded[pr - 1, pc],
+            self.padded[pr + 1, pc],
+            self.padded[pr, pc - 1],
+            self.padded[pr, pc + 1],
+        ], axis=1)
+        mask[~mask.any(axis=1), 0] = True
+        return mask
+
+    def act(self, actions):
+        """
+        Apply one action per agent.
+
+        Returns:
+            (observations, rewards, statuses): arrays of shape (n_envs, obs_size),
+            (n_envs,) and (n_envs,), with statuses as PLAYING or WIN.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        tr, tc = self.target
+
+        active = self.status == PLAYING
+        prev = self.positions.copy()
+        new = prev + ACTION_DELTAS[actions]
+
+        # Out-of-bounds or wall: stay put with a -1 penalty
+        moved = active & self.padded[new[:, 0] + 1, new[:, 1] + 1]
+        rewards = np.where(active, -1.0, 0.0).astype(np.float32)
+
+        self.positions[moved] = new[moved]
+        idx = np.flatnonzero(moved)
+        nr, nc = new[idx, 0], new[idx, 1]
+        if self.visited is not None:
+            revisit = self.visited[idx, nr, nc]
+            self.visited[idx, nr, nc] = True
+
+        # Base step penalty
+        step = np.full(len(idx), -0.05)
+
+        # Distance shaping
+        prev_dist = self._dist[prev[idx, 0], prev[idx, 1]]
+        new_dist = self._dist[nr, nc]
+        step += np.where(new_dist < prev_dist, 0.2, 0.0)
+        step -= np.where(new_dist > prev_dist, 0.1, 0.0)
+
+        # Revisit penalty
+        if self.visited is not None:
+            step -= np.where(revisit, 0.10, 0.0)
+
+        # Dead-end penalty
+        pr, pc = nr + 1, nc + 1
+        n_free = (self.padded[pr - 1, pc].astype(int) + self.padded[pr + 1, pc]
+                  + self.padded[pr, pc - 1] + self.padded[pr, pc + 1])
+        step -= np.where(n_free <= 1, 0.15, 0.0)
+
+        # Goal
+        won = (nr == tr) & (nc == tc)
+        step[won] = 10.0
+        self.status[idx[won]] = WIN
+
+        rewards[idx] = step
+        return self.observe(), rewards, self.status.copy()
+
+    def observe(self):
+        """
+        Batched TreasureMaze.observe(): one obs_size-feature row per agent.
+        """
+        rows, cols = self.maze.shape
+        r, c = self.positions[:, 0], self.positions[:, 1]
+        pr, pc = r + 1, c + 1
+
+        obs = np.empty((self.n_envs, self.obs_size), dtype=np.float32)
+        obs[:, 0] = 2 * r / (rows - 1) - 1
+        obs[:, 1] = 2 * c / (cols - 1) - 1
+        obs[:, 2] = self._dist[r, c] / self._dist_scale
+        obs[:, 3] = self.padded[pr - 1, pc]
+        obs[:, 4] = self.padded[pr + 1, pc]
+        obs[:, 5] = self.padded[pr, pc - 1]
+        obs[:, 6] = self.padded[pr, pc + 1]
+        if self.view_radius:
+            obs[:, 7:] = _view_window(self._view_pad, r, c, self.view_radius)
+        return obs
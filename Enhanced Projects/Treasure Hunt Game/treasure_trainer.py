@@ -1,13 +1,16 @@
 import random
 import datetime
+import signal
+import time
 import numpy as np
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Dense, PReLU
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras import Input
-from tensorflow.keras.losses import Huber
-from treasure_maze import TreasureMaze
-from game_experience import GameExperience
+from treasure_maze import TreasureMaze, VectorTreasureMaze, PLAYING, WIN
+from game_experience import make_experience
+from numpy_inference import NumpyQNetwork
+from training_metrics import PhaseTimer, NULL_TIMER, JsonlMetricsSink
+from checkpointing import CheckpointWriter, group, load_checkpoint
+from maze_render import MazeRenderer
+from model_registry import default_registry, maze_hash
+from trajectory_dataset import TrajectoryDataset, TrajectoryRecorder
 import os
 
 # Enable ESC key detection on Windows terminals
@@ -32,7 +35,12 @@ class TreasureHuntTrainer:
 
     def __init__(self, maze, start=(0, 0),
                  epsilon=0.9, lr=0.001,
-                 epsilon_decay=0.99, min_epsilon=0.05):
+                 epsilon_decay=0.99, min_epsilon=0.05,
+                 replay_backend="deque", n_envs=1, inference="numpy",
+                 batch_size=32, train_repeats=10, target_update_interval=1,
+                 max_memory=5000, discount=0.95, n_step=1, distance="manhattan",
+                 target=None, view_radius=0, update_step="keras", target_tau=1.0,
+                 verbose=True):
         """
         Initialize the trainer and environment.
 
@@ -43,13 +51,53 @@ class TreasureHuntTrainer:
             lr (float): Learning rate for Adam optimizer.
             epsilon_decay (float): How quickly epsilon decreases.
             min_epsilon (float): Exploration floor value.
+            replay_backend (str): Replay memory storage: "deque", "array"
+                or "prioritized".
+            n_envs (int): Episodes collected per epoch. Above 1, episodes
+                run side by side in a VectorTreasureMaze with one batched
+                Q-network call per step.
+            inference (str): "numpy" runs acting, play and replay target
+                computation through NumpyQNetwork copies of the networks,
+                refreshed after every gradient step and target sync;
+                "keras" calls the Keras models directly.
+            batch_size (int): Samples per training step.
+            train_repeats (int): Training batches per epoch.
+            target_update_interval (int): Sync the target network every N epochs.
+            max_memory (int): Replay buffer capacity.
+            discount (float): Future reward discount factor.
+            n_step (int): Reward steps summed into each replay target
+                before bootstrapping from the target network; see
+                game_experience.NStepAccumulator.
+            distance (str): "manhattan" or "geodesic" distance for reward
+                shaping and the observation's distance feature. A model must
+                be played with the distance it was trained with.
+            target (tuple): Treasure cell (default: bottom-right).
+            view_radius (int): Add the (2 * view_radius + 1)^2 local wall
+                layout around the agent to the observation; see TreasureMaze.
+                Like distance, fixed for a trained model.
+            update_step (str): "keras" builds Bellman targets on the host and
+                calls train_on_batch; "compiled" runs targets, loss and
+                optimizer step as one tf.function on raw replay batches
+                (see dqn_update.py).
+            target_tau (float): 1.0 copies the Q-network into the target
+                network every target_update_interval epochs. Below 1, the
+                target moves target_tau of the way towards the Q-network
+                after every gradient step instead (Polyak averaging).
+            verbose (bool): Print the per-epoch training log.
         """
 
         # Build or load the maze environment
         if isinstance(maze, TreasureMaze):
             self.qmaze = maze
         else:
-            self.qmaze = TreasureMaze(maze, start)
+            self.qmaze = TreasureMaze(maze, start, distance=distance, target=target,
+                                      view_radius=view_radius)
+
+        # Parallel episodes for batched experience collection
+        self.n_envs = n_envs
+        self.venv = None
+        if n_envs > 1:
+            self.venv = self._vector_env(n_envs)
 
         # Exploration parameters
         self.epsilon = epsilon
@@ -57,25 +105,61 @@ class TreasureHuntTrainer:
         self.min_epsilon = min_epsilon
         self.lr = lr
 
+        # Training schedule
+        self.batch_size = batch_size
+        self.train_repeats = train_repeats
+        self.target_update_interval = target_update_interval
+        self.target_tau = target_tau
+        self.verbose = verbose
+
+        # Per-phase timing; replaced by a PhaseTimer while callbacks are attached
+        self.timer = NULL_TIMER
+
         # Neural networks
         self.model = None           # Online Q-network
         self.target_model = None    # Target Q-network (stabilizes learning)
 
+        # Inference copies used for acting and target computation
+        if inference not in ("numpy", "keras"):
+            raise ValueError(f"Unknown inference engine '{inference}'. Choose 'numpy' or 'keras'.")
+        self.inference = inference
+        self.policy = None
+        self.target_policy = None
+
+        # Gradient step implementation
+        if update_step not in ("keras", "compiled"):
+            raise ValueError(f"Unknown update step '{update_step}'. Choose 'keras' or 'compiled'.")
+        self.update_step = update_step
+        self._update = None
+
         # Replay buffer
-        self.exp = GameExperience(max_memory=5000, discount=0.95)
+        self.exp = make_experience(replay_backend, max_memory=max_memory, discount=discount,
+                                   n_step=n_step)
+        self.replay_backend = replay_backend
+
+        # Saved models and their metadata
+        self.registry = default_registry()
 
     def build_model(self):
         """
         Construct a fully-connected DQN model.
 
         Input shape:
-            7-dimensional state vector from TreasureMaze.observe()
+            obs_size-dimensional state vector from TreasureMaze.observe()
+            (7 features, plus the local view when view_radius > 0)
 
         Returns:
             A compiled Keras model.
         """
+        # TensorFlow is imported on first use so menus and tools start fast
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import Dense, PReLU
+        from tensorflow.keras.optimizers import Adam
+        from tensorflow.keras import Input
+        from tensorflow.keras.losses import Huber
+
         model = Sequential()
-        model.add(Input(shape=(7,)))
+        model.add(Input(shape=(self.qmaze.obs_size,)))
         model.add(Dense(128))
         model.add(PReLU())
         model.add(Dense(128))
@@ -88,15 +172,104 @@ class TreasureHuntTrainer:
         model.compile(optimizer=Adam(self.lr), loss=Huber())
         return model
 
-    def update_target_model(self):
+    def update_target_model(self, tau=1.0):
         """
-        Sync the target network with the current Q-network.
+        Sync the target network with the current Q-network, or with tau < 1
+        move it that fraction of the way (Polyak averaging).
 
         Helps stabilize training by removing oscillations.
         """
-        self.target_model.set_weights(self.model.get_weights())
+        if self._update is not None:
+            self._update.sync_target(tau)
+        elif tau == 1.0:
+            self.target_model.set_weights(self.model.get_weights())
+        else:
+            self.target_model.set_weights([
+                tau * w + (1.0 - tau) * t
+                for w, t in zip(self.model.get_weights(), self.target_model.get_weights())])
+
+        if isinstance(self.target_policy, NumpyQNetwork):
+            self.target_policy.sync(self.target_model)
+
+    def _build_networks(self):
+        """
+        Fresh Q-network and target network with their inference copies.
+        The target still needs update_target_model() (or a checkpoint).
+        """
+        self.model = self.build_model()
+        self.target_model = self.build_model()
+        self._update = None
+        self._attach_inference()
+
+    def _attach_update(self):
+        """
+        Build the compiled update step if update_step asks for it. Call once
+        the networks hold their starting weights.
+        """
+        if self.update_step == "compiled":
+            from dqn_update import CompiledDQNUpdate
+            self._update = CompiledDQNUpdate(self.model, self.target_model,
+                                             discount=self.exp.bootstrap_discount)
+
+    def _vector_env(self, n_envs, track_visits=True):
+        """
+        VectorTreasureMaze with the same layout and settings as self.qmaze.
+        """
+        q = self.qmaze
+        return VectorTreasureMaze(q.maze, n_envs, q.start, distance=q.distance,
+                                  track_visits=track_visits, target=q.target,
+                                  view_radius=q.view_radius)
+
+    def _attach_inference(self):
+        """
+        Point policy/target_policy at the engine used for forward passes.
+        The compiled update reads the target network in-graph, so it gets no
+        NumPy copy.
+        """
+        if self.inference == "numpy":
+            self.policy = NumpyQNetwork(self.model)
+            self.target_policy = (NumpyQNetwork(self.target_model)
+                                  if self.update_step == "keras" else self.target_model)
+        else:
+            self.policy = self.model
+            self.target_policy = self.target_model
+
+    def _sync_policy(self):
+        if self.inference == "numpy":
+            self.policy.sync(self.model)
+
+    def q_values(self, states):
+        """
+        Q-values for a (batch, obs_size) array of states from the inference engine.
+        """
+        return np.asarray(self.policy.predict_on_batch(states))
+
+    def select_action(self, state, valid_actions, epsilon=None):
+        """
+        Epsilon-greedy action for one state, restricted to valid_actions.
 
-    def train(self, n_epoch=500, model_name="model", max_steps=300):
+        Parameters:
+            state (ndarray): Observation from TreasureMaze.observe().
+            valid_actions (list): Allowed actions in the current cell.
+            epsilon (float): Exploration rate; defaults to self.epsilon.
+        """
+        if epsilon is None:
+            epsilon = self.epsilon
+
+        # Epsilon-greedy exploration
+        if random.random() < epsilon:
+            return random.choice(valid_actions)
+
+        # Predict Q-values and mask invalid actions
+        qs = self.q_values(state.reshape(1, -1))[0]
+        masked = np.full_like(qs, -np.inf)
+        for a in valid_actions:
+            masked[a] = qs[a]
+        return int(np.argmax(masked))
+
+    def train(self, n_epoch=500, model_name="model", max_steps=300, save_model=True,
+              metrics_log=None, callbacks=None, eval_interval=None, eval_cells=None,
+              checkpoint_interval=None, resume=False, record=None):
         """
         Main training loop for the DQN agent.
 
@@ -105,134 +278,650 @@ class TreasureHuntTrainer:
         - Mini-batch training from replay buffer
         - Periodic target network updates
         - Early stopping when win-rate reaches threshold
+
+        Parameters:
+            metrics_log (str): Append one JSON record per epoch, with
+                per-phase timings, to this JSON Lines file.
+            callbacks (list): TrainingCallback objects that receive the same
+                records. Phase timing is only active when metrics_log or
+                callbacks are given.
+            eval_interval (int): Every eval_interval epochs, run evaluate()
+                and stop once 95% of start cells reach the treasure, instead
+                of using the rolling win rate of the training episodes.
+            eval_cells (int): Start cells sampled per evaluation (default:
+                every free cell).
+            checkpoint_interval (int): Every checkpoint_interval epochs, and
+                when training stops, write a full checkpoint (both networks,
+                optimizer state, replay memory, epsilon, win history, RNG
+                state) to saved_models/<model_name>.ckpt.npz. Writes happen
+                on a background thread.
+            resume (bool): Continue from that checkpoint, if it exists,
+                instead of building fresh networks. n_epoch counts from the
+                start of the original run.
+            record (str): Append every transition played to the trajectory
+                dataset in this directory, for train_offline() (see
+                trajectory_dataset.py).
+
+        Returns:
+            dict: epochs run, final win rate, wall-clock seconds, environment
+            steps per second and whether the early-stop win rate was reached.
         """
 
         # Build networks fresh each training session
-        self.model = self.build_model()
-        self.target_model = self.build_model()
-        self.update_target_model()
+        self._build_networks()
 
         win_history = []
-        batch_size = 32           # Samples per training step
-        train_repeats = 10         # How many batches per episode
-        target_update_interval = 1   # Sync model every N epochs
+        win_rate = 0.0
+        total_steps = 0
+        start_epoch = 0
+        elapsed_before = 0.0
+        checkpoint_path = self.checkpoint_path(model_name)
 
-        print(f"Starting training: {n_epoch} epochs, initial max {max_steps} steps")
-        print(f"Model: {model_name} | Epsilon: {self.epsilon:.3f} → {self.min_epsilon:.3f}")
-        print("ESC key: stop training, save model, return to menu.")
+        if resume and os.path.exists(checkpoint_path):
+            start_epoch, win_history, total_steps, elapsed_before = \
+                self._restore_checkpoint(checkpoint_path)
+            if self.verbose:
+                print(f"Resuming '{model_name}' at epoch {start_epoch} from {checkpoint_path}")
+        else:
+            self.update_target_model()
 
-        global_start = datetime.datetime.now()
+        self._attach_update()
+
+        writer = CheckpointWriter() if checkpoint_interval else None
+        if record:
+            self.exp.recorder = TrajectoryRecorder(record, **self._environment_info())
+        previous_handler = self._install_stop_handler()
+        converged = False
+        stopped = False
+        eval_win_rate = None
+        epoch = start_epoch - 1
+        batch_size = self.batch_size
+        train_repeats = self.train_repeats
+        target_update_interval = self.target_update_interval
+        soft_target = self.target_tau < 1.0
+
+        if self.verbose:
+            print(f"Starting training: {n_epoch} epochs, initial max {max_steps} steps")
+            print(f"Model: {model_name} | Epsilon: {self.epsilon:.3f} → {self.min_epsilon:.3f}")
+            print("ESC key or Ctrl+C: stop training, save model, return to menu.")
+
+        # Instrumentation
+        callbacks = list(callbacks or [])
+        if metrics_log:
+            callbacks.append(JsonlMetricsSink(metrics_log))
+        timer = self.timer = PhaseTimer() if callbacks else NULL_TIMER
+        for callback in callbacks:
+            callback.on_train_begin({
+                "model": model_name, "n_epoch": n_epoch, "start_epoch": start_epoch,
+                "max_steps": max_steps,
+                "epsilon": self.epsilon, "epsilon_decay": self.epsilon_decay,
+                "min_epsilon": self.min_epsilon, "lr": self.lr,
+                "batch_size": batch_size, "train_repeats": train_repeats,
+                "target_update_interval": target_update_interval,
+                "n_envs": self.n_envs, "inference": self.inference,
+                "distance": self.qmaze.distance, "view_radius": self.qmaze.view_radius,
+                "maze_shape": list(self.qmaze.maze.shape),
+                "start": list(self.qmaze.start), "target": list(self.qmaze.target),
+                "eval_interval": eval_interval, "eval_cells": eval_cells,
+                "replay_backend": type(self.exp).__name__,
+            })
+
+        global_start = datetime.datetime.now() - datetime.timedelta(seconds=elapsed_before)
 
         # ===============================
         #        TRAINING LOOP
         # ===============================
-        for epoch in range(n_epoch):
-
-            total_reward = 0.0
-            loss = 0.0
-            steps = 0
-
-            # Reset environment at start of each episode
-            self.qmaze.reset()
-            envstate = self.qmaze.observe()
-            status = "playing"
-            done = False
-
-            # -------------
-            # PLAY EPISODE
-            # -------------
-            for t in range(max_steps):
-                steps += 1
-
-                prev_state = envstate.copy()
-                prev_row, prev_col = self.qmaze.state
-                valid_actions = self.qmaze.valid_actions()
+        try:
+            for epoch in range(start_epoch, n_epoch):
+
+                epoch_start = time.perf_counter()
 
-                # Epsilon-greedy exploration
-                if random.random() < self.epsilon:
-                    action = random.choice(valid_actions)
+                # -------------
+                # PLAY EPISODE
+                # -------------
+                if self.venv is None:
+                    won, steps, total_reward = self._play_episode(max_steps)
+                    win_history.append(1 if won else 0)
+                    total_steps += steps
+                    epoch_steps, epoch_wins = steps, int(won)
+                    result_text = "WIN" if won else "TIMEOUT"
                 else:
-                    # Predict Q-values and mask invalid actions
-                    qs = self.model.predict(prev_state.reshape(1, -1), verbose=0)[0]
-                    masked = np.full_like(qs, -np.inf)
-                    for a in valid_actions:
-                        masked[a] = qs[a]
-                    action = int(np.argmax(masked))
-
-                # Apply action to environment
-                next_state, reward, status = self.qmaze.act(action, prev_row, prev_col)
-                total_reward += reward
-                done = (status == "win") or (t == max_steps - 1)
+                    wins, ep_steps, ep_rewards = self._play_episodes_batched(max_steps)
+                    win_history.extend(int(w) for w in wins)
+                    total_steps += int(ep_steps.sum())
+                    epoch_steps, epoch_wins = int(ep_steps.sum()), int(wins.sum())
+                    steps = int(round(ep_steps.mean()))
+                    total_reward = float(ep_rewards.mean())
+                    result_text = f"{int(wins.sum())}/{self.n_envs} WIN"
 
-                # Store experience for replay
-                self.exp.remember((prev_state, action, reward, next_state, done))
-                envstate = next_state
+                # --------------------------
+                #      TRAIN THE MODEL
+                # --------------------------
+                loss = self._replay_updates(train_repeats, batch_size)
+
+                # Epsilon decay (less exploration over time)
+                self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
+
+                # Periodically sync target network
+                if not soft_target and epoch % target_update_interval == 0:
+                    with timer.phase("target_sync"):
+                        self.update_target_model()
+
+                # Compute win-rate over last 50 episodes
+                if len(win_history) >= 50:
+                    win_rate = np.mean(win_history[-50:])
+                else:
+                    win_rate = np.mean(win_history)
+
+                # Greedy whole-maze evaluation
+                evaluated = bool(eval_interval) and (epoch + 1) % eval_interval == 0
+                if evaluated:
+                    with timer.phase("evaluation"):
+                        eval_win_rate = self.evaluate(max_steps=max_steps, n_cells=eval_cells)["win_rate"]
+
+                # Logging
+                now = datetime.datetime.now()
+                elapsed = now - global_start
+                elapsed_seconds = int(elapsed.total_seconds())
+                mins = elapsed_seconds // 60
+                secs = elapsed_seconds % 60
+
+                if self.verbose:
+                    print(
+                        f"Epoch {epoch:03d} | "
+                        f"{result_text} | "
+                        f"Steps: {steps:3d}/{max_steps} | "
+                        f"Reward: {total_reward:7.2f} | "
+                        f"Loss: {loss:0.4f} | "
+                        f"Win Rate: {win_rate:0.3f} | "
+                        f"ε: {self.epsilon:0.3f} | "
+                        + (f"Eval: {eval_win_rate:0.3f} | " if evaluated else "")
+                        + f"{mins}m {secs:02d}s",
+                        flush=True
+                    )
 
-                if done:
+                # ----------------------------
+                #   EARLY STOPPING CONDITION
+                # ----------------------------
+                if eval_interval:
+                    converged = evaluated and eval_win_rate >= 0.95
+                else:
+                    converged = win_rate >= 0.95 and epoch > 50
+                if converged and self.verbose:
+                    rate = eval_win_rate if eval_interval else win_rate
+                    print(f"\nWin-rate target reached! ({rate:.3f}). Saving model.\n")
+
+                # ESC or Ctrl+C: stop at this epoch boundary
+                stopped = self._stop_requested()
+                if stopped and self.verbose:
+                    print("\nTraining stopped. Saving model.\n")
+                last_epoch = converged or stopped or epoch == n_epoch - 1
+
+                # Save model at early stop or end of training
+                if save_model and last_epoch:
+                    with timer.phase("checkpoint"):
+                        self.save_model(model_name, epochs=epoch + 1, win_rate=float(win_rate),
+                                        eval_win_rate=eval_win_rate, converged=bool(converged))
+
+                # Full checkpoint, written in the background
+                if writer is not None and (last_epoch or (epoch + 1) % checkpoint_interval == 0):
+                    with timer.phase("checkpoint"):
+                        writer.submit(checkpoint_path, *self._checkpoint_state(
+                            epoch + 1, win_history, total_steps, global_start))
+
+                if callbacks:
+                    epoch_sec = time.perf_counter() - epoch_start
+                    phases = timer.reset()
+                    phases["other"] = max(0.0, epoch_sec - sum(phases.values()))
+                    epoch_record = {
+                        "epoch": epoch,
+                        "episodes": self.n_envs if self.venv is not None else 1,
+                        "wins": epoch_wins,
+                        "steps": epoch_steps,
+                        "reward": float(total_reward),
+                        "loss": float(loss),
+                        "win_rate": float(win_rate),
+                        "eval_win_rate": eval_win_rate if evaluated else None,
+                        "epsilon": float(self.epsilon),
+                        "epoch_sec": epoch_sec,
+                        "elapsed_sec": elapsed.total_seconds(),
+                        "phases": phases,
+                    }
+                    for callback in callbacks:
+                        callback.on_epoch_end(epoch_record)
+
+                if converged or stopped:
                     break
 
-            # Record win/loss
-            win_history.append(1 if status == "win" else 0)
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+            if writer is not None:
+                writer.close()
+            if self.exp.recorder is not None:
+                self.exp.recorder.close()
+                self.exp.recorder = None
 
-            # --------------------------
-            #      TRAIN THE MODEL
-            # --------------------------
-            for _ in range(train_repeats):
-                X, y = self.exp.get_data(self.model, self.target_model, batch_size=batch_size)
+        if not converged and not stopped and self.verbose:
+            print("Training complete.")
+
+        summary = self._summary(epoch + 1, win_rate, global_start,
+                                converged=converged, total_steps=total_steps)
+        if eval_interval:
+            summary["eval_win_rate"] = eval_win_rate
+        for callback in callbacks:
+            callback.on_train_end(summary)
+        self.timer = NULL_TIMER
+        return summary
+
+    def _replay_updates(self, repeats, batch_size):
+        """
+        Up to repeats gradient steps on replay minibatches (fewer while the
+        memory holds less than a batch), with Polyak target updates when
+        target_tau < 1.
+
+        Returns:
+            float: Loss of the last step, 0.0 if none was taken.
+        """
+        timer = self.timer
+        loss = 0.0
+        for _ in range(repeats):
+            if self._update is None:
+                with timer.phase("replay_sample"):
+                    X, y, weights = self.exp.get_batch(self.policy, self.target_policy, batch_size=batch_size)
                 if len(X) == 0:
                     break
-                loss = self.model.train_on_batch(X, y)
+                with timer.phase("gradient_step"):
+                    loss = self.model.train_on_batch(X, y, sample_weight=weights)
+                    self._sync_policy()
+            else:
+                # Sampling and the whole update; targets come from the graph
+                with timer.phase("gradient_step"):
+                    step_loss = self.exp.train_step(self._update, batch_size)
+                if step_loss is None:
+                    break
+                loss = step_loss
 
-            # Epsilon decay (less exploration over time)
-            self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
+            if self.target_tau < 1.0:
+                with timer.phase("target_sync"):
+                    self.update_target_model(self.target_tau)
 
-            # Periodically sync target network
-            if epoch % target_update_interval == 0:
-                self.update_target_model()
+        # The compiled path only needs the acting copy refreshed once
+        if self._update is not None:
+            with timer.phase("gradient_step"):
+                self._sync_policy()
+                loss = float(loss)
+        return loss
 
-            # Compute win-rate over last 50 episodes
-            if len(win_history) >= 50:
-                win_rate = np.mean(win_history[-50:])
-            else:
-                win_rate = np.mean(win_history)
-
-            # Logging
-            now = datetime.datetime.now()
-            elapsed = now - global_start
-            elapsed_seconds = int(elapsed.total_seconds())
-            mins = elapsed_seconds // 60
-            secs = elapsed_seconds % 60
-
-            print(
-                f"Epoch {epoch:03d} | "
-                f"{'WIN' if status == 'win' else 'TIMEOUT'} | "
-                f"Steps: {steps:3d}/{max_steps} | "
-                f"Reward: {total_reward:7.2f} | "
-                f"Loss: {loss:0.4f} | "
-                f"Win Rate: {win_rate:0.3f} | "
-                f"ε: {self.epsilon:0.3f} | "
-                f"{mins}m {secs:02d}s",
-                flush=True
-            )
-
-            # ----------------------------
-            #   EARLY STOPPING CONDITION
-            # ----------------------------
-            if win_rate >= 0.95 and epoch > 50:
-                print(f"\nWin-rate target reached! ({win_rate:.3f}). Saving model.\n")
-                os.makedirs("saved_models", exist_ok=True)
-                self.model.save(os.path.join("saved_models", f"{model_name}.keras"))
-                return
-
-        # Save model at end of training
-        os.makedirs("saved_models", exist_ok=True)
-        self.model.save(os.path.join("saved_models", f"{model_name}.keras"))
-        print("Training complete.")
-
-    def play(self, start_cell=(0, 0), max_steps=300, render=True):
+    def _install_stop_handler(self):
+        """
+        Turn Ctrl+C during training into a stop request, honoured at the end
+        of the current epoch so the saved model and checkpoint are
+        consistent. A second Ctrl+C interrupts immediately.
+
+        Returns the previous SIGINT handler, or None outside the main thread.
+        """
+        self._stop = False
+
+        def request_stop(signum, frame):
+            if self._stop:
+                raise KeyboardInterrupt
+            self._stop = True
+
+        try:
+            return signal.signal(signal.SIGINT, request_stop)
+        except ValueError:
+            return None
+
+    def _stop_requested(self):
+        """
+        True after Ctrl+C, or when ESC has been pressed (Windows consoles).
+        """
+        if _HAS_MSVCRT and msvcrt.kbhit() and msvcrt.getch() == b"\x1b":
+            self._stop = True
+        return self._stop
+
+    @staticmethod
+    def checkpoint_path(model_name):
+        return os.path.join("saved_models", f"{model_name}.ckpt.npz")
+
+    def _checkpoint_state(self, next_epoch, win_history, total_steps, global_start):
+        """
+        Snapshot everything needed to resume training at next_epoch.
+
+        Returns:
+            (arrays, meta) for CheckpointWriter.submit; the arrays are
+            copies, so training can continue while they are written.
+        """
+        arrays = {}
+        weight_groups = (
+            ("model", self.model.get_weights()),
+            ("target", self.target_model.get_weights()),
+            ("optimizer", [np.array(v) for v in self.model.optimizer.variables]),
+        )
+        for prefix, weights in weight_groups:
+            for i, w in enumerate(weights):
+                arrays[f"{prefix}/{i}"] = w
+        for key, value in self.exp.state_dict().items():
+            arrays[f"replay/{key}"] = value
+
+        np_state = np.random.get_state()
+        arrays["rng/numpy_keys"] = np_state[1]
+        arrays["win_history"] = np.array(win_history, dtype=np.int8)
+
+        py_version, py_state, py_gauss = random.getstate()
+        meta = {
+            "epoch": next_epoch,
+            "epsilon": self.epsilon,
+            "total_steps": total_steps,
+            "elapsed_sec": (datetime.datetime.now() - global_start).total_seconds(),
+            "replay_backend": type(self.exp).__name__,
+            "python_random": [py_version, list(py_state), py_gauss],
+            "numpy_random": [np_state[0], int(np_state[2]), int(np_state[3]), float(np_state[4])],
+        }
+        return arrays, meta
+
+    def _restore_checkpoint(self, path):
+        """
+        Load a checkpoint into the freshly built networks, the replay memory
+        and the random number generators.
+
+        Returns:
+            (next_epoch, win_history, total_steps, elapsed_sec)
+        """
+        arrays, meta = load_checkpoint(path)
+        if meta["replay_backend"] != type(self.exp).__name__:
+            raise ValueError(f"Checkpoint uses replay backend {meta['replay_backend']}, "
+                             f"this trainer uses {type(self.exp).__name__}")
+
+        def ordered(prefix):
+            weights = group(arrays, prefix)
+            return [weights[str(i)] for i in range(len(weights))]
+
+        self.model.set_weights(ordered("model"))
+        self.target_model.set_weights(ordered("target"))
+
+        optimizer = self.model.optimizer
+        if not optimizer.built:
+            optimizer.build(self.model.trainable_variables)
+        for variable, value in zip(optimizer.variables, ordered("optimizer")):
+            variable.assign(value)
+
+        self.exp.load_state_dict(group(arrays, "replay"))
+        self.epsilon = meta["epsilon"]
+        self._attach_inference()
+
+        py_version, py_state, py_gauss = meta["python_random"]
+        random.setstate((py_version, tuple(py_state), py_gauss))
+        name, pos, has_gauss, cached_gaussian = meta["numpy_random"]
+        np.random.set_state((name, arrays["rng/numpy_keys"], pos, has_gauss, cached_gaussian))
+
+        return (meta["epoch"], arrays["win_history"].tolist(),
+                meta["total_steps"], meta["elapsed_sec"])
+
+    def _play_episode(self, max_steps):
+        """
+        Play one epsilon-greedy episode, storing every transition.
+
+        Returns:
+            (won, steps, total_reward)
+        """
+        timer = self.timer
+        total_reward = 0.0
+        steps = 0
+
+        # Reset environment at start of each episode
+        self.qmaze.reset()
+        envstate = self.qmaze.observe()
+        status = "playing"
+        done = False
+
+        for t in range(max_steps):
+            steps += 1
+
+            prev_state = envstate.copy()
+            prev_row, prev_col = self.qmaze.state
+
+            with timer.phase("action_selection"):
+                valid_actions = self.qmaze.valid_actions()
+                action = self.select_action(prev_state, valid_actions)
+
+            # Apply action to environment
+            with timer.phase("env_step"):
+                next_state, reward, status = self.qmaze.act(action, prev_row, prev_col)
+            total_reward += reward
+            done = (status == "win") or (t == max_steps - 1)
+
+            # Store experience for replay
+            with timer.phase("replay_insert"):
+                self.exp.remember((prev_state, action, reward, next_state, done))
+            envstate = next_state
+
+            if done:
+                break
+
+        return status == "win", steps, total_reward
+
+    def _play_episodes_batched(self, max_steps):
+        """
+        Play n_envs epsilon-greedy episodes at once in the vector maze.
+
+        Returns:
+            (wins, steps, total_rewards): one entry per episode.
+        """
+        venv = self.venv
+        timer = self.timer
+        envstate = venv.reset()
+        steps = np.zeros(self.n_envs, dtype=np.int64)
+        total_rewards = np.zeros(self.n_envs)
+
+        for t in range(max_steps):
+            active = venv.status == PLAYING
+            if not active.any():
+                break
+
+            with timer.phase("action_selection"):
+                # Random valid action per agent: argmax of noise over the mask
+                mask = venv.valid_action_mask()
+                actions = np.argmax(np.random.random(mask.shape) * mask, axis=1)
+
+                # One batched forward pass for every agent that exploits
+                exploit = np.random.random(self.n_envs) >= self.epsilon
+                if exploit.any():
+                    qs = self.q_values(envstate)
+                    greedy = np.argmax(np.where(mask, qs, -np.inf), axis=1)
+                    actions = np.where(exploit, greedy, actions)
+
+            with timer.phase("env_step"):
+                next_state, rewards, status = venv.act(actions)
+            done = (status == WIN) | (t == max_steps - 1)
+
+            with timer.phase("replay_insert"):
+                for i in np.flatnonzero(active):
+                    self.exp.remember((envstate[i], actions[i], rewards[i], next_state[i], done[i]),
+                                      stream=i)
+
+            steps += active
+            total_rewards += rewards
+            envstate = next_state
+
+        return venv.status == WIN, steps, total_rewards
+
+    def save_model(self, model_name, environment=None, **training):
+        """
+        Save the Q-network through the registry, indexed with the maze,
+        environment and hyperparameters plus the given training results
+        (epochs, win_rate, ...). environment replaces the description of
+        self.qmaze for models not tied to one maze.
+        """
+        if environment is None:
+            environment = self._environment_info()
+        self.registry.save(
+            model_name, self.model,
+            **environment,
+            hyperparameters={
+                "lr": self.lr,
+                "epsilon_decay": self.epsilon_decay,
+                "min_epsilon": self.min_epsilon,
+                "batch_size": self.batch_size,
+                "train_repeats": self.train_repeats,
+                "target_update_interval": self.target_update_interval,
+                "target_tau": self.target_tau,
+                "discount": self.exp.discount,
+                "n_step": self.exp.n_step,
+                "max_memory": self.exp.max_memory,
+                "replay_backend": self.replay_backend,
+                "n_envs": self.n_envs,
+                "update_step": self.update_step,
+            },
+            **training)
+
+    def _environment_info(self):
+        """
+        The maze and observation settings a model or dataset belongs to.
+        """
+        q = self.qmaze
+        return {
+            "maze_hash": maze_hash(q.maze),
+            "maze_shape": list(q.maze.shape),
+            "start": list(q.start),
+            "target": list(q.target),
+            "distance": q.distance,
+            "view_radius": q.view_radius,
+            "obs_size": q.obs_size,
+        }
+
+    def train_offline(self, dataset, passes=1, max_grad_steps=None, model_name="offline",
+                      save_model=True, eval_interval=1000, eval_cells=None, max_steps=300):
+        """
+        Train fresh networks on a recorded trajectory dataset, with no
+        environment interaction except the greedy evaluations.
+
+        Minibatches stream from disk through TrajectoryDataset.batches(),
+        so memory stays bounded whatever the dataset size. The update step,
+        batch size, target sync schedule (every train_repeats *
+        target_update_interval gradient steps, or Polyak averaging) and
+        discount are the trainer's own.
+
+        Parameters:
+            dataset (str or TrajectoryDataset): Recorded dataset.
+            passes (int): Passes over the dataset.
+            max_grad_steps (int): Stop after this many gradient steps.
+            eval_interval (int): Gradient steps between evaluate() runs;
+                training stops once 95% of start cells reach the treasure.
+                None evaluates only at the end.
+            eval_cells (int): Start cells sampled per evaluation.
+
+        Returns:
+            dict: gradient steps, transitions trained on, seconds, gradient
+            steps per second, last evaluation win rate and whether it
+            reached 95%.
+        """
+        if not isinstance(dataset, TrajectoryDataset):
+            dataset = TrajectoryDataset(dataset)
+        if dataset.obs_size != self.qmaze.obs_size:
+            raise ValueError(f"Dataset observations have {dataset.obs_size} features, this "
+                             f"maze produces {self.qmaze.obs_size}.")
+        if self.exp.n_step != 1:
+            raise ValueError("Recorded datasets hold 1-step transitions; use n_step=1.")
+        if dataset.meta.get("maze_hash", maze_hash(self.qmaze.maze)) != maze_hash(self.qmaze.maze):
+            print(f"Note: dataset {dataset.directory} was recorded on a different maze.")
+
+        self._build_networks()
+        self.update_target_model()
+        self._attach_update()
+
+        sync_every = self.train_repeats * self.target_update_interval
+        soft_target = self.target_tau < 1.0
+        grad_steps = 0
+        transitions = 0
+        loss = 0.0
+        eval_win_rate = None
+        converged = False
+
+        if self.verbose:
+            print(f"Starting offline training: {len(dataset)} transitions in "
+                  f"{dataset.num_chunks} chunks, {passes} pass(es)")
+
+        global_start = datetime.datetime.now()
+        start_time = time.perf_counter()
+        previous_handler = self._install_stop_handler()
+        try:
+            # Full batches only: a new batch shape would recompile the update
+            for batch in dataset.batches(self.batch_size, passes=passes, drop_last=True):
+                if self._update is None:
+                    y, _ = self.exp.compute_targets(self.policy, self.target_policy, batch)
+                    loss = self.model.train_on_batch(batch[0], y)
+                    self._sync_policy()
+                else:
+                    loss, _ = self._update(*batch)
+                grad_steps += 1
+                transitions += len(batch[1])
+
+                if soft_target:
+                    self.update_target_model(self.target_tau)
+                elif grad_steps % sync_every == 0:
+                    self.update_target_model()
+
+                last_step = max_grad_steps is not None and grad_steps >= max_grad_steps
+                stopped = self._stop_requested()
+                if eval_interval and grad_steps % eval_interval == 0 or last_step or stopped:
+                    if self._update is not None:
+                        self._sync_policy()
+                    eval_win_rate = self.evaluate(max_steps=max_steps, n_cells=eval_cells)["win_rate"]
+                    converged = eval_win_rate >= 0.95
+                    if self.verbose:
+                        elapsed = time.perf_counter() - start_time
+                        print(f"Step {grad_steps:7d} | Loss: {float(loss):0.4f} | "
+                              f"Eval: {eval_win_rate:0.3f} | "
+                              f"{grad_steps / elapsed:6.0f} steps/s | {elapsed:6.1f}s", flush=True)
+                    if converged or last_step or stopped:
+                        break
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+
+        if self._update is not None:
+            self._sync_policy()
+        if eval_win_rate is None:
+            eval_win_rate = self.evaluate(max_steps=max_steps, n_cells=eval_cells)["win_rate"]
+            converged = eval_win_rate >= 0.95
+        if save_model:
+            self.save_model(model_name, gradient_steps=grad_steps, dataset=dataset.directory,
+                            dataset_transitions=len(dataset), eval_win_rate=eval_win_rate,
+                            converged=bool(converged))
+
+        seconds = (datetime.datetime.now() - global_start).total_seconds()
+        return {
+            "grad_steps": grad_steps,
+            "transitions": transitions,
+            "seconds": seconds,
+            "grad_steps_per_sec": grad_steps / seconds if seconds else 0.0,
+            "eval_win_rate": eval_win_rate,
+            "converged": bool(converged),
+        }
+
+    @staticmethod
+    def _summary(epochs, win_rate, start_time, converged, total_steps=0):
+        seconds = (datetime.datetime.now() - start_time).total_seconds()
+        return {
+            "epochs": epochs,
+            "win_rate": float(win_rate),
+            "seconds": seconds,
+            "converged": converged,
+            "steps_per_sec": total_steps / seconds if seconds > 0 else 0.0,
+        }
+
+    def play(self, start_cell=None, max_steps=300, render=True, save=None):
         """
         Runs the loaded model in the maze without training.
         Collects the path and renders only ONE final image.
+
+        save writes the episode to a file without opening a window: a .gif
+        animation or a .png of the final frame (see maze_render).
+
+        Returns:
+            list: Cells visited, start first.
         """
 
         if self.model is None:
@@ -244,7 +933,7 @@ class TreasureHuntTrainer:
         envstate = self.qmaze.observe()
 
         print("\n=== PLAYING USING TRAINED MODEL ===")
-        print(f"Start: {start_cell} | Target: {self.qmaze.target}")
+        print(f"Start: {self.qmaze.state} | Target: {self.qmaze.target}")
         print("-----------------------------------")
 
         path = [self.qmaze.state]  # collect positions
@@ -252,16 +941,8 @@ class TreasureHuntTrainer:
         for step in range(max_steps):
             row, col = self.qmaze.state
 
-            # Predict Q-values
-            qs = self.model.predict(envstate.reshape(1, -1), verbose=0)[0]
-
-            # Mask invalid actions
-            valid_actions = self.qmaze.valid_actions()
-            masked = np.full_like(qs, -np.inf)
-            for a in valid_actions:
-                masked[a] = qs[a]
-
-            action = int(np.argmax(masked))
+            # Greedy action among valid moves
+            action = self.select_action(envstate, self.qmaze.valid_actions(), epsilon=0.0)
 
             # Apply action
             prev_row, prev_col = row, col
@@ -282,23 +963,142 @@ class TreasureHuntTrainer:
         # Render only ONCE with full path
         if render:
             self.qmaze.show(path=path)
+        if save:
+            q = self.qmaze
+            MazeRenderer(q.maze, q.start, q.target).save(save, path)
+            print(f"Episode written to {save}")
+        return path
+
+    def evaluate(self, start_cells=None, max_steps=300, n_cells=None, paths=False):
+        """
+        Greedy rollouts of the current model from many start cells at once.
+
+        All rollouts run side by side in a VectorTreasureMaze, with one
+        batched forward pass per step over the agents still playing. Each is
+        scored against the exact solution of the maze: a cell counts as
+        optimal when the agent wins in the shortest possible number of
+        steps, and policy_agreement is the fraction of start cells whose
+        first greedy action is a shortest-path action.
+
+        Parameters:
+            start_cells (list): Cells to start from (default: every free cell
+                with a path to the target, except the target itself).
+            max_steps (int): Step limit per rollout.
+            n_cells (int): Evaluate a random sample of this many start cells,
+                to bound the cost on large mazes.
+            paths (bool): Also record every rollout's cells.
+
+        Returns:
+            dict: win rate, win and episode counts, optimal rate, mean ratio
+            of path length to shortest path over won cells, policy agreement,
+            and per-cell {cell: (won, steps, shortest)} results; with paths,
+            also {cell: [cells visited, start first]} under "paths".
+        """
+        solution = self.qmaze.solution()
+        if start_cells is None:
+            start_cells = [c for c in self.qmaze.free_cells if solution.distance[c] > 0]
+        if n_cells is not None and n_cells < len(start_cells):
+            start_cells = random.sample(start_cells, n_cells)
+
+        n = len(start_cells)
+        if n == 0:
+            empty = {"win_rate": 0.0, "wins": 0, "episodes": 0, "optimal_rate": 0.0,
+                     "path_ratio": 0.0, "policy_agreement": 0.0, "cells": {}}
+            if paths:
+                empty["paths"] = {}
+            return empty
+
+        starts = np.array(start_cells, dtype=np.int64).reshape(n, 2)
+        venv = self._vector_env(n, track_visits=False)
+        envstate = venv.reset(starts=starts)
+        steps = np.full(n, max_steps, dtype=np.int64)
+        actions = np.zeros(n, dtype=np.int64)
+        # -1 until a cell's first greedy action is taken
+        first_actions = np.full(n, -1, dtype=np.int64)
+        trace = None
+        if paths:
+            trace = np.empty((max_steps + 1, n, 2), dtype=np.int32)
+            trace[0] = venv.positions
+
+        for t in range(max_steps):
+            active = np.flatnonzero(venv.status == PLAYING)
+            if len(active) == 0:
+                break
+
+            # Greedy action among valid moves, for playing agents only
+            mask = venv.valid_action_mask()[active]
+            qs = self.q_values(envstate[active])
+            actions[active] = np.argmax(np.where(mask, qs, -np.inf), axis=1)
+            if t == 0:
+                first_actions[active] = actions[active]
+
+            envstate, _, status = venv.act(actions)
+            steps[active[status[active] == WIN]] = t + 1
+            if trace is not None:
+                trace[t + 1] = venv.positions
+
+        won = venv.status == WIN
+        rows, cols = starts.T
+        shortest = solution.distance[rows, cols]
+        optimal = won & (steps == shortest)
+        # Cells that never moved (max_steps=0) count as disagreeing
+        moved = first_actions >= 0
+        agreement = moved & solution.optimal[rows, cols, np.maximum(first_actions, 0)]
+
+        result = {
+            "win_rate": float(won.mean()),
+            "wins": int(won.sum()),
+            "episodes": n,
+            "optimal_rate": float(optimal.mean()),
+            "path_ratio": float(np.mean(steps[won] / shortest[won])) if won.any() else 0.0,
+            "policy_agreement": float(np.mean(agreement)),
+            "cells": {
+                (r, c): (bool(w), int(k), int(d))
+                for r, c, w, k, d in zip(rows.tolist(), cols.tolist(), won.tolist(),
+                                         steps.tolist(), shortest.tolist())
+            },
+        }
+        if trace is not None:
+            result["paths"] = {
+                (r, c): [tuple(cell) for cell in trace[:k + 1, i].tolist()]
+                for i, (r, c, k) in enumerate(zip(rows.tolist(), cols.tolist(), steps.tolist()))
+            }
+        return result
 
     def load_model(self, name):
         """
         Load a saved model and create a matching target network.
-        """
-        path = os.path.join("saved_models", f"{name}.keras")
 
-        if not os.path.exists(path):
-            print(f"Model not found: {path}")
+        The model comes from the registry's cache when it has been loaded
+        before, and the target network is an in-memory clone of it cached
+        alongside, so switching between models does not read the disk again.
+        Both are shared with the cache; train() builds fresh networks.
+        """
+        if name not in self.registry:
+            print(f"Model not found: {self.registry.path(name)}")
             return False
 
         try:
-            self.model = load_model(path)
-            self.target_model = load_model(path)
-            print(f"Loaded model '{name}' successfully.")
-            return True
-
+            model = self.registry.load(name)
         except Exception as e:
             print(f"Failed to load model: {e}")
             return False
+
+        # A model only runs on observations of the size it was trained with
+        obs_size = model.input_shape[-1]
+        if obs_size != self.qmaze.obs_size:
+            print(f"Model '{name}' takes {obs_size} observation features, this maze "
+                  f"produces {self.qmaze.obs_size}; check the view radius it was trained with.")
+            return False
+
+        info = self.registry.info(name)
+        if info.get("maze_hash", maze_hash(self.qmaze.maze)) != maze_hash(self.qmaze.maze):
+            print(f"Note: model '{name}' was trained on a different maze.")
+        if info.get("distance", self.qmaze.distance) != self.qmaze.distance:
+            print(f"Note: model '{name}' was trained with {info['distance']} distance.")
+
+        self.model = model
+        self.target_model = self.registry.load_target(name)
+        self._attach_inference()
+        print(f"Loaded model '{name}' successfully.")
+        return True